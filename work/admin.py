@@ -3,6 +3,8 @@ from .models import Company
 from .models import Manager
 from .models import Work, WorkPlace, WorkTime
 from .models import Worker
+from .models import PunchEvent
+from .models import StaffingRequirement, PlannedShift
 
 
 admin.site.register(Company)
@@ -11,3 +13,6 @@ admin.site.register(Work)
 admin.site.register(WorkPlace)
 admin.site.register(WorkTime)
 admin.site.register(Worker)
+admin.site.register(PunchEvent)
+admin.site.register(StaffingRequirement)
+admin.site.register(PlannedShift)
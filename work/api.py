@@ -0,0 +1,196 @@
+"""
+Read-only JSON API over companies, workers, workplaces and worktimes.
+
+Lists are paginated with an id cursor (``after``, ``limit``), support
+sparse field selection (``fields``) and filtering. The ETag comes from
+model change times kept in the cache, so unchanged lists are answered
+with 304 without querying the models. No Last-Modified is sent, its
+one-second precision would hide changes made in the same second.
+Change times recorded by other processes are only seen through a
+shared cache, with a process-local one lists are always sent in full.
+With sharding on, pages are read from every shard and merged by id.
+"""
+import datetime
+import hashlib
+import heapq
+
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from . import caching, sharding
+from .models import Company, Work, Worker, WorkPlace, WorkTime
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+class Resource:
+    """
+    Describing an API list: its queryset, fields, filters and the models
+    it depends on
+    """
+    def __init__(self, model, fields, filters, depends_on=(),
+                 login_required=False, distinct=False):
+        self.model = model
+        self.distinct = distinct
+        self.fields = fields
+        self.filters = filters
+        self.models = (model,) + tuple(depends_on)
+        self.login_required = login_required
+
+
+RESOURCES = {
+    'companies': Resource(
+        Company,
+        fields={'id': 'id', 'name': 'name'},
+        filters={}),
+    'workers': Resource(
+        Worker,
+        fields={
+            'id': 'id', 'first_name': 'first_name',
+            'last_name': 'last_name'},
+        filters={
+            'company': ('workplaces__work__company_id', int),
+            'status': ('workplaces__status', int)},
+        depends_on=(WorkPlace, Work),
+        distinct=True),
+    'workplaces': Resource(
+        WorkPlace,
+        fields={
+            'id': 'id', 'status': 'status', 'week_limit': 'week_limit',
+            'work': 'work_id', 'worker': 'worker_id',
+            'manager': 'manager_id', 'company': 'work__company_id'},
+        filters={
+            'company': ('work__company_id', int),
+            'status': ('status', int)},
+        depends_on=(Work,),
+        login_required=True),
+    'worktimes': Resource(
+        WorkTime,
+        fields={
+            'id': 'id', 'date': 'date', 'time_start': 'time_start',
+            'time_end': 'time_end', 'status': 'status',
+            'worker': 'worker_id', 'workplace': 'workplace_id',
+            'company': 'workplace__work__company_id'},
+        filters={
+            'company': ('workplace__work__company_id', int),
+            'status': ('status', int),
+            'from': ('date__gte', parse_date),
+            'to': ('date__lte', parse_date)},
+        depends_on=(WorkPlace, Work),
+        login_required=True),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def resource_etag(request, resource):
+    if not caching.is_shared():
+        return None
+    version = caching.last_change(RESOURCES[resource].models)
+    key = f'{resource}:{version}:{request.GET.urlencode()}'
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def parse_params(params, resource):
+    names = params.get('fields')
+    if names:
+        names = names.split(',')
+        unknown = set(names) - set(resource.fields)
+        if unknown:
+            raise BadRequest(f'Unknown fields: {", ".join(sorted(unknown))}')
+    else:
+        names = list(resource.fields)
+
+    filters = {}
+    for param, (lookup, convert) in resource.filters.items():
+        if param in params:
+            try:
+                filters[lookup] = convert(params[param])
+            except ValueError:
+                raise BadRequest(f'Incorrect {param} value.')
+
+    try:
+        after = int(params.get('after', 0))
+        limit = min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise BadRequest('Incorrect cursor value.')
+    if limit < 1:
+        raise BadRequest('Incorrect limit value.')
+
+    return names, filters, after, limit
+
+
+def serialize(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def page_rows(spec, paths, filters, after, size):
+    """
+    Return up to size rows with ids greater than after, ordered by id.
+    Workers are copied to every shard, so their rows are deduplicated.
+    """
+    aliases = sharding.shards() if sharding.enabled() else [None]
+    pages = []
+    for alias in aliases:
+        queryset = spec.model.objects.using(alias).filter(
+            id__gt=after, **filters).order_by('id')
+        if spec.distinct and filters:
+            queryset = queryset.distinct()
+        pages.append(list(queryset.values_list(*paths)[:size]))
+
+    rows = []
+    for row in heapq.merge(*pages, key=lambda row: row[-1]):
+        if not rows or rows[-1][-1] != row[-1]:
+            rows.append(row)
+    return rows[:size]
+
+
+@require_GET
+@condition(etag_func=resource_etag)
+def resource_list(request, resource):
+    spec = RESOURCES[resource]
+    try:
+        names, filters, after, limit = parse_params(request.GET, spec)
+    except BadRequest as e:
+        return error(str(e))
+
+    # The id is appended last to build the cursor of the next page
+    paths = [spec.fields[name] for name in names] + ['id']
+    rows = page_rows(spec, paths, filters, after, limit + 1)
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['after'] = rows[-1][-1]
+        next_url = f'{request.path}?{params.urlencode()}'
+
+    return JsonResponse({
+        'results': [
+            {name: serialize(value) for name, value in zip(names, row)}
+            for row in rows],
+        'next': next_url,
+    })
+
+
+def api_view(request, resource):
+    """
+    Implementing a view returning a page of an API list
+    """
+    if RESOURCES[resource].login_required and (
+            not request.user.is_authenticated):
+        return error('Authentication required.', status=401)
+    return resource_list(request, resource)
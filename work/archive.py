@@ -0,0 +1,189 @@
+"""
+Cold storage for worktimes of closed months.
+
+Each archived month is a directory of .npy files, one per column in a
+narrow dtype, read back memory-mapped. Archived rows are deleted from
+WorkTime without touching Statistics, so rollups keep counting them, and
+no worktimes can be added to archived months afterwards. With sharding
+on, the rows of every shard are archived into the same months. Months
+are kept ordered by date and id, so they are read in fixed-size slices.
+"""
+import datetime
+import os
+import shutil
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from . import caching, sharding
+from .models import WorkPlace, WorkTime, CANCELLED
+
+PREFIX = 'worktime-'
+SLICE_SIZE = 65536
+
+
+def seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+# (name, WorkTime field, dtype, converter)
+COLUMNS = (
+    ('id', 'id', np.int64, None),
+    ('date', 'date', np.int32, datetime.date.toordinal),
+    ('start', 'time_start', np.int32, seconds),
+    ('end', 'time_end', np.int32, seconds),
+    ('status', 'status', np.int8, None),
+    ('worker', 'worker_id', np.int32, None),
+    ('workplace', 'workplace_id', np.int32, None),
+)
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def next_month(date):
+    return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def month_path(month):
+    return os.path.join(settings.WORK_ARCHIVE_DIR, f'{PREFIX}{month:%Y-%m}')
+
+
+def archived_months():
+    try:
+        names = os.listdir(settings.WORK_ARCHIVE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        datetime.datetime.strptime(name[len(PREFIX):], '%Y-%m').date()
+        for name in names
+        if name.startswith(PREFIX) and '.' not in name)
+
+
+def archived_until():
+    """
+    Return the first date after the archived months, or None
+    """
+    months = archived_months()
+    return next_month(months[-1]) if months else None
+
+
+def load_month(month, mmap_mode='r'):
+    path = month_path(month)
+    return {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name, _, _, _ in COLUMNS}
+
+
+def save_month(month, columns):
+    """
+    Write columns of month to a temporary directory and swap it in
+    """
+    path = month_path(month)
+    tmp, old = f'{path}.tmp', f'{path}.old'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, _, _, _ in COLUMNS:
+        np.save(os.path.join(tmp, f'{name}.npy'), columns[name])
+
+    if os.path.isdir(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def archive_month(month):
+    """
+    Move worktimes of the month in the current shard into the archive,
+    return how many
+    """
+    month = month_start(month)
+    queryset = WorkTime.objects.filter(
+        date__gte=month, date__lt=next_month(month))
+
+    with transaction.atomic(using=queryset.db):
+        rows = list(queryset.order_by('id').values_list(
+            *(field for _, field, _, _ in COLUMNS)))
+        if not rows:
+            return 0
+
+        columns = {
+            name: np.fromiter(
+                (row[i] if convert is None else convert(row[i])
+                 for row in rows), dtype=dtype, count=len(rows))
+            for i, (name, _, dtype, convert) in enumerate(COLUMNS)}
+        if month in archived_months():
+            archived = load_month(month, mmap_mode=None)
+            columns = {
+                name: np.concatenate((archived[name], columns[name]))
+                for name in columns}
+        order = np.lexsort((columns['id'], columns['date']))
+        columns = {name: column[order] for name, column in columns.items()}
+
+        # Raw delete sends no signals, archived hours stay in Statistics
+        archived_rows = queryset.filter(id__lte=rows[-1][0])
+        archived_rows._raw_delete(archived_rows.db)
+        save_month(month, columns)
+        caching.touch(WorkTime)
+    return len(rows)
+
+
+def archive_before(date):
+    """
+    Archive every month ending before date in every shard, return
+    {month: rows}
+    """
+    archived = {}
+    for alias in sharding.shards():
+        with sharding.use_shard(alias):
+            for month in WorkTime.objects.filter(
+                    date__lt=month_start(date)).dates('date', 'month'):
+                archived[month] = archived.get(month, 0) + archive_month(month)
+    return dict(sorted(archived.items()))
+
+
+def select(date_from=None, date_to=None, worker=None, company=None,
+           cancelled=True, slice_size=SLICE_SIZE):
+    """
+    Yield (month, columns) of archived worktimes matching the filters,
+    ordered by date and id, in slices of at most slice_size rows
+    """
+    months = [
+        month for month in archived_months()
+        if not (date_from and next_month(month) <= date_from)
+        and not (date_to and month > date_to)]
+    if not months:
+        return
+
+    workplaces = None
+    if company is not None:
+        alias = sharding.shard_for_company(company)
+        workplaces = np.fromiter(WorkPlace.objects.using(alias).filter(
+            work__company_id=company).order_by().values_list(
+                'id', flat=True), np.int64)
+
+    for month in months:
+        columns = load_month(month)
+        dates = columns['date']
+        start, end = 0, len(dates)
+        if date_from:
+            start = int(np.searchsorted(dates, date_from.toordinal()))
+        if date_to:
+            end = int(np.searchsorted(dates, date_to.toordinal(), 'right'))
+
+        for offset in range(start, end, slice_size):
+            part = {
+                name: np.asarray(column[offset:min(offset + slice_size, end)])
+                for name, column in columns.items()}
+            mask = np.ones(len(part['id']), dtype=bool)
+            if worker is not None:
+                mask &= part['worker'] == worker
+            if workplaces is not None:
+                mask &= np.isin(part['workplace'], workplaces)
+            if not cancelled:
+                mask &= part['status'] != CANCELLED
+            if mask.any():
+                yield month, {
+                    name: column[mask] for name, column in part.items()}
@@ -0,0 +1,37 @@
+from django.urls import path
+from . import async_views
+
+app_name = 'work_async'
+
+urlpatterns = [
+    path(
+        'companies/',
+        async_views.comp_list,
+        name='comp_list'
+    ),
+    path(
+        'companies/<int:pk>/',
+        async_views.comp_detail,
+        name='comp_detail'
+    ),
+    path(
+        'companies/<int:pk>/managers/',
+        async_views.manag_list,
+        name='manag_list'
+    ),
+    path(
+        'workers/',
+        async_views.worker_list,
+        name='worker_list'
+    ),
+    path(
+        'workers/<int:pk>/',
+        async_views.worker_detail,
+        name='worker_detail'
+    ),
+    path(
+        'workers/<int:pk>/create_worktime',
+        async_views.create_worktime,
+        name='create_worktime'
+    ),
+]
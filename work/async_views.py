@@ -0,0 +1,129 @@
+"""
+Async versions of the read views and of worktime submission, served
+under ASGI at /async/.
+
+Database work and template rendering (which resolves request.user and
+lazy querysets) run through sync_to_async, the event loop only waits.
+Each call is self-contained, so they run on the executor's thread pool
+instead of the single thread shared by thread sensitive code, and
+requests are served concurrently.
+"""
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseNotAllowed
+from django.shortcuts import redirect, render
+
+from . import caching, queries, worktimes
+from .forms import CreateWorkTimeForm
+from .models import Company, Worker
+from .views import worker_context
+
+
+def run_async(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+
+render_async = run_async(render)
+
+
+def get_or_none(model, pk):
+    return model.objects.filter(pk=pk).first()
+
+
+async def get_or_404(model, pk):
+    obj = await run_async(get_or_none)(model, pk)
+    if obj is None:
+        raise Http404(f'No {model._meta.verbose_name} found')
+    return obj
+
+
+async def comp_list(request):
+    """
+    Implementing an async view to display companies list
+    """
+    return await render_async(request, 'work/comp_list.html', {
+            'companies': await run_async(queries.companies)(),
+            'cache_timeout': caching.fragment_timeout(),
+        })
+
+
+async def comp_detail(request, pk):
+    """
+    Implementing an async view to display company detail page
+    """
+    company = await get_or_404(Company, pk)
+    return await render_async(request, 'work/comp_detail.html', {
+            'company': company,
+            'works': partial(queries.company_roster, company),
+            'cache_timeout': caching.fragment_timeout(),
+        })
+
+
+async def manag_list(request, pk):
+    """
+    Implementing an async view to display manager's list
+    """
+    company = await get_or_404(Company, pk)
+    return await render_async(request, 'work/manag_list.html', {
+            'company': company,
+            'managers': company.managers.all(),
+            'cache_timeout': caching.fragment_timeout(),
+        })
+
+
+async def worker_list(request):
+    """
+    Implementing an async view to display worker's list
+    """
+    after = request.GET.get('after', '')
+    workers, next_cursor = await run_async(queries.workers_page)(
+        int(after) if after.isdigit() else None)
+    return await render_async(request, 'work/worker_list.html', {
+            'workers': workers,
+            'next_cursor': next_cursor,
+            'is_first_page': 'after' not in request.GET,
+        })
+
+
+def is_authenticated(request):
+    return request.user.is_authenticated
+
+
+async def worker_detail(request, pk):
+    """
+    Implementing an async view to display worker's info
+    """
+    if not await run_async(is_authenticated)(request):
+        return redirect_to_login(request.get_full_path())
+
+    worker = await get_or_404(Worker, pk)
+    context = await run_async(worker_context)(worker, request)
+    return await render_async(request, 'work/worker_detail.html', {
+            'worker': worker,
+            'form': CreateWorkTimeForm(),
+            **context
+        })
+
+
+async def create_worktime(request, pk):
+    """
+    Implementing an async view for creating worktimes
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    worker = await get_or_404(Worker, pk)
+    form = CreateWorkTimeForm(request.POST)
+
+    if form.is_valid():
+        if await run_async(worktimes.submit_worktime)(worker, form):
+            return redirect('work_async:worker_detail', pk)
+
+    context = await run_async(worker_context)(worker, request)
+    return await render_async(request, 'work/worker_detail.html', {
+            'worker': worker,
+            'form': form,
+            **context
+        })
@@ -0,0 +1,109 @@
+"""
+Cached fragments of company pages and change times of models.
+
+Templates cache their content with ``{% cache %}`` under the fragment
+names below, varied by company id. Signals and workplace transitions
+delete them whenever the underlying rows change, which other processes
+only see through a shared cache, so fragments are not cached otherwise.
+
+Change times let the API answer conditional requests without querying
+the database. They are recorded for every write of a tracked model and
+only used when the cache is shared by every process, which may write.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+
+from .models import WorkPlace, APPROVED
+
+COMPANY_FRAGMENTS = ('comp_detail', 'manag_list')
+
+# Backends whose entries other processes never see
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared():
+    """
+    Tell whether the default cache is shared by every process
+    """
+    return settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'] not in (
+        PROCESS_LOCAL_BACKENDS)
+
+
+def fragment_timeout():
+    """
+    Return the timeout of page fragments, 0 when they are not cached
+    """
+    return settings.WORK_PAGE_CACHE_TIMEOUT if is_shared() else 0
+
+
+class CachedFragmentMixin:
+    """
+    Passing the fragment cache timeout to templates
+    """
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cache_timeout'] = fragment_timeout()
+        return context
+
+
+def invalidate_companies(company_ids, comp_list=False):
+    """
+    Delete fragments of companies once the current transaction commits
+    """
+    keys = [
+        make_template_fragment_key(fragment, [company_id])
+        for company_id in set(company_ids)
+        for fragment in COMPANY_FRAGMENTS]
+    if comp_list:
+        keys.append(make_template_fragment_key('comp_list'))
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_workers(worker_ids):
+    """
+    Invalidate pages of companies where workers hold a workplace
+    """
+    invalidate_companies(WorkPlace.objects.filter(
+        worker_id__in=worker_ids).values_list(
+            'work__company_id', flat=True).distinct())
+
+
+def invalidate_worker(worker_id):
+    invalidate_companies(WorkPlace.objects.filter(
+        worker_id=worker_id, status=APPROVED).values_list(
+            'work__company_id', flat=True))
+
+
+def change_time_key(model):
+    return f'work:changed:{model._meta.label_lower}'
+
+
+def touch(*models):
+    """
+    Record models as changed once the current transaction commits
+    """
+    def record():
+        now = time.time()
+        cache.set_many({change_time_key(model): now for model in models}, None)
+    transaction.on_commit(record)
+
+
+def last_change(models):
+    """
+    Return when any of models last changed, as a UNIX timestamp
+    """
+    keys = [change_time_key(model) for model in models]
+    times = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in times}
+    if missing:
+        # Unknown after a cache flush, assume everything changed just now
+        cache.set_many(missing, None)
+        times.update(missing)
+    return max(times.values())
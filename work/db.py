@@ -0,0 +1,54 @@
+"""
+SQLite connection tuning and retries of writes on a locked database.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db import transaction
+
+from . import sharding
+
+RETRY_DELAY = 0.05
+
+
+def apply_pragmas(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.WORK_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    return 'database is locked' in str(error)
+
+
+def retry_locked(func=None, using=None, atomic=True):
+    """
+    Run func in a transaction of the given or the current shard's
+    database, retried with backoff while the database is locked. Inside
+    an outer transaction func runs once, the outermost retrying caller
+    repeats the whole transaction. Functions running a single write
+    statement can skip the transaction with atomic=False.
+    """
+    if func is None:
+        return lambda func: retry_locked(func, using, atomic)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        alias = using or sharding.current() or DEFAULT_DB_ALIAS
+        attempts = settings.WORK_DB_LOCK_RETRIES
+        for attempt in range(attempts):
+            retry = not connections[alias].in_atomic_block
+            try:
+                if not atomic:
+                    return func(*args, **kwargs)
+                with transaction.atomic(using=alias):
+                    return func(*args, **kwargs)
+            except OperationalError as e:
+                if not retry or not is_locked(e) or attempt == attempts - 1:
+                    raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+    return wrapper
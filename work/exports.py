@@ -0,0 +1,127 @@
+"""
+Streaming export of worktimes as CSV or JSONL timesheets.
+
+Archived months come first, they all precede the worktimes left in the
+database. Both are read in chunks of chunk_size rows. Worktimes of all
+shards are merged by date, or read from the company's shard only.
+"""
+import csv
+import datetime
+import heapq
+import json
+
+from . import archive, sharding
+from .models import Worker, WorkPlace, WorkTime, worked_hours
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+COLUMNS = (
+    'id', 'date', 'time_start', 'time_end', 'hours', 'status',
+    'worker', 'first_name', 'last_name', 'workplace', 'work', 'company')
+CHUNK_SIZE = 2000
+
+STATUSES = dict(WorkTime.STATUS_CHOICES)
+
+
+class Echo:
+    """
+    File-like object returning what is written, for csv.writer
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(company=None, worker=None, date_from=None, date_to=None,
+                chunk_size=CHUNK_SIZE):
+    """
+    Yield worktime rows as tuples in COLUMNS order
+    """
+    yield from archived_rows(company, worker, date_from, date_to, chunk_size)
+
+    if not sharding.enabled():
+        # Left to the router, which may pick a replica
+        aliases = [None]
+    elif company is None:
+        aliases = sharding.shards()
+    else:
+        aliases = [sharding.shard_for_company(company)]
+    yield from heapq.merge(*(
+        database_rows(alias, company, worker, date_from, date_to, chunk_size)
+        for alias in aliases), key=lambda row: (row[1], row[0]))
+
+
+def database_rows(alias, company, worker, date_from, date_to, chunk_size):
+    queryset = WorkTime.objects.using(alias).order_by('date', 'id')
+    if company is not None:
+        queryset = queryset.filter(workplace__work__company_id=company)
+    if worker is not None:
+        queryset = queryset.filter(worker_id=worker)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+
+    rows = queryset.values_list(
+        'id', 'date', 'time_start', 'time_end', 'status', 'worker_id',
+        'worker__first_name', 'worker__last_name', 'workplace_id',
+        'workplace__work__name', 'workplace__work__company__name',
+    ).iterator(chunk_size=chunk_size)
+
+    for (pk, date, time_start, time_end, status, worker_id, first_name,
+            last_name, workplace_id, work, company_name) in rows:
+        yield (
+            pk, date.isoformat(), time_start.strftime('%H:%M'),
+            time_end.strftime('%H:%M'),
+            round(worked_hours(date, time_start, time_end), 2),
+            STATUSES[status], worker_id, first_name, last_name,
+            workplace_id, work, company_name)
+
+
+def archived_rows(company=None, worker=None, date_from=None, date_to=None,
+                  chunk_size=CHUNK_SIZE):
+    for _, columns in archive.select(
+            date_from, date_to, worker, company, slice_size=chunk_size):
+        workers = {
+            pk: names for pk, *names in Worker.objects.filter(
+                id__in=set(columns['worker'].tolist())).values_list(
+                    'id', 'first_name', 'last_name')}
+        ids = set(columns['workplace'].tolist())
+        workplaces = {
+            pk: names for rows in sharding.fan_out(
+                lambda: list(WorkPlace.objects.filter(id__in=ids).values_list(
+                    'id', 'work__name', 'work__company__name')))
+            for pk, *names in rows}
+
+        for pk, date, start, end, status, worker_id, workplace_id in zip(
+                *(columns[name].tolist()
+                  for name, _, _, _ in archive.COLUMNS)):
+            if worker_id not in workers or workplace_id not in workplaces:
+                continue
+            date = datetime.date.fromordinal(date)
+            time_start = datetime.time(
+                start // 3600, start // 60 % 60, start % 60)
+            time_end = datetime.time(end // 3600, end // 60 % 60, end % 60)
+            yield (
+                pk, date.isoformat(), time_start.strftime('%H:%M'),
+                time_end.strftime('%H:%M'),
+                round(worked_hours(date, time_start, time_end), 2),
+                STATUSES[status], worker_id, *workers[worker_id],
+                workplace_id, *workplaces[workplace_id])
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row))) + '\n'
+
+
+def export_lines(fmt, rows):
+    return csv_lines(rows) if fmt == 'csv' else jsonl_lines(rows)
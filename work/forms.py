@@ -1,5 +1,60 @@
 from django import forms
-from .models import WorkTime, WorkPlace
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
+from . import sharding
+from .models import Company, Work, WorkTime, WorkPlace
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    Select rendering only the selected option, the others are fetched
+    page by page from the autocomplete view while typing. Choices of a
+    scoped select are limited to the value of the scope field.
+    """
+    class Media:
+        js = ('work/autocomplete.js',)
+
+    def __init__(self, kind, scope=None, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+        self.scope = scope
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete'] = reverse(
+            'work:autocomplete', args=[self.kind])
+        if self.scope:
+            attrs['data-scope'] = self.scope
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        selected = [pk for pk in value if str(pk).isdigit()]
+        self.choices = [('', choices.field.empty_label)] if (
+            choices.field.empty_label is not None) else []
+        if selected:
+            self.choices += map(
+                choices.choice, choices.queryset.filter(pk__in=selected))
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
+def scope_to_company(form, *fields):
+    """
+    Take the company and the objects of fields from the shard of the
+    company chosen in the form data, limit the objects to that company
+    """
+    company = form.data.get(form.add_prefix('company'), '')
+    alias = sharding.shard_for_company(company) if (
+        company.isdigit()) else DEFAULT_DB_ALIAS
+
+    form.fields['company'].queryset = Company.objects.using(alias)
+    for field in fields:
+        queryset = form.fields[field].queryset.using(alias)
+        form.fields[field].queryset = queryset.filter(
+            company_id=company) if company.isdigit() else queryset.none()
 
 
 class CreateWorkTimeForm(forms.ModelForm):
@@ -8,8 +63,9 @@ class CreateWorkTimeForm(forms.ModelForm):
         time_start = cleaned_data.get('time_start')
         time_end = cleaned_data.get('time_end')
 
+        # time_end before time_start is a shift ending after midnight
         if time_start and time_end:
-            if time_start >= time_end:
+            if time_start == time_end:
                 raise forms.ValidationError('Incorrect time values.')
 
     class Meta:
@@ -17,21 +73,36 @@ class CreateWorkTimeForm(forms.ModelForm):
         fields = ('date', 'time_start', 'time_end')
 
 
-class ChangeStatusForm(forms.ModelForm):
+class CreateWorkForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        scope_to_company(self)
+
     class Meta:
-        model = WorkPlace
-        fields = []
+        model = Work
+        fields = ('company', 'name')
+        widgets = {'company': AutocompleteSelect('company')}
 
 
 class CreateWorkPlace(forms.ModelForm):
-    def clean(self):
-        cleaned_data = super().clean()
-        manager = cleaned_data.get('manager')
-        work = cleaned_data.get('work')
+    # Managers and works are looked up in the chosen company only
+    company = forms.ModelChoiceField(
+        Company.objects, widget=AutocompleteSelect('company'))
 
-        if manager.company != work.company:
-            raise forms.ValidationError('Should belong to the same company.')
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        scope_to_company(self, 'manager', 'work')
 
     class Meta:
         model = WorkPlace
-        fields = ('manager', 'work', 'worker', 'week_limit')
+        fields = ('company', 'manager', 'work', 'worker', 'week_limit')
+        widgets = {
+            'manager': AutocompleteSelect('manager', scope='company'),
+            'work': AutocompleteSelect('work', scope='company'),
+            'worker': AutocompleteSelect('worker'),
+        }
+
+
+class ImportWorkTimesForm(forms.Form):
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=(('csv', 'CSV'), ('jsonl', 'JSONL')))
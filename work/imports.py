@@ -0,0 +1,187 @@
+"""
+Streaming bulk import of worktimes from CSV or JSONL timesheets.
+
+Rows carry worker, date, time_start and time_end. They are validated in
+batches with the rules of CreateWorkTime, and the accepted ones are
+inserted with bulk_create. Rows of a batch are imported in the shard of
+their worker's approved workplace.
+"""
+import csv
+import json
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max
+
+from . import archive, caching, db, intervals, sharding, statistics
+from .forms import CreateWorkTimeForm
+from .models import Statistics, WorkPlace, WorkTime, APPROVED
+
+FORMATS = ('csv', 'jsonl')
+BATCH_SIZE = 1000
+
+
+class ImportReport:
+    """
+    Collecting the outcome of an import
+    """
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+
+def read_rows(lines, fmt):
+    """
+    Yield row dicts from an iterable of text lines
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+        return
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {}
+
+
+def import_worktimes(rows, batch_size=BATCH_SIZE):
+    """
+    Import rows in batches and return an ImportReport
+    """
+    report = ImportReport()
+    batch = []
+    line = 0
+    try:
+        for line, row in enumerate(rows, 1):
+            batch.append((line, row))
+            if len(batch) == batch_size:
+                import_batch(batch, report)
+                batch = []
+    except UnicodeDecodeError:
+        # Rows read before the undecodable line are still imported
+        report.add_error(line + 1, 'Line is not UTF-8 text, import stopped.')
+    if batch:
+        import_batch(batch, report)
+    report.errors.sort()
+    return report
+
+
+def validate_rows(batch, report):
+    """
+    Validate rows with CreateWorkTimeForm, return (line, worker_id, wt)
+    """
+    valid = []
+    for line, row in batch:
+        worker_id = str(row.get('worker', '')).strip()
+        if not worker_id.isdigit():
+            report.add_error(line, 'Incorrect worker value.')
+            continue
+
+        # JSON values may be numbers or lists, the form expects strings
+        form = CreateWorkTimeForm({
+            key: '' if value is None else str(value)
+            for key, value in row.items()})
+        if not form.is_valid():
+            report.add_error(line, ' '.join(
+                message for messages in form.errors.values()
+                for message in messages))
+            continue
+
+        valid.append((line, int(worker_id), form.save(commit=False)))
+    return valid
+
+
+def last_dates(worker_ids):
+    """
+    Map worker ids to the date of their latest worktime
+    """
+    last_ids = WorkTime.objects.filter(
+        worker_id__in=worker_ids).order_by().values('worker_id').annotate(
+            last_id=Max('id')).values_list('last_id', flat=True)
+    return dict(WorkTime.objects.filter(
+        id__in=list(last_ids)).values_list('worker_id', 'date'))
+
+
+def import_batch(batch, report):
+    valid = validate_rows(batch, report)
+    if not valid:
+        return
+
+    shards = sharding.worker_shards({worker_id for _, worker_id, _ in valid})
+    by_shard = defaultdict(list)
+    for row in valid:
+        by_shard[shards.get(row[1], DEFAULT_DB_ALIAS)].append(row)
+    for alias, rows in by_shard.items():
+        with sharding.use_shard(alias):
+            import_rows(rows, report)
+
+
+def import_rows(valid, report):
+    worker_ids = {worker_id for _, worker_id, _ in valid}
+    workplaces = {
+        wp.worker_id: wp for wp in WorkPlace.objects.filter(
+            worker_id__in=worker_ids, status=APPROVED).only(
+                'id', 'worker_id', 'week_limit')}
+    dates = last_dates(worker_ids)
+    archived_until = archive.archived_until()
+    shifts = intervals.worker_indexes(
+        worker_ids, min(wt.date for _, _, wt in valid),
+        max(wt.date for _, _, wt in valid))
+
+    ledger = defaultdict(float)
+    ledger.update({
+        (workplace_id, week): hours
+        for workplace_id, week, hours in Statistics.objects.filter(
+            workplace_id__in=[wp.id for wp in workplaces.values()],
+            week__in={statistics.week_start(wt.date) for _, _, wt in valid},
+        ).values_list('workplace_id', 'week', 'total_worked_time')})
+
+    worktimes = []
+    for line, worker_id, wt in valid:
+        wp = workplaces.get(worker_id)
+        if wp is None:
+            report.add_error(line, 'Worker has no approved workplace.')
+            continue
+
+        if worker_id in dates and dates[worker_id] >= wt.date:
+            report.add_error(line, 'Incorrect date value.')
+            continue
+
+        if archived_until and wt.date < archived_until:
+            report.add_error(line, 'Period is archived.')
+            continue
+
+        shift = intervals.shift_interval(wt.date, wt.time_start, wt.time_end)
+        if shifts[worker_id].overlaps(*shift):
+            report.add_error(line, 'Worktime overlaps another worktime.')
+            continue
+
+        week = (wp.id, statistics.week_start(wt.date))
+        if ledger[week] + wt.hours > wp.week_limit:
+            report.add_error(line, 'Week limit exceeded.')
+            continue
+
+        wt.worker_id = worker_id
+        wt.workplace_id = wp.id
+        dates[worker_id] = wt.date
+        shifts[worker_id].add(*shift)
+        ledger[week] += wt.hours
+        worktimes.append(wt)
+
+    save_worktimes(worktimes)
+    report.created += len(worktimes)
+
+
+@db.retry_locked
+def save_worktimes(worktimes):
+    WorkTime.objects.bulk_create(worktimes)
+    statistics.apply_worktimes(worktimes)
+    caching.touch(WorkTime)
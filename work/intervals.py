@@ -0,0 +1,75 @@
+"""
+Overlap detection for worktimes.
+
+A shift is a half-open interval of minutes counted from 0001-01-01, so
+shifts ending after midnight (time_end <= time_start) simply continue
+into the next day. Worktimes of a worker never overlap, so kept sorted
+by start they are sorted by end too and one bisect finds the only
+neighbours a new shift can collide with.
+"""
+import datetime
+from bisect import bisect_left, bisect_right
+
+from .models import WorkTime, CANCELLED
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def shift_interval(date, time_start, time_end):
+    start = date.toordinal() * MINUTES_PER_DAY + (
+        time_start.hour * 60 + time_start.minute)
+    end = date.toordinal() * MINUTES_PER_DAY + (
+        time_end.hour * 60 + time_end.minute)
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+class IntervalIndex:
+    """
+    Sorted non-overlapping shifts of one worker
+    """
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+
+    def overlaps(self, start, end):
+        i = bisect_right(self.starts, start)
+        if i and self.ends[i - 1] > start:
+            return True
+        return i < len(self.starts) and self.starts[i] < end
+
+    def add(self, start, end):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+    def remove(self, start, end):
+        i = bisect_left(self.starts, start)
+        while self.ends[i] != end:
+            i += 1
+        del self.starts[i]
+        del self.ends[i]
+
+
+def worker_indexes(worker_ids, date_from, date_to):
+    """
+    Build interval indexes of workers' shifts which can overlap shifts
+    starting between date_from and date_to, with one query
+    """
+    indexes = {worker_id: IntervalIndex() for worker_id in worker_ids}
+    for worker_id, date, time_start, time_end in WorkTime.objects.filter(
+            worker_id__in=indexes,
+            date__gte=date_from - datetime.timedelta(days=1),
+            date__lte=date_to + datetime.timedelta(days=1)).exclude(
+                status=CANCELLED).order_by().values_list(
+                    'worker_id', 'date', 'time_start', 'time_end'):
+        indexes[worker_id].add(*shift_interval(date, time_start, time_end))
+    return indexes
+
+
+def overlaps_existing(worker_id, date, time_start, time_end):
+    index = worker_indexes([worker_id], date, date)[worker_id]
+    return index.overlaps(*shift_interval(date, time_start, time_end))
+
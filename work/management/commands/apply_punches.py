@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from work import punches
+
+
+class Command(BaseCommand):
+    help = 'Apply queued punch events as worktimes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=punches.BATCH_SIZE)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep draining the queue instead of exiting when empty')
+        parser.add_argument(
+            '--interval', type=float, default=1,
+            help='Seconds to wait when the queue is empty in --loop mode')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = punches.apply_pending(options['batch_size'])
+            total += processed
+            if processed:
+                self.stdout.write(f'Processed {processed} punch events')
+            elif options['loop']:
+                time.sleep(options['interval'])
+            else:
+                break
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {total} punch events'))
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from work import archive
+
+
+class Command(BaseCommand):
+    help = 'Move worktimes of closed months into the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', type=datetime.date.fromisoformat,
+            help='Archive months ending before this date')
+        parser.add_argument(
+            '--keep-months', type=int, default=12,
+            help='Months kept in the database when --before is not given')
+
+    def handle(self, *args, **options):
+        before = options['before']
+        if before is None:
+            before = archive.month_start(datetime.date.today())
+            for _ in range(options['keep_months']):
+                before = archive.month_start(before - datetime.timedelta(1))
+
+        archived = archive.archive_before(before)
+        for month, rows in archived.items():
+            self.stdout.write(f'{month:%Y-%m}: {rows} worktimes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {sum(archived.values())} worktimes before '
+            f'{archive.month_start(before)}'))
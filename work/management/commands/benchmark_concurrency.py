@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand
+
+PATHS = ('companies/', 'workers/')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent throughput of running WSGI and ASGI servers, '
+        'e.g. "gunicorn -w 4 work_management.wsgi" and '
+        '"uvicorn --workers 4 work_management.asgi:application". '
+        'ASGI requests go to the async views under /async/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000/')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001/')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request, relative to the work app (repeatable)')
+
+    def fetch(self, url):
+        started = time.perf_counter()
+        try:
+            with urlopen(url, timeout=30) as response:
+                response.read()
+                ok = response.status < 400
+        except (HTTPError, OSError):
+            ok = False
+        return ok, time.perf_counter() - started
+
+    def run(self, urls, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(self.fetch, urls))
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(duration for _, duration in results)
+        return {
+            'rps': len(results) / elapsed,
+            'errors': sum(not ok for ok, _ in results),
+            'p50_ms': timings[len(timings) // 2] * 1000,
+            'p99_ms': timings[int(len(timings) * 0.99)] * 1000,
+        }
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or PATHS
+        servers = (
+            ('WSGI', options['wsgi_url']),
+            ('ASGI', options['asgi_url'].rstrip('/') + '/async/'),
+        )
+
+        for path in paths:
+            for name, base in servers:
+                urls = [base + path] * options['requests']
+                result = self.run(urls, options['concurrency'])
+                self.stdout.write(
+                    f'{name} {path:30} {result["rps"]:8.1f} req/s  '
+                    f'p50 {result["p50_ms"]:7.1f} ms  '
+                    f'p99 {result["p99_ms"]:7.1f} ms  '
+                    f'errors {result["errors"]}')
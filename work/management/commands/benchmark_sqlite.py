@@ -0,0 +1,134 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.models import F
+from django.test.utils import override_settings
+
+from work import db
+from work.models import PunchEvent, Statistics, WorkTime
+
+ALIAS = 'benchmark'
+
+
+def profiles():
+    production = settings.WORK_SQLITE_PRODUCTION
+    return {
+        'default': ({'journal_mode': 'delete'}, 0, {}),
+        'production': (
+            production['PRAGMAS'], production['CONN_MAX_AGE'],
+            production['OPTIONS']),
+    }
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent read/write throughput of the default and the '
+        'production SQLite profiles on copies of the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def read(self, objects):
+        list(WorkTime.objects.using(ALIAS).filter(
+            worker_id=random.choice(objects['workers'])).order_by(
+                '-date')[:20])
+
+    def write(self, objects):
+        @db.retry_locked(using=ALIAS)
+        def punch():
+            PunchEvent.objects.using(ALIAS).create(
+                worker_id=random.choice(objects['workers']),
+                date=objects['date'], time_start=objects['time'],
+                time_end=objects['time'])
+            Statistics.objects.using(ALIAS).filter(
+                pk=random.choice(objects['statistics'])).update(
+                    total_worked_time=F('total_worked_time') + 0)
+        punch()
+
+    def run_client(self, operation, objects, deadline, results):
+        timings, errors = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(objects)
+                timings.append(time.perf_counter() - started)
+            except OperationalError:
+                errors += 1
+            # End of a request, closes the connection without CONN_MAX_AGE
+            connections[ALIAS].close_if_unusable_or_obsolete()
+        connections[ALIAS].close()
+        results.append((timings, errors))
+
+    def run_profile(self, path, pragmas, max_age, options, opts, objects):
+        connections.databases[ALIAS] = dict(
+            settings.DATABASES['default'], NAME=path, CONN_MAX_AGE=max_age,
+            OPTIONS=options)
+        connections.ensure_defaults(ALIAS)
+        connections.prepare_test_settings(ALIAS)
+
+        reads, writes = [], []
+        deadline = time.perf_counter() + opts['seconds']
+        threads = [
+            threading.Thread(target=self.run_client, args=(
+                self.read, objects, deadline, reads))
+            for _ in range(opts['readers'])] + [
+            threading.Thread(target=self.run_client, args=(
+                self.write, objects, deadline, writes))
+            for _ in range(opts['writers'])]
+
+        with override_settings(WORK_SQLITE_PRAGMAS=pragmas):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        del connections.databases[ALIAS]
+        return reads, writes
+
+    def report(self, name, kind, results, seconds):
+        timings = [t for client, _ in results for t in client]
+        errors = sum(e for _, e in results)
+        p99 = percentile(timings, 0.99) * 1000 if timings else 0
+        self.stdout.write(
+            f'{name:10} {kind:6} {len(timings) / seconds:9.1f} ops/s  '
+            f'p99 {p99:8.1f} ms  errors {errors}')
+
+    def handle(self, *args, **options):
+        source = settings.DATABASES['default']
+        if source['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('The default database is not SQLite')
+
+        objects = {
+            'workers': list(WorkTime.objects.order_by().values_list(
+                'worker_id', flat=True).distinct()[:1000]),
+            'statistics': list(Statistics.objects.values_list(
+                'id', flat=True)[:1000]),
+            'date': WorkTime.objects.order_by('-date').values_list(
+                'date', flat=True).first(),
+        }
+        if not objects['workers'] or not objects['statistics']:
+            raise CommandError('No data to benchmark, run generate_data first')
+        objects['time'] = WorkTime.objects.values_list(
+            'time_start', flat=True).first()
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, profile in profiles().items():
+                path = os.path.join(directory, f'{name}.sqlite3')
+                shutil.copy(source['NAME'], path)
+                reads, writes = self.run_profile(path, *profile, options,
+                                                 objects)
+                self.report(name, 'reads', reads, options['seconds'])
+                self.report(name, 'writes', writes, options['seconds'])
@@ -0,0 +1,212 @@
+import datetime
+import json
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from work import sharding, urls
+from work.models import Company, WorkPlace, WorkTime, APPROVED, NEW
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def sample_objects():
+    """
+    Pick the objects benchmarked views are requested for
+    """
+    wp = WorkPlace.objects.filter(status=APPROVED).order_by('-id').first()
+    new_wp = WorkPlace.objects.filter(status=NEW).order_by('-id').first()
+    company = Company.objects.order_by('id').first()
+    if wp is None or company is None:
+        raise CommandError('No data to benchmark, run generate_data first')
+
+    last_wt = WorkTime.objects.filter(
+        worker_id=wp.worker_id).order_by('-id').first()
+    return {
+        'company': company.id,
+        'worker': wp.worker_id,
+        'workplace': wp.id,
+        'new_workplace': (new_wp or wp).id,
+        'last_date': last_wt.date if last_wt else datetime.date.today(),
+        'search': wp.worker.last_name[:3],
+    }
+
+
+@contextmanager
+def rolled_back():
+    """
+    Run the block in a transaction of every writable database, rolled
+    back at its end
+    """
+    with ExitStack() as stack:
+        for alias in sharding.shards():
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+        for alias in sharding.shards():
+            transaction.set_rollback(True, using=alias)
+
+
+# Changes are rolled back, so their on_commit cache invalidations never run:
+# pages and permission sets cached meanwhile must not outlive the benchmark
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'work-benchmark',
+    },
+}
+
+
+# url name -> function(objects, iteration) returning (method, url, data)
+REQUESTS = {
+    'comp_list': lambda o, i: ('get', reverse('work:comp_list'), None),
+    'comp_detail': lambda o, i: (
+        'get', reverse('work:comp_detail', args=[o['company']]), None),
+    'manag_list': lambda o, i: (
+        'get', reverse('work:manag_list', args=[o['company']]), None),
+    'worker_list': lambda o, i: ('get', reverse('work:worker_list'), None),
+    'worker_detail': lambda o, i: (
+        'get', reverse('work:worker_detail', args=[o['worker']]), None),
+    'create_worktime': lambda o, i: (
+        'post', reverse('work:create_worktime', args=[o['worker']]), {
+            'date': (o['last_date'] + datetime.timedelta(
+                days=i + 1)).strftime('%m/%d/%Y'),
+            'time_start': '09:00', 'time_end': '10:00'}),
+    'create_work': lambda o, i: ('get', reverse('work:create_work'), None),
+    'hire': lambda o, i: ('get', reverse('work:hire'), None),
+    'update_wp': lambda o, i: (
+        'post', reverse('work:update_wp', args=[o['new_workplace']]),
+        {'approve_btn': 'Approve'}),
+    'approve_wps': lambda o, i: (
+        'post', reverse('work:approve_wps'),
+        {'workplace': [o['new_workplace']]}),
+    'import_worktimes': lambda o, i: (
+        'get', reverse('work:import_worktimes'), None),
+    'export_worktimes': lambda o, i: (
+        'get', reverse('work:export_worktimes', args=['csv']) +
+        f'?worker={o["worker"]}', None),
+    'worktime_history': lambda o, i: (
+        'get', reverse('work:worktime_history', args=[o['workplace']]),
+        None),
+    'metrics': lambda o, i: ('get', reverse('work:metrics'), None),
+    'punch': lambda o, i: (
+        'post', reverse('work:punch'), {
+            'worker': o['worker'],
+            'date': (o['last_date'] + datetime.timedelta(
+                days=i + 1)).isoformat(),
+            'time_start': '09:00', 'time_end': '10:00'}),
+    'api_companies': lambda o, i: (
+        'get', reverse('work:api_companies'), None),
+    'api_workers': lambda o, i: (
+        'get', reverse('work:api_workers'), {'company': o['company']}),
+    'api_workplaces': lambda o, i: (
+        'get', reverse('work:api_workplaces'), {'company': o['company']}),
+    'api_worktimes': lambda o, i: (
+        'get', reverse('work:api_worktimes'), {'company': o['company']}),
+    'search': lambda o, i: (
+        'get', reverse('work:search'), {'q': o['search']}),
+    'autocomplete': lambda o, i: (
+        'get', reverse('work:autocomplete', args=['work']),
+        {'q': o['search'][:2], 'company': o['company']}),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency percentiles and query counts of every work view. '
+        'Changes made by each POST request are rolled back before the '
+        'next, a private cache is used meanwhile.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--output', help='Save results as a JSON baseline to this path')
+        parser.add_argument(
+            '--compare', help='Compare results with a saved JSON baseline')
+
+    def measure(self, client, spec, objects, iterations):
+        timings = []
+        queries = []
+        for i in range(iterations):
+            method, url, data = spec(objects, i)
+            # Reads run outside transactions, which would pin them to the
+            # primary, writes start from the same rows every time
+            with ExitStack() as stack:
+                captured = [
+                    stack.enter_context(
+                        CaptureQueriesContext(connections[alias]))
+                    for alias in connections]
+                if method == 'post':
+                    stack.enter_context(rolled_back())
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                timings.append(time.perf_counter() - started)
+            queries.append(sum(map(len, captured)))
+            if response.status_code >= 400:
+                raise CommandError(f'{method.upper()} {url} returned '
+                                   f'{response.status_code}')
+        return {
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p90_ms': round(percentile(timings, 0.9) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+            'queries': max(queries),
+        }
+
+    def handle(self, *args, **options):
+        results = {}
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            objects = sample_objects()
+            User.objects.filter(username='benchmark').delete()
+            user = User.objects.create_superuser(
+                'benchmark', 'benchmark@example.com', None)
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+
+            try:
+                for pattern in urls.urlpatterns:
+                    spec = REQUESTS.get(pattern.name)
+                    if spec is None:
+                        self.stderr.write(
+                            f'Skipping {pattern.name}: no request')
+                        continue
+                    results[pattern.name] = self.measure(
+                        client, spec, objects, options['iterations'])
+                    self.stdout.write(
+                        f'{pattern.name:20} '
+                        f'{json.dumps(results[pattern.name])}')
+            finally:
+                client.logout()
+                user.delete()
+                cache.clear()
+
+        report = {
+            'created': datetime.datetime.now().isoformat(),
+            'iterations': options['iterations'],
+            'views': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['views']
+            for name, result in results.items():
+                if name not in baseline:
+                    continue
+                old = baseline[name]
+                self.stdout.write(
+                    f'{name:20} p50 {old["p50_ms"]} -> {result["p50_ms"]} ms, '
+                    f'queries {old["queries"]} -> {result["queries"]}')
@@ -0,0 +1,162 @@
+import datetime
+import random
+from itertools import islice
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from work import caching
+from work.models import (
+    Company, Manager, Work, Worker, WorkPlace, WorkTime,
+    NEW, APPROVED, FINISHED)
+
+FIRST_NAMES = (
+    'Anna', 'Bohdan', 'Daria', 'Ivan', 'Kateryna', 'Mykola', 'Olena',
+    'Petro', 'Sofia', 'Taras', 'Yulia', 'Andrii', 'Iryna', 'Oleh')
+LAST_NAMES = (
+    'Bondarenko', 'Kovalenko', 'Kravchenko', 'Melnyk', 'Shevchenko',
+    'Tkachenko', 'Boiko', 'Koval', 'Oliinyk', 'Polishchuk', 'Lysenko')
+WORK_NAMES = (
+    'Cashier', 'Driver', 'Loader', 'Cook', 'Cleaner', 'Guard', 'Seller',
+    'Storekeeper', 'Operator', 'Courier', 'Mechanic', 'Accountant')
+SHIFTS = (
+    (datetime.time(8), datetime.time(16)),
+    (datetime.time(9), datetime.time(17)),
+    (datetime.time(10), datetime.time(18)),
+    (datetime.time(14), datetime.time(22)),
+)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1000)
+        parser.add_argument('--works-per-company', type=int, default=5)
+        parser.add_argument('--managers-per-company', type=int, default=3)
+        parser.add_argument('--workers', type=int, default=100000)
+        parser.add_argument('--worktimes', type=int, default=1000000)
+        parser.add_argument(
+            '--start-date', type=datetime.date.fromisoformat,
+            default=datetime.date(2015, 1, 5))
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def insert(self, model, objs):
+        count = 0
+        for batch in batched(objs, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            count += len(batch)
+        self.stdout.write(f'Created {count} {model._meta.verbose_name_plural}')
+
+    def new_ids(self, model, after):
+        return list(model.objects.filter(id__gt=after).order_by(
+            'id').values_list('id', flat=True))
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        rnd = random.Random(options['seed'])
+
+        after = self.last_id(Company)
+        self.insert(Company, (
+            Company(name=f'Company {i}')
+            for i in range(options['companies'])))
+        companies = self.new_ids(Company, after)
+
+        after = self.last_id(Manager)
+        self.insert(Manager, (
+            Manager(
+                company_id=company_id,
+                first_name=rnd.choice(FIRST_NAMES),
+                last_name=rnd.choice(LAST_NAMES),
+                email=f'manager{company_id}.{i}@example.com')
+            for company_id in companies
+            for i in range(options['managers_per_company'])))
+        managers = {}
+        for pk, company_id in Manager.objects.filter(
+                id__gt=after).values_list('id', 'company_id'):
+            managers.setdefault(company_id, []).append(pk)
+
+        after = self.last_id(Work)
+        self.insert(Work, (
+            Work(company_id=company_id, name=f'{name} {i}')
+            for company_id in companies
+            for i, name in zip(
+                range(options['works_per_company']),
+                rnd.sample(WORK_NAMES * options['works_per_company'],
+                           options['works_per_company']))))
+        works = list(Work.objects.filter(id__gt=after).values_list(
+            'id', 'company_id'))
+
+        after = self.last_id(Worker)
+        self.insert(Worker, (
+            Worker(
+                first_name=rnd.choice(FIRST_NAMES),
+                last_name=rnd.choice(LAST_NAMES))
+            for _ in range(options['workers'])))
+        workers = self.new_ids(Worker, after)
+
+        # Every worker finished up to two jobs, most of them work now and
+        # some have a pending hire
+        after = self.last_id(WorkPlace)
+
+        def workplaces():
+            for worker_id in workers:
+                picked = rnd.sample(works, min(len(works), 4))
+                statuses = [FINISHED] * rnd.randint(0, 2)
+                if rnd.random() < 0.9:
+                    statuses.append(APPROVED)
+                if rnd.random() < 0.2:
+                    statuses.append(NEW)
+                for (work_id, company_id), status in zip(picked, statuses):
+                    yield WorkPlace(
+                        manager_id=rnd.choice(managers[company_id]),
+                        work_id=work_id, worker_id=worker_id, status=status)
+
+        self.insert(WorkPlace, workplaces())
+        worked = {}
+        for pk, worker_id in WorkPlace.objects.filter(
+                id__gt=after, status__in=(FINISHED, APPROVED)).order_by(
+                    'status', 'id').values_list('id', 'worker_id'):
+            worked.setdefault(worker_id, []).append(pk)
+
+        # One weekday shift after another, split between worker's jobs
+        def worktimes():
+            per_worker, extra = divmod(options['worktimes'], len(worked))
+            for n, (worker_id, wps) in enumerate(worked.items()):
+                count = per_worker + (n < extra)
+                date = options['start_date']
+                for i in range(count):
+                    while date.weekday() >= 5:
+                        date += datetime.timedelta(days=1)
+                    time_start, time_end = rnd.choice(SHIFTS)
+                    yield WorkTime(
+                        date=date, time_start=time_start, time_end=time_end,
+                        worker_id=worker_id,
+                        workplace_id=wps[i * len(wps) // count],
+                        status=rnd.choice((NEW, APPROVED)))
+                    date += datetime.timedelta(days=1)
+
+        if worked and options['worktimes']:
+            self.insert(WorkTime, worktimes())
+
+        caching.touch(Company, Manager, Work, Worker, WorkPlace, WorkTime)
+        call_command(
+            'rebuild_statistics', batch_size=self.batch_size,
+            stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
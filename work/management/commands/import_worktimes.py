@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from work import imports
+
+
+class Command(BaseCommand):
+    help = 'Import worktimes from a CSV or JSONL timesheet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=imports.FORMATS,
+            help='Timesheet format, guessed from the extension by default')
+        parser.add_argument(
+            '--batch-size', type=int, default=imports.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.')
+        if fmt not in imports.FORMATS:
+            raise CommandError(f'Unknown timesheet format: {fmt}')
+
+        with open(path, newline='', encoding='utf-8') as lines:
+            report = imports.import_worktimes(
+                imports.read_rows(lines, fmt), options['batch_size'])
+
+        for line, message in report.errors:
+            self.stderr.write(f'Row {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.created} worktimes, '
+            f'{len(report.errors)} rows rejected'))
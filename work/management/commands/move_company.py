@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError
+
+from work import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        'Move a company with its data to another shard and update the '
+        'shard map. Stop writes to the company while it runs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', type=int)
+        parser.add_argument(
+            'shard', help=f'Shard alias, "{DEFAULT_DB_ALIAS}" included')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is off, set WORK_SHARD_MAP')
+        if options['shard'] not in sharding.shards():
+            raise CommandError(
+                f'Unknown shard, choose from {", ".join(sharding.shards())}')
+
+        started = time.perf_counter()
+        try:
+            moved = sharding.move_company(
+                options['company'], options['shard'], options['batch_size'])
+        except ValueError as e:
+            raise CommandError(e)
+        except IntegrityError as e:
+            raise CommandError(
+                f'Rows clash with the target shard ({e}), give shards '
+                f'distinct id_start values in {settings.WORK_SHARD_MAP}')
+
+        for model, rows in moved.items():
+            self.stdout.write(f'{model.__name__}: {rows}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved company {options["company"]} to {options["shard"]} in '
+            f'{time.perf_counter() - started:.2f}s'))
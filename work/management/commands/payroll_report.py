@@ -0,0 +1,43 @@
+import csv
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from work import reports
+
+
+class Command(BaseCommand):
+    help = 'Print worked hours and overtime per company, work or worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='date_from', type=datetime.date.fromisoformat)
+        parser.add_argument(
+            '--to', dest='date_to', type=datetime.date.fromisoformat)
+        parser.add_argument('--company', type=int)
+        parser.add_argument(
+            '--by', choices=('company', 'work', 'worker', 'workplace'),
+            default='company')
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Save weekly totals of the range into Statistics')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        report = reports.Report.build(
+            options['date_from'], options['date_to'], options['company'])
+
+        writer = csv.writer(self.stdout)
+        writer.writerow((options['by'], 'hours', 'overtime'))
+        for pk, hours, overtime in report.totals(options['by']):
+            writer.writerow((pk, round(hours, 2), round(overtime, 2)))
+
+        if options['save']:
+            try:
+                reports.save_statistics(report)
+            except ValueError as e:
+                raise CommandError(e)
+
+        self.stderr.write(
+            f'Report built in {time.perf_counter() - started:.2f}s')
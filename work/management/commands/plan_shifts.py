@@ -0,0 +1,65 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from work import planning, sharding, statistics
+
+
+class Command(BaseCommand):
+    help = 'Plan shifts of a week from staffing requirements'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--week', type=datetime.date.fromisoformat,
+            help='Any date of the week, next week by default')
+        parser.add_argument('--company', type=int)
+        parser.add_argument('--work', type=int)
+        parser.add_argument(
+            '--commit', action='store_true',
+            help='Save planned shifts as drafts, replacing earlier ones')
+        parser.add_argument(
+            '--publish', action='store_true',
+            help='Save draft shifts of the week as worktimes instead of '
+                 'planning')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            return self.plan(options)
+        if options['company'] is None:
+            raise CommandError('--company is required with sharding enabled')
+        with sharding.use_shard(
+                sharding.shard_for_company(options['company'])):
+            return self.plan(options)
+
+    def plan(self, options):
+        week = options['week'] or statistics.week_start(
+            datetime.date.today() + datetime.timedelta(days=7))
+
+        if options['publish']:
+            report = planning.publish(
+                week, options['company'], options['work'])
+            for line, message in report.errors:
+                self.stderr.write(f'Shift {line}: {message}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Saved {report.created} worktimes'))
+            return
+
+        started = time.perf_counter()
+        planner = planning.Planner(
+            week, options['company'], options['work']).plan()
+        shifts = planner.drafts()
+        self.stdout.write(
+            f'Planned {len(shifts)} shifts for week of {planner.week} '
+            f'in {time.perf_counter() - started:.2f}s')
+
+        for slot, missing in planner.unfilled():
+            self.stdout.write(
+                f'Unfilled: {missing} x work {slot.requirement.work_id} on '
+                f'{slot.date} {slot.requirement.time_start}-'
+                f'{slot.requirement.time_end}')
+
+        if options['commit']:
+            saved = planning.save_draft(planner)
+            self.stdout.write(self.style.SUCCESS(
+                f'Saved {len(saved)} draft shifts'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from work import search, sharding
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the name search index of every shard'
+
+    def handle(self, *args, **options):
+        for alias in sharding.shards():
+            if not search.available(alias):
+                continue
+            with transaction.atomic(using=alias):
+                search.rebuild(alias)
+            self.stdout.write(f'Rebuilt search index of {alias}')
@@ -0,0 +1,84 @@
+import datetime
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from work.models import Statistics, WorkPlace, WorkTime, worked_hours
+from work import archive, reports, sharding, statistics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Statistics rollups from all worktimes, archived included'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of worktimes read and rows written per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Deltas per shard, archived months are shared by all shards
+        deltas = {alias: defaultdict(float) for alias in sharding.shards()}
+        homes = {}
+
+        for alias in deltas:
+            homes.update(dict.fromkeys(
+                WorkPlace.objects.using(alias).values_list('id', flat=True),
+                alias))
+            last_id = 0
+            seen = 0
+
+            while True:
+                chunk = list(
+                    WorkTime.objects.using(alias).filter(id__gt=last_id)
+                    .order_by('id').values_list(
+                        'id', 'workplace_id', 'worker_id', 'date',
+                        'time_start', 'time_end', 'status')[:batch_size])
+                if not chunk:
+                    break
+
+                for (_, workplace_id, worker_id, date,
+                        time_start, time_end, status) in chunk:
+                    statistics.add_shift(
+                        deltas[alias], workplace_id, worker_id, date,
+                        worked_hours(date, time_start, time_end), status)
+
+                last_id = chunk[-1][0]
+                seen += len(chunk)
+                self.stdout.write(f'Read {seen} worktimes of {alias}')
+
+        # Archived months are read one at a time, weeks spanning two
+        # months add up in deltas
+        for month in archive.archived_months():
+            columns = reports.archived_columns(
+                month, archive.next_month(month) - datetime.timedelta(days=1))
+            if columns is None:
+                continue
+            for workplace_id, worker_id, week, hours, _ in reports.Report(
+                    columns).weekly():
+                deltas[homes[workplace_id]][
+                    (workplace_id, worker_id, week)] += hours
+            self.stdout.write(
+                f'Read {len(columns["date"])} archived worktimes of '
+                f'{month:%Y-%m}')
+
+        rebuilt = 0
+        for alias, shard_deltas in deltas.items():
+            totals = defaultdict(float)
+            for (workplace_id, worker_id, week), hours in shard_deltas.items():
+                totals[(workplace_id, worker_id, week)] += hours
+                totals[(workplace_id, worker_id, None)] += hours
+
+            with transaction.atomic(using=alias):
+                Statistics.objects.using(alias).all().delete()
+                Statistics.objects.using(alias).bulk_create((
+                    Statistics(
+                        workplace_id=workplace_id, worker_id=worker_id,
+                        week=week, total_worked_time=hours)
+                    for (workplace_id, worker_id, week), hours
+                    in totals.items()), batch_size=batch_size)
+            rebuilt += len(totals)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rebuilt} statistics rows'))
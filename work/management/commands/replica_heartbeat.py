@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from work import routers
+
+
+class Command(BaseCommand):
+    help = 'Record heartbeats on the primary to measure replica lag'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep recording heartbeats instead of exiting after one')
+        parser.add_argument(
+            '--interval', type=float,
+            default=settings.WORK_REPLICA_CHECK_INTERVAL,
+            help='Seconds between heartbeats in --loop mode')
+
+    def handle(self, *args, **options):
+        while True:
+            routers.beat()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Recorded heartbeat'))
@@ -0,0 +1,271 @@
+"""
+Per-view request metrics kept in memory and exposed in the Prometheus
+text format by the metrics view. Every process keeps its own numbers.
+
+The middlewares serve both WSGI and ASGI requests. Queries of async
+views run on connections of executor threads, so they are recorded by
+an execute wrapper every connection gets, which hands them to the
+collector of the request in the current context.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.local import Local
+from django.conf import settings
+
+from . import routers, sharding
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class QueryCollector:
+    """
+    Database execute wrapper counting and timing queries
+    """
+    def __init__(self):
+        self.count = 0
+        self.time = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.count += 1
+            self.statements[hash((sql, str(params)))] += 1
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.requests = 0
+        self.duration = 0
+        self.queries = 0
+        self.db_time = 0
+        self.duplicates = 0
+        self.render_time = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+
+    def observe(self, view, duration, collector, render_time):
+        with self.lock:
+            metrics = self.views[view]
+            metrics.requests += 1
+            metrics.duration += duration
+            metrics.queries += collector.count
+            metrics.db_time += collector.time
+            metrics.duplicates += collector.duplicates
+            metrics.render_time += render_time
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[i] += 1
+
+    def render(self):
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# HELP work_request_duration_seconds Request latency.',
+                '# TYPE work_request_duration_seconds histogram',
+            ]
+            for view, m in views:
+                for bound, count in zip(BUCKETS, m.buckets):
+                    lines.append(
+                        f'work_request_duration_seconds_bucket'
+                        f'{{view="{view}",le="{bound}"}} {count}')
+                lines += [
+                    f'work_request_duration_seconds_bucket'
+                    f'{{view="{view}",le="+Inf"}} {m.requests}',
+                    f'work_request_duration_seconds_sum'
+                    f'{{view="{view}"}} {m.duration}',
+                    f'work_request_duration_seconds_count'
+                    f'{{view="{view}"}} {m.requests}',
+                ]
+
+            counters = (
+                ('work_db_queries_total', 'Database queries.', 'queries'),
+                ('work_db_duplicate_queries_total',
+                 'Queries repeated with the same SQL and parameters.',
+                 'duplicates'),
+                ('work_db_seconds_total', 'Time spent in the database.',
+                 'db_time'),
+                ('work_template_render_seconds_total',
+                 'Time spent rendering template responses.', 'render_time'),
+            )
+            for name, help_text, attr in counters:
+                lines += [
+                    f'# HELP {name} {help_text}',
+                    f'# TYPE {name} counter',
+                ]
+                lines += [
+                    f'{name}{{view="{view}"}} {getattr(m, attr)}'
+                    for view, m in views]
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+_request = Local()
+
+
+def record_query(execute, sql, params, many, context):
+    collector = getattr(_request, 'collector', None)
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class HybridMiddleware:
+    """
+    Middleware running in the mode of the handler: __call__ returns a
+    coroutine when get_response is async
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes the handler see the instance as a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.call(request)
+
+    def call(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class QueryMetricsMiddleware(HybridMiddleware):
+    """
+    Recording latency, query count, database time, duplicate queries and
+    template render time per resolved URL name for a sample of requests
+    """
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.sample_rate = getattr(settings, 'WORK_METRICS_SAMPLE_RATE', 1)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def start(self, request):
+        request._metrics_render_time = 0
+        _request.collector = QueryCollector()
+        return time.perf_counter()
+
+    def finish(self, request, started):
+        duration = time.perf_counter() - started
+        collector = _request.collector
+        _request.collector = None
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        registry.observe(
+            view, duration, collector, request._metrics_render_time)
+
+    def call(self, request):
+        if not self.sampled():
+            return self.get_response(request)
+        started = self.start(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request, started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        started = self.start(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request, started)
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render_time = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaPinningMiddleware(HybridMiddleware):
+    """
+    Sending reads of a client to the primary database for a while after
+    it wrote, so it sees its own changes on replicas that lag behind
+    """
+    cookie_name = 'work_primary'
+
+    def start(self, request):
+        routers.reset()
+        if request.COOKIES.get(self.cookie_name):
+            routers.pin()
+
+    def finish(self, response):
+        if routers.wrote():
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.WORK_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+    def call(self, request):
+        self.start(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            routers.reset()
+
+    async def __acall__(self, request):
+        self.start(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            routers.reset()
+
+
+class ShardMiddleware(HybridMiddleware):
+    """
+    Routing company data of a request to the shard its view reads
+    """
+    def call(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            sharding.set_current(None)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            sharding.set_current(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if sharding.enabled():
+            sharding.set_current(sharding.view_shard(
+                request.resolver_match.url_name, view_kwargs))
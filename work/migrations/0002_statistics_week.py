@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='workplace',
+            options={'ordering': ['status', '-id'], 'permissions': (('can_hire', 'Can hire workers'),)},
+        ),
+        migrations.AlterModelOptions(
+            name='worktime',
+            options={'ordering': ['-date']},
+        ),
+        migrations.AddField(
+            model_name='statistics',
+            name='week',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='statistics',
+            name='total_worked_time',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='statistics',
+            unique_together={('workplace', 'week')},
+        ),
+    ]
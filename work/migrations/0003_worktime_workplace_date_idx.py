@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0002_statistics_week'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='worktime',
+            index=models.Index(fields=['workplace', 'date'], name='worktime_workplace_date_idx'),
+        ),
+    ]
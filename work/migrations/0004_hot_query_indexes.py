@@ -0,0 +1,49 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:41
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def finish_extra_approvals(apps, schema_editor):
+    """
+    Keep the newest approved workplace of each worker, finish the others
+    """
+    WorkPlace = apps.get_model('work', 'WorkPlace')
+    approved = WorkPlace.objects.using(
+        schema_editor.connection.alias).filter(status=1)
+    for row in approved.order_by().values('worker_id').annotate(
+            rows=Count('id'), newest=Max('id')).filter(rows__gt=1):
+        approved.filter(worker_id=row['worker_id']).exclude(
+            pk=row['newest']).update(status=3)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0003_worktime_workplace_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workplace',
+            index=models.Index(fields=['worker', 'status'], name='workplace_worker_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workplace',
+            index=models.Index(fields=['status', '-id'], name='workplace_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='worktime',
+            index=models.Index(fields=['worker', '-id'], name='worktime_worker_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='worktime',
+            index=models.Index(fields=['-date'], name='worktime_date_idx'),
+        ),
+        migrations.RunPython(
+            finish_extra_approvals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='workplace',
+            constraint=models.UniqueConstraint(condition=models.Q(status=1), fields=('worker',), name='workplace_one_approved_per_worker'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PunchEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time_start', models.TimeField()),
+                ('time_end', models.TimeField()),
+                ('status', models.IntegerField(choices=[(0, 'Pending'), (1, 'Applied'), (2, 'Rejected')], default=0)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('processed_date', models.DateTimeField(blank=True, null=True)),
+                ('worker', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='work.worker')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='punchevent',
+            index=models.Index(fields=['status', 'id'], name='punchevent_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0005_punchevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='worktime',
+            index=models.Index(fields=['worker', 'date'], name='worktime_worker_date_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0006_worktime_worker_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffingRequirement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.IntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('time_start', models.TimeField()),
+                ('time_end', models.TimeField()),
+                ('headcount', models.PositiveIntegerField(default=1)),
+                ('work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requirements', to='work.work')),
+            ],
+        ),
+    ]
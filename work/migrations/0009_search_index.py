@@ -0,0 +1,52 @@
+from django.db import migrations
+
+TABLES = {
+    'work_search': "tokenize='unicode61 remove_diacritics 2', prefix='2 3'",
+    'work_search_trigram': "tokenize='trigram'",
+}
+
+# kind slot -> query of (id, name, tags, company id)
+SOURCES = (
+    "SELECT id, first_name || ' ' || last_name AS name, "
+    "'|worker|' AS tags, NULL AS company_id FROM work_worker",
+    "SELECT id, name, '|company| |c' || id || '|' AS tags, "
+    'id AS company_id FROM work_company',
+    "SELECT id, name, '|work| |c' || company_id || '|' AS tags, "
+    'company_id FROM work_work',
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, options in TABLES.items():
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {table} USING fts5('
+            f'name, tags, company_id UNINDEXED, {options})')
+        for slot, source in enumerate(SOURCES):
+            schema_editor.execute(
+                f'INSERT INTO {table} (rowid, name, tags, company_id) '
+                f'SELECT id * 4 + {slot}, name, tags, company_id '
+                f'FROM ({source})')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE work_search_trigram_vocab '
+        'USING fts5vocab(work_search_trigram, row)')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE work_search_trigram_vocab')
+    for table in TABLES:
+        schema_editor.execute(f'DROP TABLE {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0008_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+TABLES = ('work_search', 'work_search_trigram')
+
+SOURCE = (
+    "SELECT id, first_name || ' ' || last_name AS name, "
+    "'|manager| |c' || company_id || '|' AS tags, "
+    'company_id FROM work_manager')
+
+
+def index_managers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in TABLES:
+        schema_editor.execute(
+            f'INSERT INTO {table} (rowid, name, tags, company_id) '
+            f'SELECT id * 4 + 3, name, tags, company_id FROM ({SOURCE})')
+
+
+def unindex_managers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DELETE FROM {table} WHERE rowid % 4 = 3')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_managers, unindex_managers),
+    ]
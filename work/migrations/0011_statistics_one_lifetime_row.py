@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:18
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_lifetime_rows(apps, schema_editor):
+    """
+    Sum duplicate lifetime rows of a workplace into its first one
+    """
+    Statistics = apps.get_model('work', 'Statistics')
+    rows = Statistics.objects.using(schema_editor.connection.alias).filter(
+        week=None)
+    duplicated = rows.values('workplace_id').annotate(
+        rows=Count('id'), total=Sum('total_worked_time')).filter(rows__gt=1)
+    for row in duplicated:
+        ids = list(rows.filter(workplace_id=row['workplace_id']).order_by(
+            'id').values_list('id', flat=True))
+        rows.filter(pk=ids[0]).update(total_worked_time=row['total'])
+        rows.filter(pk__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0010_search_managers'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_lifetime_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='statistics',
+            constraint=models.UniqueConstraint(condition=models.Q(week=None), fields=('workplace',), name='statistics_one_lifetime_row'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0011_statistics_one_lifetime_row'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlannedShift',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time_start', models.TimeField()),
+                ('time_end', models.TimeField()),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='work.worker')),
+                ('workplace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='planned_shifts', to='work.workplace')),
+            ],
+            options={
+                'ordering': ['date', 'time_start'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='plannedshift',
+            index=models.Index(fields=['workplace', 'date'], name='plannedshift_workplace_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0012_plannedshift'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='worktime',
+            name='worktime_worker_id_idx',
+        ),
+    ]
@@ -1,3 +1,5 @@
+import datetime
+
 from django.db import models
 from django.utils import timezone
 
@@ -8,6 +10,14 @@ CANCELLED = 2
 FINISHED = 3
 
 
+def worked_hours(date, time_start, time_end):
+    start = datetime.datetime.combine(date, time_start)
+    end = datetime.datetime.combine(date, time_end)
+    if end <= start:
+        end += datetime.timedelta(days=1)
+    return (end - start).total_seconds() / 3600
+
+
 class Company(models.Model):
     name = models.CharField(max_length=50)
 
@@ -81,6 +91,19 @@ class WorkPlace(models.Model):
     class Meta:
         unique_together = ['work', 'worker']
         ordering = ['status', '-id']
+        indexes = [
+            models.Index(
+                fields=['worker', 'status'],
+                name='workplace_worker_status_idx'),
+            models.Index(
+                fields=['status', '-id'],
+                name='workplace_status_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['worker'], condition=models.Q(status=APPROVED),
+                name='workplace_one_approved_per_worker'),
+        ]
         permissions = (
             ('can_hire', 'Can hire workers'),
         )
@@ -106,8 +129,20 @@ class WorkTime(models.Model):
     )
     status = models.IntegerField(choices=STATUS_CHOICES, default=NEW)
 
+    @property
+    def hours(self):
+        return worked_hours(self.date, self.time_start, self.time_end)
+
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(
+                fields=['workplace', 'date'],
+                name='worktime_workplace_date_idx'),
+            models.Index(
+                fields=['worker', 'date'], name='worktime_worker_date_idx'),
+            models.Index(fields=['-date'], name='worktime_date_idx'),
+        ]
 
 
 class Statistics(models.Model):
@@ -120,4 +155,121 @@ class Statistics(models.Model):
     worker = models.ForeignKey(
         Worker, related_name='workers', on_delete=models.CASCADE)
 
-    total_worked_time = models.FloatField()
+    # Monday of the ISO week, NULL for the workplace's lifetime total
+    week = models.DateField(null=True, blank=True)
+
+    total_worked_time = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['workplace', 'week']
+        constraints = [
+            # NULL weeks are distinct in unique_together
+            models.UniqueConstraint(
+                fields=['workplace'], condition=models.Q(week=None),
+                name='statistics_one_lifetime_row'),
+        ]
+
+
+class PunchEvent(models.Model):
+    """
+    Worktime submitted through the punch queue, applied later in batches
+    """
+    PENDING = 0
+    APPLIED = 1
+    REJECTED = 2
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (APPLIED, 'Applied'),
+        (REJECTED, 'Rejected'),
+    )
+
+    # Not checked on punch-in, the applier rejects unknown workers
+    worker = models.ForeignKey(
+        Worker, db_constraint=False, on_delete=models.DO_NOTHING)
+
+    date = models.DateField()
+
+    time_start = models.TimeField()
+    time_end = models.TimeField()
+
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+    error = models.CharField(max_length=200, blank=True)
+
+    created_date = models.DateTimeField(auto_now_add=True)
+    processed_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'id'], name='punchevent_status_id_idx'),
+        ]
+
+
+class StaffingRequirement(models.Model):
+    """
+    Number of workers a work needs on a weekday between two times
+    """
+    MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = range(7)
+
+    WEEKDAY_CHOICES = (
+        (MONDAY, 'Monday'),
+        (TUESDAY, 'Tuesday'),
+        (WEDNESDAY, 'Wednesday'),
+        (THURSDAY, 'Thursday'),
+        (FRIDAY, 'Friday'),
+        (SATURDAY, 'Saturday'),
+        (SUNDAY, 'Sunday'),
+    )
+
+    work = models.ForeignKey(
+        Work, related_name='requirements', on_delete=models.CASCADE)
+
+    weekday = models.IntegerField(choices=WEEKDAY_CHOICES)
+
+    time_start = models.TimeField()
+    time_end = models.TimeField()
+
+    headcount = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return (f'{self.headcount} x {self.work.name} on '
+                f'{self.get_weekday_display()} {self.time_start}-'
+                f'{self.time_end}')
+
+
+class PlannedShift(models.Model):
+    """
+    Draft shift of a weekly plan. Drafts are no worktimes: they count in
+    no statistics or worktime rules until published as worktimes.
+    """
+    date = models.DateField()
+
+    time_start = models.TimeField()
+    time_end = models.TimeField()
+
+    worker = models.ForeignKey(
+        Worker, on_delete=models.CASCADE)
+
+    workplace = models.ForeignKey(
+        WorkPlace, related_name='planned_shifts', on_delete=models.CASCADE)
+
+    @property
+    def hours(self):
+        return worked_hours(self.date, self.time_start, self.time_end)
+
+    class Meta:
+        ordering = ['date', 'time_start']
+        indexes = [
+            models.Index(
+                fields=['workplace', 'date'],
+                name='plannedshift_workplace_idx'),
+        ]
+
+
+class Heartbeat(models.Model):
+    """
+    Time of the last replica health check on the primary, replicas lag
+    by the difference to their copy
+    """
+    time = models.FloatField()
@@ -0,0 +1,67 @@
+"""
+Authentication backend keeping users' permission sets in the cache.
+
+Cache keys include a per-user and a global version. Signals bump the
+user's version when their permissions, groups or flags change and the
+global one when group permissions change, so stale sets are never read.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+from . import caching
+
+GLOBAL_VERSION_KEY = 'work:perms:version'
+
+
+def user_version_key(user_id):
+    return f'work:perms:version:{user_id}'
+
+
+def permissions_key(user_id):
+    versions = cache.get_many(
+        [GLOBAL_VERSION_KEY, user_version_key(user_id)])
+    return 'work:perms:{}:{}:{}'.format(
+        user_id, versions.get(user_version_key(user_id), 0),
+        versions.get(GLOBAL_VERSION_KEY, 0))
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_users(user_ids):
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: [
+        bump_version(user_version_key(user_id)) for user_id in user_ids])
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: bump_version(GLOBAL_VERSION_KEY))
+
+
+class CachedPermissionBackend(ModelBackend):
+    """
+    ModelBackend reading users' permission sets from the cache. With a
+    cache private to the process, other processes could not invalidate
+    the sets, so they are read from the database as by ModelBackend.
+    """
+    def get_all_permissions(self, user_obj, obj=None):
+        if not caching.is_shared():
+            return super().get_all_permissions(user_obj, obj)
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_key(user_obj.pk)
+            perms = cache.get(key)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                cache.set(
+                    key, perms, settings.WORK_PERMISSION_CACHE_TIMEOUT)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
@@ -0,0 +1,208 @@
+"""
+Greedy weekly shift planning.
+
+Staffing requirements of works are expanded into slots on the dates of a
+week. Slots are filled in chronological order with workers of approved
+workplaces of the work, preferring those with the most hours left under
+week_limit. A worker gets at most one shift a day, after their latest
+worktime, never overlapping another shift, which keeps the plan
+acceptable to the import rules it is published with.
+
+Plans are saved as PlannedShift drafts, which count in no statistics or
+worktime rules. Publishing a week turns its drafts into worktimes once
+the week is settled. With sharding on, planning runs in the current
+shard.
+"""
+import datetime
+import heapq
+from collections import defaultdict
+
+from django.db import router, transaction
+
+from . import imports, intervals, statistics
+from .models import (
+    PlannedShift, StaffingRequirement, Statistics, WorkPlace, APPROVED)
+
+
+class Slot:
+    """
+    Requirement on a date, with the workplaces assigned to it
+    """
+    def __init__(self, requirement, date):
+        self.requirement = requirement
+        self.date = date
+        self.interval = intervals.shift_interval(
+            date, requirement.time_start, requirement.time_end)
+        self.hours = (self.interval[1] - self.interval[0]) / 60
+        self.assigned = []
+
+    @property
+    def missing(self):
+        return self.requirement.headcount - len(self.assigned)
+
+
+class Planner:
+    """
+    Shift plan of a week for requirements of a company or a single work
+    """
+    def __init__(self, week, company=None, work=None):
+        self.week = statistics.week_start(week)
+        self.dates = [self.week + datetime.timedelta(days=i) for i in range(7)]
+
+        requirements = StaffingRequirement.objects.all()
+        if company is not None:
+            requirements = requirements.filter(work__company_id=company)
+        if work is not None:
+            requirements = requirements.filter(work_id=work)
+        self.slots = sorted((
+            Slot(requirement, self.dates[requirement.weekday])
+            for requirement in requirements),
+            key=lambda slot: slot.interval)
+
+        self.workplaces = {}
+        self.candidates = defaultdict(set)
+        self.remaining = {}
+        self.shifts = {}
+        self.last_dates = {}
+        self.days = defaultdict(set)
+        self.load_workplaces(WorkPlace.objects.filter(
+            work_id__in={slot.requirement.work_id for slot in self.slots}))
+
+    def load_workplaces(self, queryset):
+        workplaces = list(queryset.filter(status=APPROVED).only(
+            'id', 'worker_id', 'work_id', 'week_limit'))
+        worker_ids = [wp.worker_id for wp in workplaces]
+
+        worked = dict(Statistics.objects.filter(
+            workplace_id__in=[wp.id for wp in workplaces],
+            week=self.week).values_list('workplace_id', 'total_worked_time'))
+        self.shifts.update(intervals.worker_indexes(
+            worker_ids, self.dates[0], self.dates[-1]))
+        self.last_dates.update(imports.last_dates(worker_ids))
+
+        for wp in workplaces:
+            self.workplaces[wp.id] = wp
+            self.candidates[wp.work_id].add(wp.id)
+            self.remaining[wp.id] = wp.week_limit - worked.get(wp.id, 0)
+
+    def can_work(self, wp, slot):
+        last_date = self.last_dates.get(wp.worker_id)
+        return (
+            (last_date is None or last_date < slot.date)
+            and slot.date not in self.days[wp.worker_id]
+            and not self.shifts[wp.worker_id].overlaps(*slot.interval))
+
+    def assign(self, wp, slot):
+        slot.assigned.append(wp.id)
+        self.remaining[wp.id] -= slot.hours
+        self.days[wp.worker_id].add(slot.date)
+        self.shifts[wp.worker_id].add(*slot.interval)
+
+    def unassign(self, wp, slot):
+        slot.assigned.remove(wp.id)
+        self.remaining[wp.id] += slot.hours
+        self.days[wp.worker_id].discard(slot.date)
+        self.shifts[wp.worker_id].remove(*slot.interval)
+
+    def fill(self, slot):
+        heap = [
+            (-self.remaining[pk], pk)
+            for pk in self.candidates[slot.requirement.work_id]
+            if pk not in slot.assigned]
+        heapq.heapify(heap)
+        while heap and slot.missing > 0:
+            remaining, pk = heapq.heappop(heap)
+            if -remaining < slot.hours:
+                break
+            wp = self.workplaces[pk]
+            if self.can_work(wp, slot):
+                self.assign(wp, slot)
+
+    def plan(self):
+        for slot in self.slots:
+            if slot.missing > 0:
+                self.fill(slot)
+        return self
+
+    def replan_worker(self, worker_id):
+        """
+        Reload worker after a change of their workplace, limit or
+        worktimes and refill the slots they leave or that are still open
+        """
+        for wp in [wp for wp in self.workplaces.values()
+                   if wp.worker_id == worker_id]:
+            for slot in self.slots:
+                if wp.id in slot.assigned:
+                    self.unassign(wp, slot)
+            del self.workplaces[wp.id]
+            del self.remaining[wp.id]
+            self.candidates[wp.work_id].discard(wp.id)
+        self.shifts.pop(worker_id, None)
+        self.last_dates.pop(worker_id, None)
+        self.days.pop(worker_id, None)
+
+        self.load_workplaces(WorkPlace.objects.filter(
+            worker_id=worker_id,
+            work_id__in={slot.requirement.work_id for slot in self.slots}))
+        return self.plan()
+
+    def drafts(self):
+        """
+        Return the plan as unsaved PlannedShift rows ordered by date
+        """
+        return [
+            PlannedShift(
+                date=slot.date, time_start=slot.requirement.time_start,
+                time_end=slot.requirement.time_end,
+                worker_id=self.workplaces[pk].worker_id, workplace_id=pk)
+            for slot in self.slots for pk in slot.assigned]
+
+    def unfilled(self):
+        return [(slot, slot.missing) for slot in self.slots if slot.missing]
+
+
+def planned_shifts(week, company=None, work=None):
+    dates = (week, week + datetime.timedelta(days=6))
+    shifts = PlannedShift.objects.filter(date__range=dates)
+    if company is not None:
+        shifts = shifts.filter(workplace__work__company_id=company)
+    if work is not None:
+        shifts = shifts.filter(workplace__work_id=work)
+    return shifts
+
+
+def save_draft(planner):
+    """
+    Replace the drafts of the planner's week and works with its plan,
+    return the saved shifts
+    """
+    shifts = planner.drafts()
+    with transaction.atomic(using=router.db_for_write(PlannedShift)):
+        planned_shifts(planner.week).filter(workplace__work_id__in={
+            slot.requirement.work_id for slot in planner.slots}).delete()
+        return PlannedShift.objects.bulk_create(shifts)
+
+
+def publish(week, company=None, work=None, batch_size=imports.BATCH_SIZE):
+    """
+    Save drafts of a week as worktimes through the bulk import and delete
+    the published ones, return the import report. Rejected drafts are
+    kept.
+    """
+    week = statistics.week_start(week)
+    with transaction.atomic(using=router.db_for_write(PlannedShift)):
+        shifts = list(planned_shifts(week, company, work).order_by(
+            'date', 'time_start', 'id'))
+        report = imports.import_worktimes((
+            {
+                'worker': shift.worker_id,
+                'date': shift.date.isoformat(),
+                'time_start': shift.time_start.isoformat(),
+                'time_end': shift.time_end.isoformat(),
+            } for shift in shifts), batch_size)
+
+        rejected = {line for line, _ in report.errors}
+        PlannedShift.objects.filter(pk__in=[
+            shift.pk for line, shift in enumerate(shifts, 1)
+            if line not in rejected]).delete()
+    return report
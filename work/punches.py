@@ -0,0 +1,63 @@
+"""
+Punch queue: worktimes are appended to the PunchEvent table on
+submission and applied later in batches with the bulk import rules.
+
+A single applier process is expected to drain the queue, so events of a
+worker are applied in submission order.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import db, imports
+from .models import PunchEvent
+
+BATCH_SIZE = 1000
+
+
+@db.retry_locked(atomic=False)
+def enqueue(worker_id, form):
+    """
+    Append the worktime of a valid CreateWorkTimeForm to the queue
+    """
+    data = form.cleaned_data
+    return PunchEvent.objects.create(
+        worker_id=worker_id, date=data['date'],
+        time_start=data['time_start'], time_end=data['time_end'])
+
+
+@db.retry_locked
+def apply_pending(batch_size=BATCH_SIZE):
+    """
+    Apply up to batch_size pending events, return how many were processed
+    """
+    with transaction.atomic():
+        events = list(PunchEvent.objects.filter(
+            status=PunchEvent.PENDING).order_by('id')[:batch_size])
+        if not events:
+            return 0
+
+        report = imports.import_worktimes((
+            {
+                'worker': event.worker_id,
+                'date': event.date.isoformat(),
+                'time_start': event.time_start.isoformat(),
+                'time_end': event.time_end.isoformat(),
+            } for event in events), batch_size)
+
+        now = timezone.now()
+        rejected = defaultdict(list)
+        for line, message in report.errors:
+            rejected[message].append(events[line - 1].pk)
+
+        rejected_ids = {pk for pks in rejected.values() for pk in pks}
+        PunchEvent.objects.filter(
+            pk__in=[e.pk for e in events if e.pk not in rejected_ids]
+        ).update(status=PunchEvent.APPLIED, processed_date=now)
+        for message, pks in rejected.items():
+            PunchEvent.objects.filter(pk__in=pks).update(
+                status=PunchEvent.REJECTED, error=message[:200],
+                processed_date=now)
+
+    return len(events)
@@ -0,0 +1,160 @@
+"""
+Query builders for list and detail pages, each running a fixed number
+of queries regardless of the amount of rows shown.
+"""
+import datetime
+from itertools import chain
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Prefetch, Q
+
+from . import search, sharding
+from .models import (
+    Company, Manager, Work, Worker, WorkPlace, WorkTime, APPROVED, CANCELLED)
+
+# Autocomplete kind -> (model, fields of its text)
+CHOICES = {
+    'worker': (Worker, ('first_name', 'last_name')),
+    'company': (Company, ('name',)),
+    'work': (Work, ('name',)),
+    'manager': (Manager, ('first_name', 'last_name')),
+}
+
+
+def approved_workplaces():
+    return WorkPlace.objects.filter(
+        status=APPROVED).select_related('work__company')
+
+
+def companies():
+    """
+    Return companies ordered by id, a list collected from every shard
+    when sharding is on, a lazy queryset otherwise
+    """
+    if not sharding.enabled():
+        return Company.objects.all()
+    return sorted(
+        chain.from_iterable(sharding.fan_out(
+            lambda: list(Company.objects.all()))),
+        key=lambda company: company.pk)
+
+
+def workers_page(after=None, limit=50):
+    """
+    Return a page of workers with ids greater than after and the cursor of
+    the next page. Each worker gets approved_workplaces and working_now,
+    collected from every shard.
+    """
+    queryset = Worker.objects.order_by('id')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+
+    workers = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(workers) > limit:
+        workers = workers[:limit]
+        next_cursor = workers[-1].id
+
+    ids = [worker.id for worker in workers]
+    by_worker = {pk: [] for pk in ids}
+    if ids:
+        for wp in chain.from_iterable(sharding.fan_out(
+                lambda: list(approved_workplaces().filter(
+                    worker_id__in=ids)))):
+            by_worker[wp.worker_id].append(wp)
+
+    for worker in workers:
+        worker.approved_workplaces = by_worker[worker.id]
+        worker.working_now = bool(worker.approved_workplaces)
+    return workers, next_cursor
+
+
+def company_roster(company):
+    """
+    Return the works of company, each with the approved workers list
+    """
+    return list(company.works.prefetch_related(Prefetch(
+        'workplaces',
+        queryset=WorkPlace.objects.filter(
+            status=APPROVED).select_related('worker'),
+        to_attr='approved_workplaces')))
+
+
+def parse_cursor(cursor):
+    """
+    Parse a worktime history cursor of the form '<date>.<id>'
+    """
+    try:
+        date, pk = cursor.split('.')
+        return datetime.date.fromisoformat(date), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def worktime_history(workplace_id, before=None, date_from=None,
+                     date_to=None, limit=20):
+    """
+    Return a newest first slice of workplace worktimes older than the
+    before cursor, and the cursor of the next slice
+    """
+    queryset = WorkTime.objects.filter(
+        workplace_id=workplace_id).order_by('-date', '-id')
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    if before:
+        date, pk = before
+        queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+
+    worktimes = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(worktimes) > limit:
+        worktimes = worktimes[:limit]
+        next_cursor = f'{worktimes[-1].date.isoformat()}.{worktimes[-1].id}'
+    return worktimes, next_cursor
+
+
+def worker_workplaces(worker, date_from=None, date_to=None, limit=20):
+    """
+    Return worker's workplaces, each with the first slice of its history
+    """
+    workplaces = list(worker.workplaces.select_related('work__company'))
+    for wp in workplaces:
+        if wp.status == CANCELLED:
+            continue
+        wp.history, wp.next_cursor = worktime_history(
+            wp.id, date_from=date_from, date_to=date_to, limit=limit)
+    return workplaces
+
+
+def choices_page(kind, query='', company=None, page=1, size=20):
+    """
+    Return a page of (id, text) of objects of kind whose names match
+    query, or ordered by id without one, and whether more pages follow.
+    Works and managers are taken from the company's shard.
+    """
+    end = page * size + 1
+    if query.strip():
+        rows = [
+            (result['id'], result['name'])
+            for result in search.search_shards(query, [kind], company, end)]
+    else:
+        model, fields = CHOICES[kind]
+        queryset = model.objects.order_by('pk')
+        if company is not None:
+            queryset = queryset.filter(**{
+                'pk' if kind == 'company' else 'company_id': company})
+            aliases = [sharding.shard_for_company(company)]
+        elif kind == 'company':
+            aliases = sharding.shards()
+        else:
+            aliases = [DEFAULT_DB_ALIAS]
+        rows = sorted(
+            (pk, ' '.join(names))
+            for alias in aliases
+            for pk, *names in queryset.using(alias).values_list(
+                'pk', *fields)[:end])[:end]
+
+    rows = rows[(page - 1) * size:]
+    return rows[:size], len(rows) > size
@@ -0,0 +1,225 @@
+"""
+Payroll and timesheet reports computed with NumPy.
+
+Worktime columns are pulled in bulk into arrays, together with archived
+months, then durations, ISO weeks, overtime against WorkPlace.week_limit
+and totals per company, work and worker are computed with array
+operations. With sharding on, worktimes of every shard are read, or of
+the company's shard only.
+"""
+import datetime
+from itertools import chain, islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+
+from . import archive, sharding
+from .models import Statistics, WorkPlace, WorkTime, CANCELLED
+
+CHUNK_SIZE = 100000
+
+COLUMNS = (
+    ('workplace', 'workplace_id'),
+    ('worker', 'worker_id'),
+    ('work', 'workplace__work_id'),
+    ('company', 'workplace__work__company_id'),
+    ('week_limit', 'workplace__week_limit'),
+    ('date', 'date'),
+    ('start', 'time_start'),
+    ('end', 'time_end'),
+)
+
+
+def worktime_queryset(date_from=None, date_to=None, company=None):
+    queryset = WorkTime.objects.exclude(status=CANCELLED).order_by()
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    if company is not None:
+        queryset = queryset.filter(workplace__work__company_id=company)
+    return queryset
+
+
+def load_columns(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Read worktime columns into int64 arrays: ids, date ordinals and
+    times in seconds
+    """
+    rows = queryset.values_list(
+        *(path for _, path in COLUMNS)).iterator(chunk_size=chunk_size)
+    converters = [None] * 5 + [
+        datetime.date.toordinal, archive.seconds, archive.seconds]
+
+    chunks = {name: [] for name, _ in COLUMNS}
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for i, (name, _) in enumerate(COLUMNS):
+            convert = converters[i]
+            values = (
+                (row[i] for row in chunk) if convert is None
+                else (convert(row[i]) for row in chunk))
+            chunks[name].append(
+                np.fromiter(values, dtype=np.int64, count=len(chunk)))
+
+    return {
+        name: np.concatenate(parts) if parts else np.zeros(0, np.int64)
+        for name, parts in chunks.items()}
+
+
+def archived_columns(date_from=None, date_to=None, company=None):
+    """
+    Read non-cancelled archived worktimes into the columns of load_columns
+    """
+    parts = [
+        columns for _, columns in archive.select(
+            date_from, date_to, company=company, cancelled=False)]
+    if not parts:
+        return None
+    archived = {
+        name: np.concatenate([part[name] for part in parts]).astype(np.int64)
+        for name in ('workplace', 'worker', 'date', 'start', 'end')}
+
+    ids = np.unique(archived['workplace']).tolist()
+    workplaces = np.array(sorted(chain.from_iterable(sharding.fan_out(
+        lambda: list(WorkPlace.objects.filter(id__in=ids).values_list(
+            'id', 'work_id', 'work__company_id', 'week_limit'))))),
+        dtype=np.int64).reshape(-1, 4)
+    if not len(workplaces):
+        return None
+
+    # Rows of deleted workplaces are dropped
+    ids = workplaces[:, 0]
+    position = np.minimum(
+        np.searchsorted(ids, archived['workplace']), len(ids) - 1)
+    known = ids[position] == archived['workplace']
+
+    columns = {name: column[known] for name, column in archived.items()}
+    position = position[known]
+    columns['work'] = workplaces[position, 1]
+    columns['company'] = workplaces[position, 2]
+    columns['week_limit'] = workplaces[position, 3]
+    return columns
+
+
+def merge_columns(*parts):
+    parts = [part for part in parts if part is not None]
+    return {
+        name: np.concatenate([part[name] for part in parts])
+        for name, _ in COLUMNS}
+
+
+def group_sum(keys, values):
+    """
+    Sum values per distinct key, return (distinct keys, sums)
+    """
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=values, minlength=len(unique))
+
+
+class Report:
+    """
+    Worked hours and overtime for worktimes between date_from and date_to
+    """
+    def __init__(self, columns, date_from=None, date_to=None, company=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.company = company
+
+        # Shifts ending after midnight wrap around
+        hours = (columns['end'] - columns['start']) % 86400 / 3600
+        # ISO weeks start on Monday, ordinal 1 is Monday 0001-01-01
+        week = columns['date'] - (columns['date'] - 1) % 7
+
+        # Hours and overtime per workplace and week
+        keys, first, inverse = np.unique(
+            (columns['workplace'] << 32) | week,
+            return_index=True, return_inverse=True)
+        week_hours = np.bincount(
+            inverse, weights=hours, minlength=len(keys))
+
+        self.weeks = {
+            'workplace': keys >> 32,
+            'week': keys & 0xFFFFFFFF,
+            'worker': columns['worker'][first],
+            'work': columns['work'][first],
+            'company': columns['company'][first],
+            'hours': week_hours,
+            'overtime': np.maximum(
+                week_hours - columns['week_limit'][first], 0),
+        }
+
+    @classmethod
+    def build(cls, date_from=None, date_to=None, company=None):
+        queryset = worktime_queryset(date_from, date_to, company)
+        if company is not None:
+            aliases = [sharding.shard_for_company(company)]
+        else:
+            aliases = sharding.shards()
+        columns = merge_columns(
+            archived_columns(date_from, date_to, company),
+            *(load_columns(queryset.using(alias)) for alias in aliases))
+        return cls(columns, date_from, date_to, company)
+
+    def totals(self, by):
+        """
+        Return [(id, hours, overtime)] per company, work or worker
+        """
+        ids, hours = group_sum(self.weeks[by], self.weeks['hours'])
+        _, overtime = group_sum(self.weeks[by], self.weeks['overtime'])
+        return list(zip(ids.tolist(), hours.tolist(), overtime.tolist()))
+
+    def weekly(self):
+        """
+        Return [(workplace, worker, week, hours, overtime)]
+        """
+        return list(zip(
+            self.weeks['workplace'].tolist(), self.weeks['worker'].tolist(),
+            [datetime.date.fromordinal(w) for w in self.weeks['week']],
+            self.weeks['hours'].tolist(), self.weeks['overtime'].tolist()))
+
+
+def save_statistics(report, batch_size=5000):
+    """
+    Replace weekly Statistics rows in the report's range with its totals
+    and refresh lifetime totals. The range has to consist of whole weeks.
+    """
+    if sharding.enabled():
+        raise ValueError('Reports cannot be saved with sharding enabled, '
+                         'run rebuild_statistics instead')
+    if (report.date_from and report.date_from.weekday() != 0) or (
+            report.date_to and report.date_to.weekday() != 6):
+        raise ValueError('Report range has to start on Monday and end on '
+                         'Sunday to be saved')
+
+    scope = Statistics.objects.all()
+    if report.company is not None:
+        scope = scope.filter(workplace__work__company_id=report.company)
+
+    weekly = scope.exclude(week=None)
+    if report.date_from:
+        weekly = weekly.filter(week__gte=report.date_from)
+    if report.date_to:
+        weekly = weekly.filter(week__lte=report.date_to)
+
+    with transaction.atomic():
+        weekly.delete()
+        Statistics.objects.bulk_create((
+            Statistics(
+                workplace_id=workplace, worker_id=worker, week=week,
+                total_worked_time=hours)
+            for workplace, worker, week, hours, _ in report.weekly()),
+            batch_size=batch_size)
+
+        scope.filter(week=None).delete()
+        lifetime = list(scope.values('workplace_id', 'worker_id').annotate(
+            total=Sum('total_worked_time')))
+        Statistics.objects.bulk_create((
+            Statistics(
+                workplace_id=row['workplace_id'],
+                worker_id=row['worker_id'], week=None,
+                total_worked_time=row['total'])
+            for row in lifetime), batch_size=batch_size)
@@ -0,0 +1,153 @@
+"""
+Routing between company shards, the primary database and its replicas.
+
+Writes go to the primary. Reads go to a random healthy replica unless
+the current request is pinned to the primary, because it wrote or the
+client wrote shortly before (see ReplicaPinningMiddleware). Replicas are
+checked every WORK_REPLICA_CHECK_INTERVAL seconds and skipped when they
+fail or lag behind the primary by more than WORK_REPLICA_MAX_LAG. The
+lag is measured from heartbeats written to the primary by the
+replica_heartbeat command, reads never write.
+"""
+import logging
+import random
+import threading
+import time
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger('my_log')
+
+_request = Local()
+
+
+def pin():
+    _request.pinned = True
+
+
+def is_pinned():
+    return getattr(_request, 'pinned', False)
+
+
+def wrote():
+    return getattr(_request, 'wrote', False)
+
+
+def reset():
+    _request.pinned = False
+    _request.wrote = False
+
+
+def heartbeat(alias):
+    from .models import Heartbeat
+
+    return Heartbeat.objects.using(alias).filter(pk=1).values_list(
+        'time', flat=True).first()
+
+
+def beat():
+    from .models import Heartbeat
+
+    Heartbeat.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        pk=1, defaults={'time': time.time()})
+
+
+class ReplicaHealth:
+    """
+    Healthy replicas of the process, refreshed when checks get stale
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.healthy = []
+
+    def check(self):
+        """
+        Compare heartbeats of replicas to the primary's
+        """
+        try:
+            primary = heartbeat(DEFAULT_DB_ALIAS)
+        except DatabaseError:
+            logger.warning('Primary heartbeat is unavailable')
+            return []
+        healthy = []
+        for alias in settings.WORK_DATABASE_REPLICAS:
+            try:
+                replica = heartbeat(alias)
+            except DatabaseError:
+                logger.warning(f'Replica {alias} is unavailable')
+                continue
+            lag = 0 if primary is None else (
+                float('inf') if replica is None else primary - replica)
+            if lag > settings.WORK_REPLICA_MAX_LAG:
+                logger.warning(f'Replica {alias} lags by {lag:.1f}s')
+                continue
+            healthy.append(alias)
+        return healthy
+
+    def replicas(self):
+        if time.time() - self.checked > settings.WORK_REPLICA_CHECK_INTERVAL:
+            with self.lock:
+                if time.time() - self.checked > (
+                        settings.WORK_REPLICA_CHECK_INTERVAL):
+                    self.healthy = self.check()
+                    self.checked = time.time()
+        return self.healthy
+
+
+health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Reads in a transaction have to see its writes
+        if not settings.WORK_DATABASE_REPLICAS or is_pinned() or (
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        replicas = health.replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _request.wrote = True
+        pin()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+class ShardRouter:
+    """
+    Routing company data to the current shard, see work.sharding. Rows
+    of the default database are left to ReplicaRouter.
+    """
+    def shard(self, model, hints):
+        if not settings.WORK_SHARDS:
+            return None
+        from . import sharding
+
+        if model not in sharding.SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if type(instance) in sharding.SHARDED_MODELS and instance._state.db:
+            alias = instance._state.db
+        else:
+            alias = sharding.current()
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_read(self, model, **hints):
+        return self.shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.WORK_SHARDS:
+            return app_label == 'work'
+        return None
@@ -0,0 +1,195 @@
+"""
+Typeahead search over worker, company, work and manager names.
+
+Names are kept in two SQLite FTS5 tables: work_search, with prefix
+indexes, answers prefix queries and work_search_trigram matches
+fragments and misspelled names by shared trigrams. The rowid encodes the
+kind and the id of an object, the indexed tags column its kind and
+company, so filters are answered by the index too. Model signals keep
+the tables current, rebuild_search_index refills them after bulk loads.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+KINDS = ('worker', 'company', 'work', 'manager')
+SLOTS = 4
+TABLES = ('work_search', 'work_search_trigram')
+VOCABULARY = 'work_search_trigram_vocab'
+
+# kind -> query of (id, name, tags, company id) of every object
+SOURCES = {
+    'worker': (
+        "SELECT id, first_name || ' ' || last_name AS name, "
+        "'|worker|' AS tags, NULL AS company_id FROM work_worker"),
+    'company': (
+        "SELECT id, name, '|company| |c' || id || '|' AS tags, "
+        'id AS company_id FROM work_company'),
+    'work': (
+        "SELECT id, name, '|work| |c' || company_id || '|' AS tags, "
+        'company_id FROM work_work'),
+    'manager': (
+        "SELECT id, first_name || ' ' || last_name AS name, "
+        "'|manager| |c' || company_id || '|' AS tags, "
+        'company_id FROM work_manager'),
+}
+
+# Fuzzy matches are looked up by the rarest trigrams of the query and
+# only the first CANDIDATES of them are ranked, as ranking costs a few
+# microseconds a name
+FUZZY_TRIGRAMS = 3
+CANDIDATES = 1000
+
+
+def available(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'sqlite'
+
+
+def row_id(kind, pk):
+    return pk * SLOTS + KINDS.index(kind)
+
+
+def tags(kind, company_id=None):
+    if company_id is None:
+        return f'|{kind}|'
+    return f'|{kind}| |c{company_id}|'
+
+
+def index(kind, pk, name, company_id=None, using=DEFAULT_DB_ALIAS):
+    if not available(using):
+        return
+    with connections[using].cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {table} '
+                f'(rowid, name, tags, company_id) VALUES (%s, %s, %s, %s)',
+                [row_id(kind, pk), name, tags(kind, company_id), company_id])
+
+
+def remove(kind, pk, using=DEFAULT_DB_ALIAS):
+    if not available(using):
+        return
+    with connections[using].cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE rowid = %s', [row_id(kind, pk)])
+
+
+def rebuild(using=DEFAULT_DB_ALIAS, company=None):
+    """
+    Refill the tables, or the names of one company and its works
+    """
+    where, params = ('WHERE company_id = %s', [company]) if (
+        company is not None) else ('', [])
+    with connections[using].cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f'DELETE FROM {table} {where}', params)
+            for kind, source in SOURCES.items():
+                cursor.execute(
+                    f'INSERT INTO {table} (rowid, name, tags, company_id) '
+                    f'SELECT id * {SLOTS} + {KINDS.index(kind)}, name, '
+                    f'tags, company_id FROM ({source}) {where}', params)
+
+
+def quote(term):
+    return '"{}"'.format(term.replace('"', '""'))
+
+
+def expression(names, kinds, company):
+    """
+    Build an FTS5 query of the names expression limited by the tags
+    """
+    query = [f'name : ({names})']
+    if set(kinds) != set(KINDS):
+        query.append('tags : ({})'.format(
+            ' OR '.join(quote(f'|{kind}|') for kind in kinds)))
+    if company is not None:
+        query.append(f'tags : {quote(f"|c{company}|")}')
+    return ' AND '.join(query)
+
+
+def rarest(trigrams, using):
+    """
+    Return up to FUZZY_TRIGRAMS trigrams found in the fewest names
+    """
+    counts = []
+    with connections[using].cursor() as cursor:
+        for trigram in trigrams:
+            cursor.execute(
+                f'SELECT doc FROM {VOCABULARY} WHERE term = %s', [trigram])
+            row = cursor.fetchone()
+            if row:
+                counts.append((row[0], trigram))
+    return [trigram for _, trigram in sorted(counts)[:FUZZY_TRIGRAMS]]
+
+
+def run(table, query, exclude, limit, ranked, using):
+    sql = f'SELECT rowid, name, company_id{", rank" if ranked else ""} ' \
+          f'FROM {table} WHERE {table} MATCH %s'
+    if ranked:
+        sql = (f'SELECT rowid, name, company_id FROM ({sql} '
+               f'LIMIT {CANDIDATES}) ORDER BY rank')
+    params = [query]
+    if exclude:
+        sql = (f'SELECT * FROM ({sql}) WHERE rowid NOT IN '
+               f'({", ".join(["%s"] * len(exclude))})')
+        params.extend(exclude)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'{sql} LIMIT %s', params + [limit])
+        return cursor.fetchall()
+
+
+def search(query, kinds=KINDS, company=None, limit=10,
+           using=DEFAULT_DB_ALIAS):
+    """
+    Return up to limit {kind, id, name, company} of names starting with
+    the words of query, topped up with names sharing its rarest trigrams
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words or not kinds:
+        return []
+
+    rows = run(
+        'work_search',
+        expression(
+            ' '.join(f'{quote(word)}*' for word in words), kinds, company),
+        (), limit, False, using)
+
+    trigrams = {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+    if len(rows) < limit and trigrams:
+        trigrams = rarest(trigrams, using)
+    if len(rows) < limit and trigrams:
+        rows += run(
+            'work_search_trigram',
+            expression(' OR '.join(map(quote, trigrams)), kinds, company),
+            [rowid for rowid, _, _ in rows], limit - len(rows), True, using)
+
+    return [
+        {
+            'kind': KINDS[rowid % SLOTS],
+            'id': rowid // SLOTS,
+            'name': name,
+            'company': company_id,
+        } for rowid, name, company_id in rows]
+
+
+def search_shards(query, kinds=KINDS, company=None, limit=10):
+    """
+    Search the company's shard, or every shard with workers taken from
+    the default database only
+    """
+    from . import sharding
+
+    if company is not None:
+        return search(query, kinds, company, limit,
+                      sharding.shard_for_company(company))
+
+    results = []
+    for alias in sharding.shards():
+        if len(results) == limit:
+            break
+        if alias != DEFAULT_DB_ALIAS:
+            kinds = [kind for kind in kinds if kind != 'worker']
+        results += search(query, kinds, None, limit - len(results), alias)
+    return results
@@ -0,0 +1,254 @@
+"""
+Company sharding.
+
+Companies with their managers, works, workplaces, worktimes, planned
+shifts and statistics live in the shard the shard map assigns them, the
+default database otherwise. Workers are global: they are written to the
+default database and copied to every shard, so shard queries can join
+them.
+
+The current shard is kept per thread (or async context) and used by
+ShardRouter. The map of companies is reloaded when its file changes.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import caching, search
+
+from .models import (
+    Company, Manager, Work, Worker, WorkPlace, WorkTime, Statistics,
+    StaffingRequirement, PlannedShift, APPROVED)
+
+# Sharded models with their lookup of the company id, parents first
+COMPANY_LOOKUPS = (
+    (Company, 'id'),
+    (Manager, 'company_id'),
+    (Work, 'company_id'),
+    (StaffingRequirement, 'work__company_id'),
+    (WorkPlace, 'work__company_id'),
+    (WorkTime, 'workplace__work__company_id'),
+    (PlannedShift, 'workplace__work__company_id'),
+    (Statistics, 'workplace__work__company_id'),
+)
+SHARDED_MODELS = frozenset(model for model, _ in COMPANY_LOOKUPS)
+
+_current = Local()
+_map = {'mtime': None, 'companies': {}}
+
+
+def enabled():
+    return bool(settings.WORK_SHARDS)
+
+
+def shards():
+    return [DEFAULT_DB_ALIAS, *settings.WORK_SHARDS]
+
+
+def current():
+    return getattr(_current, 'alias', None)
+
+
+def set_current(alias):
+    _current.alias = alias
+
+
+@contextmanager
+def use_shard(alias):
+    previous = current()
+    set_current(alias)
+    try:
+        yield
+    finally:
+        set_current(previous)
+
+
+def fan_out(func, *args, **kwargs):
+    """
+    Call func in every shard, return the list of results
+    """
+    results = []
+    for alias in shards():
+        with use_shard(alias):
+            results.append(func(*args, **kwargs))
+    return results
+
+
+def read_map():
+    with open(settings.WORK_SHARD_MAP) as f:
+        return json.load(f)
+
+
+def company_shards():
+    if not enabled():
+        return {}
+    mtime = os.stat(settings.WORK_SHARD_MAP).st_mtime
+    if mtime != _map['mtime']:
+        _map['companies'] = {
+            int(pk): alias
+            for pk, alias in read_map().get('companies', {}).items()}
+        _map['mtime'] = mtime
+    return _map['companies']
+
+
+def shard_for_company(company_id):
+    return company_shards().get(int(company_id), DEFAULT_DB_ALIAS)
+
+
+def find_shard(model, pk):
+    """
+    Return the shard holding the row, the default database if none does
+    """
+    for alias in shards():
+        if model.objects.using(alias).filter(pk=pk).exists():
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def worker_shard(worker_id):
+    """
+    Return the shard of the worker's approved workplace
+    """
+    for alias in shards():
+        if WorkPlace.objects.using(alias).filter(
+                worker_id=worker_id, status=APPROVED).exists():
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def worker_shards(worker_ids):
+    """
+    Map workers with an approved workplace to its shard
+    """
+    if not enabled():
+        return {}
+    found = {}
+    for alias in shards():
+        found.update(dict.fromkeys(WorkPlace.objects.using(alias).filter(
+            worker_id__in=worker_ids, status=APPROVED).values_list(
+                'worker_id', flat=True), alias))
+    return found
+
+
+# URL names of views reading one shard -> kind of their pk
+VIEW_SHARD_KEYS = {
+    'comp_detail': 'company',
+    'manag_list': 'company',
+    'worker_detail': 'worker',
+    'create_worktime': 'worker',
+    'update_wp': 'workplace',
+    'worktime_history': 'workplace',
+}
+
+
+def view_shard(url_name, kwargs):
+    """
+    Return the shard a view reads, None for views of the default database
+    or fanning out
+    """
+    kind = VIEW_SHARD_KEYS.get(url_name)
+    if kind is None or 'pk' not in kwargs:
+        return None
+    if kind == 'company':
+        return shard_for_company(kwargs['pk'])
+    if kind == 'worker':
+        return worker_shard(kwargs['pk'])
+    return find_shard(WorkPlace, kwargs['pk'])
+
+
+def copy_workers(workers, aliases):
+    for alias in aliases:
+        for worker in workers:
+            Worker.objects.using(alias).update_or_create(
+                pk=worker.pk, defaults={
+                    'first_name': worker.first_name,
+                    'last_name': worker.last_name})
+
+
+def reserve_ids(alias):
+    """
+    Start ids of sharded tables of an SQLite shard at its id_start, so
+    rows keep their ids when companies move between shards
+    """
+    start = settings.WORK_SHARDS.get(alias, {}).get('id_start')
+    if not start or connections[alias].vendor != 'sqlite':
+        return
+    with connections[alias].cursor() as cursor:
+        for model in SHARDED_MODELS:
+            table = model._meta.db_table
+            cursor.execute(
+                'DELETE FROM sqlite_sequence WHERE name = %s AND seq < %s',
+                [table, start])
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                'WHERE NOT EXISTS '
+                '(SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                [table, start, table])
+
+
+def save_company_shard(company_id, alias):
+    shard_map = read_map()
+    companies = shard_map.setdefault('companies', {})
+    if alias == DEFAULT_DB_ALIAS:
+        companies.pop(str(company_id), None)
+    else:
+        companies[str(company_id)] = alias
+
+    tmp = f'{settings.WORK_SHARD_MAP}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(shard_map, f, indent=2)
+    os.replace(tmp, settings.WORK_SHARD_MAP)
+
+
+def move_company(company_id, target, batch_size=1000):
+    """
+    Copy a company's rows to the target shard, point the shard map at it
+    and remove the rows from the source shard. Return {model: rows}.
+    Writes of the company made meanwhile are lost.
+    """
+    source = shard_for_company(company_id)
+    if source == target:
+        raise ValueError(f'Company {company_id} is already in {target}')
+
+    moved = {}
+    with transaction.atomic(using=target):
+        worker_ids = set(WorkPlace.objects.using(source).filter(
+            work__company_id=company_id).values_list('worker_id', flat=True))
+        existing = set(Worker.objects.using(target).filter(
+            pk__in=worker_ids).values_list('pk', flat=True))
+        Worker.objects.using(target).bulk_create(
+            Worker.objects.using(DEFAULT_DB_ALIAS).filter(
+                pk__in=worker_ids - existing), batch_size=batch_size)
+
+        # Bulk copies send no signals, statistics are copied as they are
+        for model, lookup in COMPANY_LOOKUPS:
+            rows = model.objects.using(source).filter(
+                **{lookup: company_id}).order_by('pk')
+            moved[model] = 0
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    model.objects.using(target).bulk_create(batch)
+                    moved[model] += len(batch)
+                    batch = []
+            model.objects.using(target).bulk_create(batch)
+            moved[model] += len(batch)
+
+    save_company_shard(company_id, target)
+
+    with transaction.atomic(using=source):
+        for model, lookup in reversed(COMPANY_LOOKUPS):
+            rows = model.objects.using(source).filter(**{lookup: company_id})
+            rows._raw_delete(source)
+
+    for alias in (source, target):
+        if search.available(alias):
+            search.rebuild(alias, company_id)
+    caching.invalidate_companies([company_id], comp_list=True)
+    caching.touch(*(model for model, _ in COMPANY_LOOKUPS))
+    return moved
@@ -0,0 +1,207 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    post_init, pre_save, post_save, post_delete, m2m_changed, post_migrate)
+from django.dispatch import receiver
+
+from .models import (
+    Company, Manager, Work, Worker, WorkPlace, WorkTime, worked_hours)
+from . import (
+    caching, db, middleware, permissions, search, sharding, statistics)
+
+ROLLUP_FIELDS = (
+    'workplace_id', 'worker_id', 'date', 'time_start', 'time_end', 'status')
+
+
+def _snapshot(instance):
+    """
+    Remember the values a worktime contributes to Statistics
+    """
+    values = instance.__dict__
+    if instance.pk is None or any(f not in values for f in ROLLUP_FIELDS):
+        return None
+    return (
+        values['workplace_id'], values['worker_id'], values['date'],
+        worked_hours(
+            values['date'], values['time_start'], values['time_end']),
+        values['status'])
+
+
+@receiver(post_init, sender=WorkTime)
+def remember_worktime(sender, instance, **kwargs):
+    instance._rollup_previous = _snapshot(instance)
+
+
+@receiver(pre_save, sender=WorkTime)
+def load_previous_worktime(sender, instance, raw=False, using=None,
+                           **kwargs):
+    if raw or instance._state.adding:
+        return
+    if instance._rollup_previous is None:
+        previous = WorkTime.objects.using(using).filter(
+            pk=instance.pk).first()
+        if previous is not None:
+            instance._rollup_previous = _snapshot(previous)
+
+
+@receiver(post_save, sender=WorkTime)
+def rollup_saved_worktime(sender, instance, created, raw=False, using=None,
+                          **kwargs):
+    if raw:
+        return
+
+    deltas = defaultdict(float)
+    if not created and instance._rollup_previous is not None:
+        statistics.add_shift(deltas, *instance._rollup_previous, sign=-1)
+    statistics.add_worktime(deltas, instance)
+    with sharding.use_shard(using):
+        statistics.apply_deltas(deltas)
+
+    instance._rollup_previous = _snapshot(instance)
+
+
+@receiver(post_delete, sender=WorkTime)
+def rollup_deleted_worktime(sender, instance, using=None, **kwargs):
+    with sharding.use_shard(using):
+        statistics.apply_worktimes([instance], sign=-1)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_company(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.invalidate_companies([instance.pk], comp_list=True)
+
+
+@receiver(post_save, sender=Manager)
+@receiver(post_delete, sender=Manager)
+@receiver(post_save, sender=Work)
+@receiver(post_delete, sender=Work)
+def invalidate_company_member(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.invalidate_companies([instance.company_id])
+
+
+@receiver(post_save, sender=WorkPlace)
+@receiver(post_delete, sender=WorkPlace)
+def invalidate_workplace(sender, instance, raw=False, using=None,
+                         **kwargs):
+    if not raw:
+        caching.invalidate_companies(
+            Work.objects.using(using).filter(pk=instance.work_id).values_list(
+                'company_id', flat=True))
+
+
+@receiver(post_save, sender=Worker)
+def invalidate_worker(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        caching.invalidate_worker(instance.pk)
+
+
+@receiver(post_save, sender=Worker)
+def copy_worker(sender, instance, raw=False, using=None, **kwargs):
+    if not raw and using == DEFAULT_DB_ALIAS and sharding.enabled():
+        sharding.copy_workers([instance], settings.WORK_SHARDS)
+
+
+@receiver(post_delete, sender=Worker)
+def delete_worker_copies(sender, instance, using=None, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        for alias in settings.WORK_SHARDS:
+            Worker.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Worker)
+def index_worker(sender, instance, using=None, **kwargs):
+    search.index(
+        'worker', instance.pk, f'{instance.first_name} {instance.last_name}',
+        using=using)
+
+
+@receiver(post_save, sender=Company)
+def index_company(sender, instance, using=None, **kwargs):
+    search.index(
+        'company', instance.pk, instance.name, instance.pk, using=using)
+
+
+@receiver(post_save, sender=Work)
+def index_work(sender, instance, using=None, **kwargs):
+    search.index(
+        'work', instance.pk, instance.name, instance.company_id, using=using)
+
+
+@receiver(post_save, sender=Manager)
+def index_manager(sender, instance, using=None, **kwargs):
+    search.index(
+        'manager', instance.pk, f'{instance.first_name} {instance.last_name}',
+        instance.company_id, using=using)
+
+
+@receiver(post_delete, sender=Worker)
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Work)
+@receiver(post_delete, sender=Manager)
+def unindex_object(sender, instance, using=None, **kwargs):
+    search.remove(sender._meta.model_name, instance.pk, using=using)
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    sharding.reserve_ids(using)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=Work)
+@receiver(post_delete, sender=Work)
+@receiver(post_save, sender=Worker)
+@receiver(post_delete, sender=Worker)
+@receiver(post_save, sender=WorkPlace)
+@receiver(post_delete, sender=WorkPlace)
+@receiver(post_save, sender=WorkTime)
+@receiver(post_delete, sender=WorkTime)
+def touch_model(sender, raw=False, **kwargs):
+    if not raw:
+        caching.touch(sender)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_permissions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        permissions.invalidate_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_relations(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        permissions.invalidate_users([instance.pk])
+    elif action == 'post_clear' or pk_set is None:
+        permissions.invalidate_all()
+    else:
+        permissions.invalidate_users(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, **kwargs):
+    if action.startswith('post_'):
+        permissions.invalidate_all()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_deleted_group(sender, **kwargs):
+    permissions.invalidate_all()
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    db.apply_pragmas(connection)
+    middleware.install_query_recorder(connection)
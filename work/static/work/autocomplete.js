@@ -0,0 +1,90 @@
+// Fills select[data-autocomplete] with pages of choices matching a search
+// box. Scoped selects send the value of their scope field as company and
+// are cleared when it changes.
+(function () {
+  'use strict';
+
+  function setup(select) {
+    var input = document.createElement('input');
+    var scope = select.dataset.scope && select.form.elements[select.dataset.scope];
+    var timer = null;
+    var requests = 0;
+    var value = select.value;
+
+    input.type = 'search';
+    input.placeholder = 'Search';
+    input.autocomplete = 'off';
+    select.parentNode.insertBefore(input, select);
+
+    function render(data, page) {
+      var more = select.querySelector('option[data-more]');
+      if (more) {
+        more.remove();
+      }
+      if (page === 1) {
+        Array.from(select.options).forEach(function (option) {
+          if (option.value && !option.selected) {
+            option.remove();
+          }
+        });
+      }
+      data.results.forEach(function (result) {
+        if (!select.querySelector('option[value="' + result.id + '"]')) {
+          select.add(new Option(result.text, result.id));
+        }
+      });
+      if (data.more) {
+        more = new Option('More...', '');
+        more.dataset.more = page + 1;
+        select.add(more);
+      }
+    }
+
+    function load(page) {
+      var params = new URLSearchParams({q: input.value, page: page});
+      var request = ++requests;
+      if (scope) {
+        if (!scope.value) {
+          return;
+        }
+        params.set('company', scope.value);
+      }
+      fetch(select.dataset.autocomplete + '?' + params)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          if (request === requests && data.results) {
+            render(data, page);
+          }
+        });
+    }
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () { load(1); }, 250);
+    });
+    input.addEventListener('focus', function () {
+      if (!select.querySelector('option[value]:not([value=""])')) {
+        load(1);
+      }
+    });
+    select.addEventListener('change', function () {
+      var option = select.options[select.selectedIndex];
+      if (option && option.dataset.more) {
+        select.value = value;
+        load(Number(option.dataset.more));
+      } else {
+        value = select.value;
+      }
+    });
+    if (scope) {
+      scope.addEventListener('change', function () {
+        select.value = value = '';
+        load(1);
+      });
+    }
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-autocomplete]').forEach(setup);
+  });
+})();
@@ -0,0 +1,19 @@
+// Replaces a worktime history "Load more" item with the next slice,
+// which brings its own "Load more" when more worktimes follow.
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('a.load_more');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  fetch(link.href, {credentials: 'same-origin'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.statusText);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      link.closest('li').outerHTML = html;
+    });
+});
@@ -0,0 +1,108 @@
+"""
+Incremental rollups of worked time into the Statistics table.
+
+Every workplace has one row per ISO week (``week`` is the Monday) and one
+lifetime row (``week`` is NULL). Cancelled worktimes are not counted.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.db.models import Case, F, FloatField, Q, Sum, Value, When
+
+from .models import Statistics, CANCELLED
+
+
+def week_start(date):
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def worktime_key(workplace_id, worker_id, date):
+    return (workplace_id, worker_id, week_start(date))
+
+
+def add_shift(deltas, workplace_id, worker_id, date, hours, status, sign=1):
+    """
+    Add hours of a shift to deltas, keyed by (workplace, worker, week)
+    """
+    if status == CANCELLED:
+        return
+    deltas[worktime_key(workplace_id, worker_id, date)] += sign * hours
+
+
+def add_worktime(deltas, wt, sign=1):
+    add_shift(
+        deltas, wt.workplace_id, wt.worker_id, wt.date, wt.hours, wt.status,
+        sign)
+
+
+def apply_deltas(deltas, batch_size=500):
+    """
+    Apply weekly deltas to the weekly and lifetime Statistics rows
+    """
+    totals = defaultdict(float)
+    for (workplace_id, worker_id, week), hours in deltas.items():
+        if hours:
+            totals[(workplace_id, worker_id, week)] += hours
+            totals[(workplace_id, worker_id, None)] += hours
+
+    by_workplace = defaultdict(dict)
+    for (workplace_id, worker_id, week), hours in totals.items():
+        by_workplace[workplace_id][week] = (worker_id, hours)
+    workplace_ids = list(by_workplace)
+
+    # Statistics live in the shard being written
+    with transaction.atomic(using=router.db_for_write(Statistics)):
+        for i in range(0, len(workplace_ids), batch_size):
+            batch = workplace_ids[i:i + batch_size]
+            weeks = {
+                week for pk in batch for week in by_workplace[pk]} - {None}
+
+            increments = {}
+            for pk, workplace_id, week in Statistics.objects.filter(
+                    Q(week__in=weeks) | Q(week=None),
+                    workplace_id__in=batch).values_list(
+                        'id', 'workplace_id', 'week'):
+                delta = by_workplace[workplace_id].pop(week, None)
+                if delta is not None:
+                    increments[pk] = delta[1]
+
+            # Totals are incremented in the database, as one statement
+            if increments:
+                Statistics.objects.filter(pk__in=increments).update(
+                    total_worked_time=F('total_worked_time') + Case(
+                        *(When(pk=pk, then=Value(hours))
+                          for pk, hours in increments.items()),
+                        output_field=FloatField()))
+
+            Statistics.objects.bulk_create(
+                Statistics(
+                    workplace_id=pk, worker_id=worker_id, week=week,
+                    total_worked_time=hours)
+                for pk in batch
+                for week, (worker_id, hours) in by_workplace[pk].items())
+
+
+def apply_worktimes(worktimes, sign=1):
+    deltas = defaultdict(float)
+    for wt in worktimes:
+        add_worktime(deltas, wt, sign)
+    apply_deltas(deltas)
+
+
+def week_total(workplace_id, date):
+    return Statistics.objects.filter(
+        workplace_id=workplace_id, week=week_start(date)).values_list(
+            'total_worked_time', flat=True).first() or 0
+
+
+def workplace_total(workplace_id):
+    return Statistics.objects.filter(
+        workplace_id=workplace_id, week=None).values_list(
+            'total_worked_time', flat=True).first() or 0
+
+
+def worker_total(worker_id):
+    return Statistics.objects.filter(
+        worker_id=worker_id, week=None).aggregate(
+            total=Sum('total_worked_time'))['total'] or 0
@@ -1,3 +1,1860 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import runpy
+import shutil
+import tempfile
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import (
+    DatabaseError, IntegrityError, OperationalError, connection, connections,
+    transaction)
+from django.test import (
+    AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+
+from . import (
+    archive, db, exports, imports, intervals, middleware, planning, punches,
+    reports, routers, search, sharding, statistics, transitions, worktimes)
+from .forms import CreateWorkTimeForm
+from .models import (
+    Company, Manager, Work, Worker, WorkPlace, WorkTime, Statistics,
+    PlannedShift, PunchEvent, StaffingRequirement,
+    NEW, APPROVED, CANCELLED, FINISHED)
+
+
+def use_shared_cache(test):
+    """
+    Switch the test to a file cache, shared as in production
+    """
+    location = tempfile.mkdtemp()
+    shared = override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': location,
+    }})
+    shared.enable()
+    test.addCleanup(shutil.rmtree, location)
+    test.addCleanup(shared.disable)
+
+
+def use_shards(test, aliases=('s1', 's2')):
+    """
+    Add migrated SQLite shards to the test, with a shard map assigning
+    no company yet
+    """
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location)
+    shards = {
+        alias: {
+            'path': os.path.join(location, f'{alias}.sqlite3'),
+            'id_start': i * 1000000}
+        for i, alias in enumerate(aliases, 1)}
+    shard_map = os.path.join(location, 'shards.json')
+    with open(shard_map, 'w') as f:
+        json.dump({'shards': shards, 'companies': {}}, f)
+
+    sharded = override_settings(WORK_SHARD_MAP=shard_map, WORK_SHARDS=shards)
+    sharded.enable()
+    test.addCleanup(sharded.disable)
+    test.addCleanup(sharding._map.update, {'mtime': None, 'companies': {}})
+
+    for alias, shard in shards.items():
+        connections.databases[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': shard['path']}
+        test.addCleanup(connections.databases.pop, alias)
+        test.addCleanup(delattr, connections._connections, alias)
+        test.addCleanup(connections[alias].close)
+        call_command('migrate', database=alias, verbosity=0)
+
+
+def create_workplace(status=APPROVED, week_limit=40, company=None,
+                     worker=None, name='Cook'):
+    """
+    Create a workplace with its company, manager, work and worker
+    """
+    company = company or Company.objects.create(name='Acme')
+    manager = Manager.objects.create(
+        company=company, first_name='Ann', last_name='Lee',
+        email='ann@acme.com')
+    work = Work.objects.create(company=company, name=name)
+    worker = worker or Worker.objects.create(
+        first_name='Bob', last_name='Ray')
+    return WorkPlace.objects.create(
+        manager=manager, work=work, worker=worker, status=status,
+        week_limit=week_limit)
+
+
+class QueryCountTests(TestCase):
+    """
+    Guarding list and detail pages against per-row queries
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        manager = Manager.objects.create(
+            company=cls.company, first_name='Ann', last_name='Lee',
+            email='ann@acme.com')
+
+        for i in range(10):
+            work = Work.objects.create(company=cls.company, name=f'work{i}')
+            for j in range(3):
+                worker = Worker.objects.create(
+                    first_name=f'first{i}', last_name=f'last{j}')
+                WorkPlace.objects.create(
+                    manager=manager, work=work, worker=worker,
+                    status=APPROVED if j else NEW)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comp_detail_query_count(self):
+        url = reverse('work:comp_detail', kwargs={'pk': self.company.pk})
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+
+        self.assertContains(response, 'first0 last1')
+        self.assertNotContains(response, 'first0 last0')
+
+    def test_comp_detail_no_approved_workplaces(self):
+        Work.objects.create(company=self.company, name='empty')
+        url = reverse('work:comp_detail', kwargs={'pk': self.company.pk})
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+
+        self.assertContains(response, 'No approved workplaces.', count=1)
+
+    def test_worker_list_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('work:worker_list'))
+
+        self.assertContains(response, 'Not working now.', count=10)
+        self.assertContains(response, 'work9 at Acme')
+
+
+class PageCacheTests(TransactionTestCase):
+    """
+    Checking cached company pages are served without queries and are
+    invalidated by changes
+    """
+
+    def setUp(self):
+        use_shared_cache(self)
+        self.company = Company.objects.create(name='Acme')
+        self.manager = Manager.objects.create(
+            company=self.company, first_name='Ann', last_name='Lee',
+            email='ann@acme.com')
+        self.work = Work.objects.create(company=self.company, name='Cook')
+        self.worker = Worker.objects.create(first_name='Bob', last_name='Ray')
+        self.wp = WorkPlace.objects.create(
+            manager=self.manager, work=self.work, worker=self.worker)
+
+    def test_comp_detail_cached_until_approval(self):
+        url = reverse('work:comp_detail', kwargs={'pk': self.company.pk})
+        self.assertContains(self.client.get(url), 'No approved workplaces.')
+
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        self.client.post(
+            reverse('work:update_wp', kwargs={'pk': self.wp.pk}),
+            {'approve_btn': 'Approve'})
+        self.assertContains(self.client.get(url), 'Bob Ray')
+
+    def test_lists_invalidated_on_save(self):
+        comp_list = reverse('work:comp_list')
+        manag_list = reverse(
+            'work:manag_list', kwargs={'pk': self.company.pk})
+        self.client.get(comp_list)
+        self.client.get(manag_list)
+
+        Company.objects.create(name='Globex')
+        Manager.objects.create(
+            company=self.company, first_name='Tom', last_name='Fox',
+            email='tom@acme.com')
+
+        self.assertContains(self.client.get(comp_list), 'Globex')
+        self.assertContains(self.client.get(manag_list), 'Tom Fox')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_not_used(self):
+        url = reverse('work:comp_detail', kwargs={'pk': self.company.pk})
+        self.client.get(url)
+
+        # Another process could have approved the workplace meanwhile
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is SQLite specific')
+class IndexUsageTests(TestCase):
+    """
+    Checking that hot queries are served by an index
+    """
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertRegex(plan, r'USING (COVERING )?INDEX')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_approved_workplace_of_worker(self):
+        self.assertUsesIndex(
+            WorkPlace.objects.filter(worker_id=1, status=APPROVED))
+
+    def test_workplaces_ordering(self):
+        self.assertUsesIndex(WorkPlace.objects.all())
+
+    def test_last_worktime_of_worker(self):
+        self.assertUsesIndex(
+            WorkTime.objects.filter(worker_id=1).order_by('-id')[:1])
+
+    def test_worktime_history_of_workplace(self):
+        self.assertUsesIndex(
+            WorkTime.objects.filter(workplace_id=1).order_by('-date'))
+
+    def test_worktimes_ordering(self):
+        self.assertUsesIndex(WorkTime.objects.all())
+
+    def test_works_of_company(self):
+        self.assertUsesIndex(Work.objects.filter(company_id=1))
+
+    def test_weekly_statistics(self):
+        self.assertUsesIndex(Statistics.objects.filter(
+            workplace_id=1, week=datetime.date(2020, 1, 6)))
+
+
+class ConstraintTests(TestCase):
+
+    def test_one_approved_workplace_per_worker(self):
+        company = Company.objects.create(name='Acme')
+        manager = Manager.objects.create(
+            company=company, first_name='Ann', last_name='Lee',
+            email='ann@acme.com')
+        worker = Worker.objects.create(first_name='Bob', last_name='Ray')
+        for name in ('first', 'second'):
+            work = Work.objects.create(company=company, name=name)
+            WorkPlace.objects.create(
+                manager=manager, work=work, worker=worker, status=NEW)
+
+        WorkPlace.objects.filter(work__name='first').update(status=APPROVED)
+        with self.assertRaises(IntegrityError):
+            WorkPlace.objects.filter(
+                work__name='second').update(status=APPROVED)
+
+
+class StatisticsTests(TestCase):
+    """
+    Checking worktime changes are rolled up into Statistics
+    """
+
+    def setUp(self):
+        self.wp = create_workplace()
+        self.date = datetime.date(2024, 1, 3)
+
+    def create_worktime(self, date=None, status=NEW):
+        return WorkTime.objects.create(
+            date=date or self.date, time_start=datetime.time(9),
+            time_end=datetime.time(17), worker=self.wp.worker,
+            workplace=self.wp, status=status)
+
+    def assertTotals(self, week, lifetime):
+        self.assertEqual(statistics.week_total(self.wp.id, self.date), week)
+        self.assertEqual(statistics.workplace_total(self.wp.id), lifetime)
+        self.assertEqual(
+            statistics.worker_total(self.wp.worker_id), lifetime)
+
+    def test_create(self):
+        self.create_worktime()
+        self.create_worktime(self.date + datetime.timedelta(days=7))
+
+        self.assertTotals(8, 16)
+        self.assertEqual(Statistics.objects.count(), 3)
+
+    def test_approve_and_cancel(self):
+        wt = self.create_worktime()
+
+        wt.status = APPROVED
+        wt.save()
+        self.assertTotals(8, 8)
+
+        wt.status = CANCELLED
+        wt.save()
+        self.assertTotals(0, 0)
+
+        wt.status = APPROVED
+        wt.save()
+        self.assertTotals(8, 8)
+
+    def test_move_and_delete(self):
+        wt = WorkTime.objects.get(pk=self.create_worktime().pk)
+
+        wt.date += datetime.timedelta(days=7)
+        wt.save()
+        self.assertTotals(0, 8)
+
+        wt.delete()
+        self.assertTotals(0, 0)
+
+    def test_cancelled_worktime_not_counted(self):
+        self.create_worktime(status=CANCELLED)
+
+        self.assertTotals(0, 0)
+
+    def test_rebuild(self):
+        self.create_worktime()
+        self.create_worktime(self.date + datetime.timedelta(days=7))
+        self.create_worktime(status=CANCELLED)
+        Statistics.objects.update(total_worked_time=100)
+
+        call_command('rebuild_statistics', batch_size=1, stdout=io.StringIO())
+
+        self.assertTotals(8, 16)
+        self.assertEqual(Statistics.objects.count(), 3)
+
+    def test_rebuild_keeps_archived(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        # The week of January 29th spans the archived month and February
+        for day in (datetime.date(2024, 1, 31), datetime.date(2024, 2, 1)):
+            self.create_worktime(day)
+        self.create_worktime(datetime.date(2024, 1, 30), status=CANCELLED)
+        before = set(Statistics.objects.values_list(
+            'workplace_id', 'worker_id', 'week', 'total_worked_time'))
+
+        with override_settings(WORK_ARCHIVE_DIR=location):
+            archive.archive_before(datetime.date(2024, 2, 10))
+            self.assertEqual(WorkTime.objects.count(), 1)
+            call_command('rebuild_statistics', stdout=io.StringIO())
+
+        self.assertEqual(set(Statistics.objects.values_list(
+            'workplace_id', 'worker_id', 'week', 'total_worked_time')),
+            before)
+        self.assertEqual(statistics.workplace_total(self.wp.id), 16)
+
+    def test_apply_deltas_batched(self):
+        other = create_workplace(company=self.wp.work.company, name='Chef')
+        self.create_worktime()
+        week = statistics.week_start(self.date)
+        deltas = {
+            (self.wp.id, self.wp.worker_id, week): 2,
+            (other.id, other.worker_id, week): 3,
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            statistics.apply_deltas(deltas)
+
+        updates = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertTotals(10, 10)
+        self.assertEqual(statistics.workplace_total(other.id), 3)
+
+    def test_one_lifetime_row_per_workplace(self):
+        self.create_worktime()
+
+        with self.assertRaises(IntegrityError):
+            Statistics.objects.create(
+                workplace=self.wp, worker=self.wp.worker, week=None)
+
+
+class ReportTests(TestCase):
+    """
+    Checking payroll totals, weekly overtime and saved Statistics against
+    hand-computed hours
+    """
+
+    def setUp(self):
+        self.cook = create_workplace(week_limit=10)
+        self.guide = create_workplace(
+            company=Company.objects.create(name='Globex'))
+        shifts = (
+            # 8 + 6 hours in the week of 2024-01-01, 4 over the limit
+            (self.cook, 1, 9, 17, NEW),
+            (self.cook, 2, 9, 15, APPROVED),
+            (self.cook, 3, 9, 17, CANCELLED),
+            # 4 hours past midnight in the week of 2024-01-08
+            (self.cook, 8, 22, 2, NEW),
+            (self.guide, 1, 8, 12, NEW),
+        )
+        for wp, day, start, end, status in shifts:
+            WorkTime.objects.create(
+                date=datetime.date(2024, 1, day),
+                time_start=datetime.time(start), time_end=datetime.time(end),
+                worker=wp.worker, workplace=wp, status=status)
+
+    def test_totals(self):
+        report = reports.Report.build()
+
+        self.assertEqual(report.totals('worker'), [
+            (self.cook.worker_id, 18, 4), (self.guide.worker_id, 4, 0)])
+        self.assertEqual(report.totals('company'), [
+            (self.cook.work.company_id, 18, 4),
+            (self.guide.work.company_id, 4, 0)])
+
+        report = reports.Report.build(
+            datetime.date(2024, 1, 8), company=self.cook.work.company_id)
+        self.assertEqual(report.totals('workplace'), [(self.cook.pk, 4, 0)])
+
+    def test_weekly(self):
+        self.assertEqual(reports.Report.build().weekly(), [
+            (self.cook.pk, self.cook.worker_id,
+             datetime.date(2024, 1, 1), 14, 4),
+            (self.cook.pk, self.cook.worker_id,
+             datetime.date(2024, 1, 8), 4, 0),
+            (self.guide.pk, self.guide.worker_id,
+             datetime.date(2024, 1, 1), 4, 0)])
+
+    def test_overtime_threshold(self):
+        self.cook.week_limit = 14
+        self.cook.save()
+
+        totals = reports.Report.build().totals('workplace')
+        self.assertEqual(totals[0], (self.cook.pk, 18, 0))
+
+    def test_save_statistics(self):
+        Statistics.objects.all().delete()
+
+        reports.save_statistics(reports.Report.build(
+            datetime.date(2024, 1, 1), datetime.date(2024, 1, 7)))
+
+        self.assertEqual(
+            set(Statistics.objects.values_list(
+                'workplace_id', 'week', 'total_worked_time')), {
+                (self.cook.pk, datetime.date(2024, 1, 1), 14),
+                (self.guide.pk, datetime.date(2024, 1, 1), 4),
+                (self.cook.pk, None, 14),
+                (self.guide.pk, None, 4)})
+
+        with self.assertRaisesMessage(ValueError, 'start on Monday'):
+            reports.save_statistics(reports.Report.build(
+                datetime.date(2024, 1, 2), datetime.date(2024, 1, 7)))
+
+    def test_payroll_report_command(self):
+        out = io.StringIO()
+
+        call_command(
+            'payroll_report', '--by', 'workplace', '--from', '2024-01-01',
+            '--to', '2024-01-14', '--save', stdout=out, stderr=io.StringIO())
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            'workplace,hours,overtime',
+            f'{self.cook.pk},18.0,4.0',
+            f'{self.guide.pk},4.0,0.0'])
+        self.assertEqual(
+            statistics.workplace_total(self.cook.pk), 18)
+        with self.assertRaisesMessage(CommandError, 'end on Sunday'):
+            call_command(
+                'payroll_report', '--from', '2024-01-01', '--to',
+                '2024-01-10', '--save', stdout=io.StringIO(),
+                stderr=io.StringIO())
+
+
+class ArchiveTests(TestCase):
+    """
+    Checking archived months, and reads and writes around them
+    """
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        archived = override_settings(WORK_ARCHIVE_DIR=location)
+        archived.enable()
+        self.addCleanup(archived.disable)
+        self.wp = create_workplace()
+        self.month = datetime.date(2024, 1, 1)
+        for day, status in ((5, NEW), (2, APPROVED), (3, CANCELLED)):
+            self.create_worktime(datetime.date(2024, 1, day), status)
+        self.create_worktime(datetime.date(2024, 2, 1))
+
+    def create_worktime(self, date, status=NEW):
+        return WorkTime.objects.create(
+            date=date, time_start=datetime.time(9),
+            time_end=datetime.time(17), worker=self.wp.worker,
+            workplace=self.wp, status=status)
+
+    def archived_days(self):
+        return [
+            datetime.date.fromordinal(date).day
+            for date in archive.load_month(self.month)['date'].tolist()]
+
+    def test_archive_month(self):
+        self.assertEqual(archive.archive_month(self.month), 3)
+
+        self.assertEqual(archive.archived_months(), [self.month])
+        self.assertEqual(self.archived_days(), [2, 3, 5])
+        columns = archive.load_month(self.month)
+        self.assertEqual(columns['status'].tolist(), [
+            APPROVED, CANCELLED, NEW])
+        self.assertEqual(
+            set(columns['workplace'].tolist()), {self.wp.pk})
+        self.assertEqual(
+            list(WorkTime.objects.values_list('date', flat=True)),
+            [datetime.date(2024, 2, 1)])
+        self.assertEqual(archive.archived_until(), datetime.date(2024, 2, 1))
+
+        # Archived rows keep counting in Statistics
+        self.assertEqual(statistics.workplace_total(self.wp.pk), 24)
+
+    def test_archive_month_again(self):
+        archive.archive_month(self.month)
+        self.assertEqual(archive.archive_month(self.month), 0)
+        self.assertEqual(self.archived_days(), [2, 3, 5])
+
+        # Rows left behind are merged in date order
+        self.create_worktime(datetime.date(2024, 1, 4))
+        self.assertEqual(archive.archive_month(self.month), 1)
+        self.assertEqual(self.archived_days(), [2, 3, 4, 5])
+
+    def test_export_across_archive(self):
+        archive.archive_before(datetime.date(2024, 2, 1))
+
+        rows = list(exports.export_rows(chunk_size=1))
+        self.assertEqual(
+            [(row[1], row[5]) for row in rows], [
+                ('2024-01-02', 'Approved'), ('2024-01-03', 'Cancelled'),
+                ('2024-01-05', 'New'), ('2024-02-01', 'New')])
+        self.assertEqual(rows[0][6:], (
+            self.wp.worker_id, 'Bob', 'Ray', self.wp.pk, 'Cook', 'Acme'))
+
+        rows = exports.export_rows(
+            date_from=datetime.date(2024, 1, 3),
+            date_to=datetime.date(2024, 1, 31),
+            company=self.wp.work.company_id)
+        self.assertEqual(
+            [row[1] for row in rows], ['2024-01-03', '2024-01-05'])
+
+    def test_report_across_archive(self):
+        live = reports.Report.build().weekly()
+
+        archive.archive_before(datetime.date(2024, 2, 1))
+
+        self.assertEqual(reports.Report.build().weekly(), live)
+        self.assertEqual(
+            reports.Report.build(datetime.date(2024, 1, 3)).totals('worker'),
+            [(self.wp.worker_id, 16, 0)])
+
+    def test_archived_period_rejected(self):
+        archive.archive_before(datetime.date(2024, 2, 1))
+        WorkTime.objects.all().delete()
+
+        form = CreateWorkTimeForm({
+            'date': '01/20/2024', 'time_start': '09:00',
+            'time_end': '17:00'})
+        self.assertTrue(form.is_valid())
+        self.assertIsNone(worktimes.submit_worktime(self.wp.worker, form))
+        self.assertEqual(form.errors, {'date': ['Period is archived.']})
+
+        report = imports.import_worktimes(imports.read_rows(io.StringIO(
+            'worker,date,time_start,time_end\n'
+            f'{self.wp.worker_id},2024-01-20,09:00,17:00\n'
+            f'{self.wp.worker_id},2024-02-02,09:00,17:00\n'), 'csv'))
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.errors, [(1, 'Period is archived.')])
+
+
+class WeekLimitTests(TestCase):
+    """
+    Checking worktimes over the workplace's week limit are rejected
+    """
+
+    def setUp(self):
+        self.wp = create_workplace(week_limit=10)
+        self.url = reverse(
+            'work:create_worktime', kwargs={'pk': self.wp.worker_id})
+
+    def submit(self, date):
+        return self.client.post(self.url, {
+            'date': date, 'time_start': '09:00', 'time_end': '17:00'})
+
+    def test_over_limit_rejected(self):
+        self.assertEqual(self.submit('2024-01-01').status_code, 302)
+
+        self.assertContains(self.submit('2024-01-02'), 'Week limit exceeded.')
+        self.assertEqual(WorkTime.objects.count(), 1)
+
+        # Next week starts from zero
+        self.assertEqual(self.submit('2024-01-08').status_code, 302)
+
+    def test_cancelled_worktime_frees_hours(self):
+        self.submit('2024-01-01')
+        wt = WorkTime.objects.get()
+        wt.status = CANCELLED
+        wt.save()
+
+        self.assertEqual(self.submit('2024-01-02').status_code, 302)
+        self.assertEqual(
+            statistics.week_total(self.wp.id, datetime.date(2024, 1, 2)), 8)
+
+
+class WorktimeHistoryTests(TestCase):
+    """
+    Checking worktime history is paged by cursor and limited to a window
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.wp = create_workplace()
+        cls.user = User.objects.create_user('ann', password='secret')
+        start = datetime.date(2024, 1, 1)
+        WorkTime.objects.bulk_create(
+            WorkTime(
+                date=start + datetime.timedelta(days=i),
+                time_start=datetime.time(9), time_end=datetime.time(10),
+                worker=cls.wp.worker, workplace=cls.wp)
+            for i in range(25))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_worker_detail_shows_first_slice(self):
+        response = self.client.get(
+            reverse('work:worker_detail', kwargs={'pk': self.wp.worker_id}))
+
+        self.assertContains(response, 'Date: ', count=20)
+        self.assertContains(response, '25.01.2024')
+        self.assertNotContains(response, '05.01.2024')
+        self.assertContains(response, 'before=2024-01-06.')
+        self.assertContains(response, 'work/history.js')
+
+    def test_next_slice_by_cursor(self):
+        newest = WorkTime.objects.order_by('-date')[19]
+        url = reverse('work:worktime_history', kwargs={'pk': self.wp.pk})
+
+        response = self.client.get(
+            url, {'before': f'{newest.date.isoformat()}.{newest.pk}'})
+
+        self.assertContains(response, 'Date: ', count=5)
+        self.assertContains(response, '05.01.2024')
+        self.assertNotContains(response, '06.01.2024')
+        self.assertNotContains(response, 'Load more')
+
+    def test_date_window(self):
+        url = reverse('work:worktime_history', kwargs={'pk': self.wp.pk})
+
+        response = self.client.get(
+            url, {'from': '2024-01-03', 'to': '2024-01-07'})
+
+        self.assertContains(response, 'Date: ', count=5)
+        self.assertContains(response, '07.01.2024')
+        self.assertContains(response, '03.01.2024')
+        self.assertNotContains(response, 'Load more')
+
+    def test_window_kept_in_load_more(self):
+        response = self.client.get(
+            reverse('work:worker_detail', kwargs={'pk': self.wp.worker_id}),
+            {'to': '2024-01-22'})
+
+        self.assertContains(response, '22.01.2024')
+        self.assertNotContains(response, '23.01.2024')
+        self.assertContains(response, 'to=2024-01-22')
+
+    def test_invalid_cursor_starts_from_newest(self):
+        url = reverse('work:worktime_history', kwargs={'pk': self.wp.pk})
+
+        response = self.client.get(url, {'before': 'bogus'})
+
+        self.assertContains(response, '25.01.2024')
+
+
+class OverlapTests(TestCase):
+    """
+    Checking shifts of a worker never overlap, overnight ones included
+    """
+
+    def setUp(self):
+        self.wp = create_workplace()
+        self.worker = self.wp.worker
+
+    def form(self, date, time_start, time_end):
+        return CreateWorkTimeForm({
+            'date': date, 'time_start': time_start, 'time_end': time_end})
+
+    def submit(self, date, time_start, time_end):
+        form = self.form(date, time_start, time_end)
+        self.assertTrue(form.is_valid(), form.errors)
+        return worktimes.submit_worktime(self.worker, form), form
+
+    def test_form_accepts_overnight_shift(self):
+        form = self.form('01/01/2024', '22:00', '06:00')
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_form_rejects_empty_shift(self):
+        form = self.form('01/01/2024', '09:00', '09:00')
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), ['Incorrect time values.'])
+
+    def test_overnight_shift_overlaps_next_day(self):
+        self.assertIsNotNone(self.submit('01/01/2024', '22:00', '06:00')[0])
+
+        worktime, form = self.submit('01/02/2024', '05:00', '09:00')
+
+        self.assertIsNone(worktime)
+        self.assertEqual(
+            form.non_field_errors(), ['Worktime overlaps another worktime.'])
+
+    def test_touching_shifts_do_not_overlap(self):
+        self.assertIsNotNone(self.submit('01/01/2024', '22:00', '06:00')[0])
+        self.assertIsNotNone(self.submit('01/02/2024', '06:00', '14:00')[0])
+        self.assertEqual(WorkTime.objects.count(), 2)
+
+    def test_cancelled_shift_ignored(self):
+        WorkTime.objects.create(
+            date=datetime.date(2024, 1, 1), time_start=datetime.time(22),
+            time_end=datetime.time(6), worker=self.worker, workplace=self.wp,
+            status=CANCELLED)
+
+        self.assertFalse(intervals.overlaps_existing(
+            self.worker.pk, datetime.date(2024, 1, 2),
+            datetime.time(5), datetime.time(9)))
+
+
+class ImportTests(TestCase):
+    """
+    Checking timesheet imports keep valid rows and report the others
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.wp = create_workplace(week_limit=20)
+        self.worker = self.wp.worker
+        self.idle = Worker.objects.create(first_name='Tom', last_name='Fox')
+
+    def import_csv(self, text, batch_size=imports.BATCH_SIZE):
+        return imports.import_worktimes(
+            imports.read_rows(io.StringIO(text), 'csv'), batch_size)
+
+    def test_csv_mixed_rows(self):
+        report = self.import_csv(
+            'worker,date,time_start,time_end\n'
+            f'{self.worker.pk},2024-01-01,09:00,17:00\n'
+            f'{self.worker.pk},2024-01-02,09:00,17:00\n'
+            f'{self.worker.pk},2024-01-02,18:00,19:00\n'
+            f'{self.worker.pk},2024-01-03,09:00,17:00\n'
+            f'{self.worker.pk},2024-01-08,22:00,06:00\n'
+            f'{self.idle.pk},2024-01-08,09:00,17:00\n'
+            'abc,2024-01-08,09:00,17:00\n'
+            f'{self.worker.pk},2024-13-40,09:00,17:00\n', batch_size=3)
+
+        self.assertEqual(report.created, 3)
+        self.assertEqual(report.errors, [
+            (3, 'Incorrect date value.'),
+            (4, 'Week limit exceeded.'),
+            (6, 'Worker has no approved workplace.'),
+            (7, 'Incorrect worker value.'),
+            (8, 'Enter a valid date.'),
+        ])
+        self.assertEqual(statistics.worker_total(self.worker.pk), 24)
+
+    def test_overlap_in_batch(self):
+        report = self.import_csv(
+            'worker,date,time_start,time_end\n'
+            f'{self.worker.pk},2024-01-08,22:00,06:00\n'
+            f'{self.worker.pk},2024-01-09,05:00,07:00\n'
+            f'{self.worker.pk},2024-01-10,06:00,07:00\n')
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual(
+            report.errors, [(2, 'Worktime overlaps another worktime.')])
+
+    def test_last_date_rule(self):
+        for day in (4, 5):
+            WorkTime.objects.create(
+                date=datetime.date(2024, 1, day),
+                time_start=datetime.time(9), time_end=datetime.time(10),
+                worker=self.worker, workplace=self.wp)
+
+        report = self.import_csv(
+            'worker,date,time_start,time_end\n'
+            f'{self.worker.pk},2024-01-05,11:00,12:00\n'
+            f'{self.worker.pk},2024-01-06,11:00,12:00\n')
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.errors, [(1, 'Incorrect date value.')])
+
+    def test_jsonl_untyped_values(self):
+        lines = [
+            f'{{"worker": {self.worker.pk}, "date": "2024-01-01", '
+            f'"time_start": "09:00", "time_end": "10:00"}}',
+            f'{{"worker": {self.worker.pk}, "date": 20240102, '
+            f'"time_start": "09:00", "time_end": "10:00"}}',
+            f'{{"worker": {self.worker.pk}, "date": null, '
+            f'"time_start": [9], "time_end": "10:00"}}',
+            'not json',
+        ]
+
+        report = imports.import_worktimes(imports.read_rows(lines, 'jsonl'))
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual([line for line, _ in report.errors], [2, 3, 4])
+        self.assertEqual(report.errors[0][1], 'Enter a valid date.')
+        self.assertEqual(report.errors[2][1], 'Incorrect worker value.')
+
+    def test_upload(self):
+        user = User.objects.create_user('ann', password='secret')
+        user.user_permissions.add(
+            Permission.objects.get(codename='add_worktime'))
+        self.client.force_login(user)
+        upload = io.BytesIO(
+            f'{{"worker": {self.worker.pk}, "date": "2024-01-10", '
+            f'"time_start": "09:00", "time_end": "10:00"}}\n'
+            f'{{"worker": {self.worker.pk}, "date": 5}}\n'.encode())
+        upload.name = 'timesheet.jsonl'
+
+        response = self.client.post(
+            reverse('work:import_worktimes'),
+            {'file': upload, 'format': 'jsonl'})
+
+        self.assertContains(response, 'Imported 1 worktimes.')
+        self.assertContains(response, 'Row 2: Enter a valid date.')
+
+    def test_upload_not_utf8(self):
+        user = User.objects.create_user('ann', password='secret')
+        user.user_permissions.add(
+            Permission.objects.get(codename='add_worktime'))
+        self.client.force_login(user)
+        upload = io.BytesIO(
+            'worker,date,time_start,time_end\n'
+            f'{self.worker.pk},2024-01-10,09:00,10:00\n'.encode()
+            + b'\xff\xfe,2024-01-11,09:00,10:00\n')
+        upload.name = 'timesheet.csv'
+
+        response = self.client.post(
+            reverse('work:import_worktimes'),
+            {'file': upload, 'format': 'csv'})
+
+        self.assertContains(response, 'Imported 1 worktimes.')
+        self.assertContains(
+            response, 'Row 2: Line is not UTF-8 text, import stopped.')
+
+
+class PunchQueueTests(TestCase):
+    """
+    Checking punched worktimes are queued, applied and reported
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.wp = create_workplace()
+        self.worker = self.wp.worker
+
+    def punch(self, worker, date, time_start='09:00', time_end='17:00'):
+        return self.client.post(reverse('work:punch'), {
+            'worker': worker, 'date': date,
+            'time_start': time_start, 'time_end': time_end})
+
+    def status(self, response):
+        return self.client.get(response.json()['url']).json()
+
+    def test_enqueue_apply_status(self):
+        response = self.punch(self.worker.pk, '2024-01-01')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'Pending')
+        self.assertFalse(WorkTime.objects.exists())
+
+        self.assertEqual(punches.apply_pending(), 1)
+
+        self.assertEqual(self.status(response), {
+            'id': response.json()['id'], 'status': 'Applied', 'error': ''})
+        worktime = WorkTime.objects.get()
+        self.assertEqual(worktime.workplace, self.wp)
+        self.assertEqual(worktime.date, datetime.date(2024, 1, 1))
+        self.assertEqual(punches.apply_pending(), 0)
+
+    def test_rejected_events_keep_error(self):
+        idle = Worker.objects.create(first_name='Tom', last_name='Fox')
+        applied = self.punch(self.worker.pk, '2024-01-02')
+        earlier = self.punch(self.worker.pk, '2024-01-01')
+        unemployed = self.punch(idle.pk, '2024-01-02')
+        unknown = self.punch(idle.pk + 1, '2024-01-02')
+
+        self.assertEqual(punches.apply_pending(), 4)
+
+        self.assertEqual(self.status(applied)['status'], 'Applied')
+        for response, error in (
+                (earlier, 'Incorrect date value.'),
+                (unemployed, 'Worker has no approved workplace.'),
+                (unknown, 'Worker has no approved workplace.')):
+            status = self.status(response)
+            self.assertEqual(status['status'], 'Rejected')
+            self.assertEqual(status['error'], error)
+        self.assertEqual(WorkTime.objects.count(), 1)
+
+    def test_applied_in_submission_order(self):
+        first = self.punch(self.worker.pk, '2024-01-01')
+        second = self.punch(self.worker.pk, '2024-01-02')
+
+        self.assertEqual(punches.apply_pending(batch_size=1), 1)
+        self.assertEqual(self.status(first)['status'], 'Applied')
+        self.assertEqual(self.status(second)['status'], 'Pending')
+        self.assertEqual(punches.apply_pending(batch_size=1), 1)
+        self.assertEqual(self.status(second)['status'], 'Applied')
+
+    def test_invalid_punch_not_queued(self):
+        response = self.punch('abc', '2024-01-01')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'errors': {'worker': ['Incorrect worker value.']}})
+
+        response = self.punch(self.worker.pk, 'not a date')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.json()['errors'])
+        self.assertFalse(PunchEvent.objects.exists())
+
+
+class PlanningTests(TestCase):
+    """
+    Checking planned shifts stay drafts until the week is published
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.wp = create_workplace(week_limit=16)
+        self.worker = self.wp.worker
+        for weekday in range(3):
+            StaffingRequirement.objects.create(
+                work=self.wp.work, weekday=weekday,
+                time_start=datetime.time(9), time_end=datetime.time(17))
+        self.week = datetime.date(2024, 1, 8)
+
+    def plan(self):
+        planner = planning.Planner(self.week).plan()
+        planning.save_draft(planner)
+        return planner
+
+    def test_plan_respects_week_limit(self):
+        planner = self.plan()
+
+        self.assertEqual(
+            [shift.date for shift in planner.drafts()],
+            [datetime.date(2024, 1, 8), datetime.date(2024, 1, 9)])
+        self.assertEqual(len(planner.unfilled()), 1)
+
+    def test_drafts_count_nowhere(self):
+        self.plan()
+
+        self.assertEqual(PlannedShift.objects.count(), 2)
+        self.assertFalse(WorkTime.objects.exists())
+        self.assertFalse(Statistics.objects.exists())
+
+        form = CreateWorkTimeForm({
+            'date': '01/03/2024', 'time_start': '09:00',
+            'time_end': '17:00'})
+        self.assertTrue(form.is_valid())
+        self.assertIsNotNone(worktimes.submit_worktime(self.worker, form))
+
+    def test_save_draft_replaces_plan(self):
+        self.plan()
+        self.wp.week_limit = 40
+        self.wp.save()
+
+        self.plan()
+
+        self.assertEqual(PlannedShift.objects.count(), 3)
+
+    def test_publish(self):
+        self.plan()
+
+        report = planning.publish(self.week)
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual(report.errors, [])
+        self.assertFalse(PlannedShift.objects.exists())
+        self.assertEqual(statistics.week_total(self.wp.pk, self.week), 16)
+
+    def test_publish_keeps_rejected_drafts(self):
+        self.plan()
+        WorkTime.objects.create(
+            date=datetime.date(2024, 1, 8), time_start=datetime.time(6),
+            time_end=datetime.time(8), worker=self.worker, workplace=self.wp)
+
+        report = planning.publish(self.week)
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.errors, [(1, 'Incorrect date value.')])
+        self.assertEqual(
+            list(PlannedShift.objects.values_list('date', flat=True)),
+            [datetime.date(2024, 1, 8)])
+
+
+class TransitionTests(TestCase):
+    """
+    Checking approvals keep one approved workplace per worker
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.worker = Worker.objects.create(first_name='Bob', last_name='Ray')
+        self.old, self.new, self.other = (
+            create_workplace(
+                status, company=self.company, worker=self.worker, name=name)
+            for status, name in (
+                (APPROVED, 'old'), (NEW, 'new'), (NEW, 'other')))
+
+    def status(self, wp):
+        return WorkPlace.objects.get(pk=wp.pk).status
+
+    def test_approve_finishes_previous_and_cancels_other_new(self):
+        self.assertEqual(
+            transitions.approve_workplaces([self.new.pk]), [self.new.pk])
+
+        self.assertEqual(self.status(self.new), APPROVED)
+        self.assertEqual(self.status(self.old), FINISHED)
+        self.assertEqual(self.status(self.other), CANCELLED)
+
+    def test_first_given_wins(self):
+        self.assertEqual(
+            transitions.approve_workplaces([self.other.pk, self.new.pk]),
+            [self.other.pk])
+
+        self.assertEqual(self.status(self.other), APPROVED)
+        self.assertEqual(self.status(self.new), CANCELLED)
+
+    def test_bulk_endpoint_approves_only_new(self):
+        user = User.objects.create_user('ann', password='secret')
+        user.user_permissions.add(Permission.objects.get(codename='can_hire'))
+        self.client.force_login(user)
+        WorkPlace.objects.filter(pk=self.other.pk).update(status=CANCELLED)
+        finished = create_workplace(
+            FINISHED, company=self.company, name='finished')
+
+        response = self.client.post(reverse('work:approve_wps'), {
+            'workplace': [self.old.pk, self.other.pk, finished.pk]})
+
+        self.assertEqual(response.json(), {'approved': []})
+        self.assertEqual(self.status(self.old), APPROVED)
+        self.assertEqual(self.status(self.other), CANCELLED)
+        self.assertEqual(self.status(finished), FINISHED)
+
+
+class PermissionCacheTests(TransactionTestCase):
+    """
+    Checking cached permission sets are invalidated by every change of
+    users' permissions and groups
+    """
+
+    def setUp(self):
+        use_shared_cache(self)
+        self.user = User.objects.create_user('ann', password='secret')
+        self.group = Group.objects.create(name='hr')
+        self.permission = Permission.objects.get(codename='can_hire')
+
+    def has_perm(self):
+        # A fresh user object, as loaded by the next request
+        return User.objects.get(pk=self.user.pk).has_perm('work.can_hire')
+
+    def test_cached_set_read_without_queries(self):
+        self.has_perm()
+        user = User.objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(user.has_perm('work.can_hire'))
+
+    def test_user_permissions(self):
+        self.assertFalse(self.has_perm())
+
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+
+        self.user.user_permissions.remove(self.permission)
+        self.assertFalse(self.has_perm())
+
+        self.permission.user_set.add(self.user)
+        self.assertTrue(self.has_perm())
+
+        self.permission.user_set.clear()
+        self.assertFalse(self.has_perm())
+
+    def test_groups(self):
+        self.group.permissions.add(self.permission)
+        self.assertFalse(self.has_perm())
+
+        self.user.groups.add(self.group)
+        self.assertTrue(self.has_perm())
+
+        self.user.groups.clear()
+        self.assertFalse(self.has_perm())
+
+        self.group.user_set.add(self.user)
+        self.assertTrue(self.has_perm())
+
+    def test_group_permissions(self):
+        self.user.groups.add(self.group)
+        self.assertFalse(self.has_perm())
+
+        self.group.permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+
+        self.group.permissions.remove(self.permission)
+        self.assertFalse(self.has_perm())
+
+        self.group.permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        self.group.delete()
+        self.assertFalse(self.has_perm())
+
+    def test_deactivated_user(self):
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.has_perm())
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_not_used(self):
+        self.user.user_permissions.add(self.permission)
+        self.has_perm()
+        user = User.objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(2):
+            self.assertTrue(user.has_perm('work.can_hire'))
+
+
+class ConditionalApiTests(TransactionTestCase):
+    """
+    Checking unchanged API lists are answered with 304 until a write
+    """
+
+    def setUp(self):
+        use_shared_cache(self)
+        Company.objects.create(name='Acme')
+        self.url = reverse('work:api_companies')
+
+    def test_not_modified_until_write(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Company.objects.create(name='Globex')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Globex')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_change_in_same_second_not_hidden(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        Company.objects.create(name='Globex')
+
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 1))
+        self.assertContains(response, 'Globex')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_not_used(self):
+        response = self.client.get(self.url)
+
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, 200)
+
+
+class ApiTests(TestCase):
+    """
+    Checking API cursors, field selection, filters and authentication
+    """
+
+    def setUp(self):
+        self.workplace = create_workplace()
+        self.other = create_workplace(
+            company=Company.objects.create(name='Globex'), status=NEW)
+        for day in (1, 2, 3):
+            WorkTime.objects.create(
+                date=datetime.date(2024, 1, day),
+                time_start=datetime.time(9), time_end=datetime.time(17),
+                worker=self.workplace.worker, workplace=self.workplace)
+        self.user = User.objects.create_user('ann', password='secret')
+
+    def get(self, resource, **params):
+        return self.client.get(reverse(f'work:api_{resource}'), params)
+
+    def test_cursor_pages(self):
+        self.client.force_login(self.user)
+        ids = list(WorkTime.objects.order_by('id').values_list(
+            'id', flat=True))
+
+        page = self.get('worktimes', limit=2, fields='id').json()
+        self.assertEqual(page['results'], [{'id': pk} for pk in ids[:2]])
+        self.assertIn(f'after={ids[1]}', page['next'])
+        self.assertIn('fields=id', page['next'])
+
+        page = self.client.get(page['next']).json()
+        self.assertEqual(page, {'results': [{'id': ids[2]}], 'next': None})
+
+    def test_fields(self):
+        response = self.get('companies', fields='name')
+        self.assertEqual(
+            response.json()['results'], [{'name': 'Acme'}, {'name': 'Globex'}])
+
+        response = self.get('companies', fields='name,owner,vat')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'error': 'Unknown fields: owner, vat'})
+
+    def test_filters(self):
+        self.client.force_login(self.user)
+        company = self.workplace.work.company_id
+
+        def ids(resource, **params):
+            response = self.get(resource, fields='id', **params)
+            return [row['id'] for row in response.json()['results']]
+
+        self.assertEqual(
+            ids('workers', company=self.other.work.company_id),
+            [self.other.worker_id])
+        self.assertEqual(ids('workers', status=NEW), [self.other.worker_id])
+        self.assertEqual(ids('workplaces', company=company),
+                         [self.workplace.pk])
+        self.assertEqual(ids('workplaces', status=NEW), [self.other.pk])
+        self.assertEqual(len(ids('worktimes', company=company)), 3)
+        self.assertEqual(ids('worktimes', status=APPROVED), [])
+        dates = [
+            row['date'] for row in self.get(
+                'worktimes', fields='date', **{
+                    'from': '2024-01-02', 'to': '2024-01-02'},
+            ).json()['results']]
+        self.assertEqual(dates, ['2024-01-02'])
+
+        response = self.get('worktimes', to='2024-02-30')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Incorrect to value.'})
+        self.assertEqual(self.get('workers', status='x').status_code, 400)
+        self.assertEqual(self.get('companies', limit=0).status_code, 400)
+        self.assertEqual(self.get('companies', after='x').status_code, 400)
+
+    def test_login_required(self):
+        for resource in ('workplaces', 'worktimes'):
+            response = self.get(resource)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(
+                response.json(), {'error': 'Authentication required.'})
+        self.assertEqual(self.get('workers').status_code, 200)
+
+
+class MetricsTests(TestCase):
+    """
+    Checking request metrics are rendered for staff and scrapers only
+    """
+
+    def setUp(self):
+        middleware.registry.views.clear()
+        self.addCleanup(middleware.registry.views.clear)
+        create_workplace()
+        self.url = reverse('work:metrics')
+
+    def series(self, text, name, view='work:comp_list'):
+        prefix = f'{name}{{view="{view}"}} '
+        values = [
+            line[len(prefix):] for line in text.splitlines()
+            if line.startswith(prefix)]
+        return float(values[0]) if values else None
+
+    def scrape(self):
+        staff = User.objects.create_user('ann', is_staff=True)
+        client = Client()
+        client.force_login(staff)
+        return client.get(self.url).content.decode()
+
+    def test_rendered_series(self):
+        for _ in range(2):
+            self.client.get(reverse('work:comp_list'))
+
+        text = self.scrape()
+        self.assertEqual(
+            self.series(text, 'work_request_duration_seconds_count'), 2)
+        self.assertEqual(self.series(text, 'work_db_queries_total'), 2)
+        self.assertEqual(
+            self.series(text, 'work_db_duplicate_queries_total'), 0)
+        self.assertGreater(
+            self.series(text, 'work_template_render_seconds_total'), 0)
+        self.assertIn(
+            'work_request_duration_seconds_bucket'
+            '{view="work:comp_list",le="+Inf"} 2', text)
+
+    @override_settings(WORK_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_not_recorded(self):
+        Client().get(reverse('work:comp_list'))
+
+        self.assertIsNone(
+            self.series(self.scrape(), 'work_db_queries_total'))
+
+    @override_settings(WORK_METRICS_TOKEN='secret')
+    def test_access(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(User.objects.create_user('tom'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(
+            self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        response = Client().get(self.url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, '# TYPE work_db_queries_total counter')
+
+
+class AsyncViewTests(TransactionTestCase):
+    """
+    Checking async views served through the middlewares in async mode
+    """
+
+    def setUp(self):
+        self.workplace = create_workplace()
+        self.client = AsyncClient()
+
+    def request(self, method, path, *args, **extra):
+        async def send():
+            return await getattr(self.client, method)(path, *args, **extra)
+        return async_to_sync(send)()
+
+    def test_queries_of_executor_threads_recorded(self):
+        metrics = middleware.registry.views['work_async:comp_list']
+        queries = metrics.queries
+
+        response = self.request('get', reverse('work_async:comp_list'))
+
+        self.assertContains(response, 'Acme')
+        self.assertEqual(metrics.queries, queries + 1)
+
+    def test_write_pins_client_to_primary(self):
+        worker = self.workplace.worker
+        response = self.request(
+            'post', reverse('work_async:create_worktime', args=[worker.pk]),
+            'date=01/01/2024&time_start=09:00&time_end=17:00',
+            content_type='application/x-www-form-urlencoded')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(WorkTime.objects.filter(worker=worker).exists())
+        self.assertIn('work_primary', response.cookies)
+
+
+class RetryLockedTests(TransactionTestCase):
+    """
+    Checking writes are retried while the database is locked, outside
+    outer transactions only
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(db.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def locked(self, times, result='saved'):
+        """
+        Return a function failing times with a locked database, creating
+        a company on every call
+        """
+        errors = [OperationalError('database is locked')] * times
+        calls = mock.Mock(side_effect=errors + [result])
+
+        def func():
+            Company.objects.create(name='Acme')
+            return calls()
+        func.calls = calls
+        return func
+
+    def test_retried_until_unlocked(self):
+        func = self.locked(2)
+
+        self.assertEqual(db.retry_locked(func)(), 'saved')
+
+        self.assertEqual(func.calls.call_count, 3)
+        self.assertEqual(
+            self.sleep.call_args_list, [mock.call(0.05), mock.call(0.1)])
+        # Failed attempts are rolled back
+        self.assertEqual(Company.objects.count(), 1)
+
+    @override_settings(WORK_DB_LOCK_RETRIES=3)
+    def test_gives_up_after_retries(self):
+        func = self.locked(3)
+
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            db.retry_locked(func)()
+
+        self.assertEqual(func.calls.call_count, 3)
+        self.assertFalse(Company.objects.exists())
+
+    def test_other_errors_raised(self):
+        func = mock.Mock(side_effect=OperationalError('no such table: x'))
+
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            db.retry_locked(func)()
+
+        func.assert_called_once_with()
+        self.sleep.assert_not_called()
+
+    def test_not_retried_in_outer_transaction(self):
+        func = self.locked(1)
+
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            with transaction.atomic():
+                db.retry_locked(func)()
+
+        self.assertEqual(func.calls.call_count, 1)
+        self.sleep.assert_not_called()
+
+
+@override_settings(
+    WORK_DATABASE_REPLICAS=['replica_0'], WORK_REPLICA_MAX_LAG=10)
+class ReplicaRouterTests(SimpleTestCase):
+    """
+    Checking reads go to healthy replicas unless pinned to the primary
+    """
+
+    def setUp(self):
+        self.heartbeats = {'default': 100, 'replica_0': 95}
+        for name, replacement in (
+                ('heartbeat', self.heartbeat), ('beat', mock.Mock())):
+            patcher = mock.patch.object(routers, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        routers.health.checked = 0
+        routers.reset()
+        self.addCleanup(setattr, routers.health, 'checked', 0)
+        self.addCleanup(routers.reset)
+        self.router = routers.ReplicaRouter()
+
+    def heartbeat(self, alias):
+        if self.heartbeats.get(alias) == 'down':
+            raise DatabaseError('unable to open database file')
+        return self.heartbeats.get(alias)
+
+    def test_read_from_replica(self):
+        self.assertEqual(self.router.db_for_read(Company), 'replica_0')
+        # Reads never write heartbeats
+        routers.beat.assert_not_called()
+
+    def test_pinned_after_write(self):
+        self.assertEqual(self.router.db_for_write(Company), 'default')
+
+        self.assertTrue(routers.wrote())
+        self.assertEqual(self.router.db_for_read(Company), 'default')
+
+        routers.reset()
+        self.assertEqual(self.router.db_for_read(Company), 'replica_0')
+
+    def test_lagging_replica_skipped(self):
+        self.heartbeats['replica_0'] = 80
+
+        self.assertEqual(self.router.db_for_read(Company), 'default')
+
+    def test_replica_without_heartbeat_skipped(self):
+        del self.heartbeats['replica_0']
+
+        self.assertEqual(self.router.db_for_read(Company), 'default')
+
+    def test_unavailable_database_skipped(self):
+        self.heartbeats['replica_0'] = 'down'
+        self.assertEqual(self.router.db_for_read(Company), 'default')
+
+        routers.health.checked = 0
+        self.heartbeats.update({'default': 'down', 'replica_0': 95})
+        self.assertEqual(self.router.db_for_read(Company), 'default')
+
+    def test_heartbeat_command(self):
+        call_command('replica_heartbeat', stdout=io.StringIO())
+
+        routers.beat.assert_called_once_with()
+
+
+class SettingsTests(SimpleTestCase):
+    """
+    Checking the production SQLite profile applies to every database
+    """
+
+    def test_production_profile_on_replicas_and_shards(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shard_map = os.path.join(location, 'shards.json')
+        with open(shard_map, 'w') as f:
+            json.dump({'shards': {'s1': {
+                'path': os.path.join(location, 's1.sqlite3'),
+                'id_start': 1000000}}, 'companies': {}}, f)
+
+        with mock.patch.dict(os.environ, {
+                'WORK_SQLITE_PROFILE': 'production',
+                'WORK_DATABASE_REPLICAS': os.path.join(
+                    location, 'replica.sqlite3'),
+                'WORK_SHARD_MAP': shard_map}):
+            databases = runpy.run_path(
+                os.path.join(settings.BASE_DIR, 'work_management',
+                             'settings.py'))['DATABASES']
+
+        self.assertEqual(sorted(databases), ['default', 'replica_0', 's1'])
+        for database in databases.values():
+            self.assertEqual(database['CONN_MAX_AGE'], 600)
+            self.assertEqual(database['OPTIONS'], {'timeout': 20})
+
+
+class ShardTests(TransactionTestCase):
+    """
+    Checking transitions, imports, punches and exports across two shards
+    """
+
+    def setUp(self):
+        cache.clear()
+        use_shards(self)
+        self.worker = Worker.objects.create(first_name='Bob', last_name='Ray')
+        self.workplaces = {}
+        for alias, status in (('s1', APPROVED), ('s2', NEW)):
+            with sharding.use_shard(alias):
+                wp = create_workplace(
+                    status=status, worker=self.worker,
+                    company=Company.objects.create(name=f'Acme {alias}'))
+            sharding.save_company_shard(wp.work.company_id, alias)
+            self.workplaces[alias] = wp
+        self.workplaces['default'] = create_workplace(
+            status=NEW, worker=self.worker)
+
+    def status(self, alias):
+        return WorkPlace.objects.using(alias).get(
+            pk=self.workplaces[alias].pk).status
+
+    def test_shards_keep_ids_apart(self):
+        ids = {alias: wp.pk for alias, wp in self.workplaces.items()}
+
+        self.assertEqual(len(set(ids.values())), 3)
+        self.assertGreaterEqual(ids['s1'], 1000000)
+        self.assertGreaterEqual(ids['s2'], 2000000)
+
+    def test_approve_closes_workplaces_in_every_shard(self):
+        user = User.objects.create_user('ann', password='secret')
+        user.user_permissions.add(Permission.objects.get(codename='can_hire'))
+        self.client.force_login(user)
+        pk = self.workplaces['s2'].pk
+
+        response = self.client.post(
+            reverse('work:approve_wps'), {'workplace': [pk]})
+
+        self.assertEqual(response.json(), {'approved': [pk]})
+        self.assertEqual(self.status('s1'), FINISHED)
+        self.assertEqual(self.status('s2'), APPROVED)
+        self.assertEqual(self.status('default'), CANCELLED)
+
+    def test_cancel_in_shard(self):
+        pk = self.workplaces['s1'].pk
+
+        self.client.post(
+            reverse('work:update_wp', args=[pk]), {'cancel_btn': '1'})
+
+        self.assertEqual(self.status('s1'), CANCELLED)
+        self.assertEqual(self.status('s2'), NEW)
+
+    def test_import_in_worker_shard(self):
+        idle = Worker.objects.create(first_name='Tom', last_name='Fox')
+
+        report = imports.import_worktimes(imports.read_rows(io.StringIO(
+            'worker,date,time_start,time_end\n'
+            f'{self.worker.pk},2024-01-01,09:00,17:00\n'
+            f'{idle.pk},2024-01-01,09:00,17:00\n'), 'csv'))
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual(
+            report.errors, [(2, 'Worker has no approved workplace.')])
+        self.assertEqual(WorkTime.objects.using('s1').count(), 1)
+        self.assertFalse(WorkTime.objects.exists())
+        with sharding.use_shard('s1'):
+            self.assertEqual(
+                statistics.workplace_total(self.workplaces['s1'].pk), 8)
+        self.assertFalse(Statistics.objects.exists())
+
+    def test_punch_applied_in_worker_shard(self):
+        response = self.client.post(reverse('work:punch'), {
+            'worker': self.worker.pk, 'date': '2024-01-01',
+            'time_start': '09:00', 'time_end': '17:00'})
+
+        self.assertEqual(punches.apply_pending(), 1)
+        self.assertEqual(
+            self.client.get(response.json()['url']).json()['status'],
+            'Applied')
+        self.assertEqual(WorkTime.objects.using('s1').count(), 1)
+
+    def test_async_company_list_includes_shards(self):
+        client = AsyncClient()
+
+        async def get():
+            return await client.get(reverse('work_async:comp_list'))
+
+        names = ['Acme s1', 'Acme s2', 'Acme</a>']
+        response = async_to_sync(get)()
+        for name in names:
+            self.assertContains(response, name)
+
+        # The sync page lists them too
+        response = self.client.get(reverse('work:comp_list'))
+        for name in names:
+            self.assertContains(response, name)
+
+    def test_export_merges_shards(self):
+        transitions.approve_workplaces([self.workplaces['s2'].pk])
+        for alias, day in (('s1', 2), ('s2', 3), ('s1', 1)):
+            wp = self.workplaces[alias]
+            WorkTime.objects.using(alias).create(
+                date=datetime.date(2024, 1, day),
+                time_start=datetime.time(9), time_end=datetime.time(17),
+                worker=self.worker, workplace=wp)
+
+        rows = list(exports.export_rows())
+        self.assertEqual(
+            [(row[1], row[9]) for row in rows], [
+                ('2024-01-01', self.workplaces['s1'].pk),
+                ('2024-01-02', self.workplaces['s1'].pk),
+                ('2024-01-03', self.workplaces['s2'].pk)])
+
+        company = self.workplaces['s2'].work.company_id
+        rows = list(exports.export_rows(company=company))
+        self.assertEqual([row[1] for row in rows], ['2024-01-03'])
+
+    def test_api_merges_shards(self):
+        url = reverse('work:api_companies')
+
+        page = self.client.get(url, {'limit': 2}).json()
+        rest = self.client.get(page['next']).json()
+
+        names = [row['name'] for row in page['results'] + rest['results']]
+        self.assertEqual(names, ['Acme', 'Acme s1', 'Acme s2'])
+        self.assertIsNone(rest['next'])
+        # Workers copied to every shard are listed once
+        workers = self.client.get(reverse('work:api_workers')).json()
+        self.assertEqual(len(workers['results']), 1)
+
+    def test_archive_report_and_rebuild_across_shards(self):
+        transitions.approve_workplaces([self.workplaces['s2'].pk])
+        for alias, day in (('s1', 1), ('s2', 2), ('s2', 20)):
+            with sharding.use_shard(alias):
+                WorkTime.objects.create(
+                    date=datetime.date(2024, 1, day),
+                    time_start=datetime.time(9), time_end=datetime.time(17),
+                    worker=self.worker, workplace=self.workplaces[alias])
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+
+        with override_settings(WORK_ARCHIVE_DIR=location):
+            archived = archive.archive_before(datetime.date(2024, 2, 1))
+            report = reports.Report.build()
+            rows = list(exports.export_rows())
+            Statistics.objects.using('s2').all().delete()
+            call_command('rebuild_statistics', stdout=io.StringIO())
+
+        self.assertEqual(archived, {datetime.date(2024, 1, 1): 3})
+        for alias in ('s1', 's2'):
+            self.assertFalse(WorkTime.objects.using(alias).exists())
+        companies = {
+            wp.work.company_id: alias
+            for alias, wp in self.workplaces.items()}
+        self.assertEqual(
+            {companies[pk]: hours for pk, hours, _ in report.totals(
+                'company')}, {'s1': 8, 's2': 16})
+        self.assertEqual(
+            [row[9] for row in rows], [
+                self.workplaces['s1'].pk, self.workplaces['s2'].pk,
+                self.workplaces['s2'].pk])
+        for alias, hours in (('s1', 8), ('s2', 16)):
+            with sharding.use_shard(alias):
+                self.assertEqual(
+                    statistics.workplace_total(self.workplaces[alias].pk),
+                    hours)
+        self.assertFalse(Statistics.objects.exists())
+
+    def test_default_only_commands_refused(self):
+        with self.assertRaisesMessage(CommandError, 'sharding enabled'):
+            call_command(
+                'payroll_report', '--from', '2024-01-01', '--to',
+                '2024-01-07', '--save', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, '--company'):
+            call_command('plan_shifts', stdout=io.StringIO())
+
+
+@skipUnless(search.available(), 'Search tables need SQLite FTS5')
+class SearchTests(TestCase):
+    """
+    Checking name search by prefix and trigrams, and index updates
+    """
+
+    def setUp(self):
+        self.wp = create_workplace(name='Zookeeper')
+        self.company = self.wp.work.company
+        self.company.name = 'Acme Zeta'
+        self.company.save()
+        self.worker = Worker.objects.create(
+            first_name='Zoe', last_name='Zimmer')
+        self.other = create_workplace(
+            company=Company.objects.create(name='Globex'), name='Zoo guide')
+
+    def names(self, query, **kwargs):
+        return [
+            (result['kind'], result['name'])
+            for result in search.search(query, **kwargs)]
+
+    def test_prefix(self):
+        self.assertEqual(self.names('zim'), [('worker', 'Zoe Zimmer')])
+        self.assertEqual(self.names('zoe zim'), [('worker', 'Zoe Zimmer')])
+        self.assertEqual(
+            set(self.names('zoo')),
+            {('work', 'Zookeeper'), ('work', 'Zoo guide')})
+
+    def test_fuzzy(self):
+        self.assertEqual(
+            self.names('zimmre', kinds=['worker']),
+            [('worker', 'Zoe Zimmer')])
+        self.assertEqual(
+            self.names('zokeeper', kinds=['work'])[0], ('work', 'Zookeeper'))
+
+    def test_kinds(self):
+        self.assertEqual(
+            self.names('ann', kinds=['manager']), [
+                ('manager', 'Ann Lee'), ('manager', 'Ann Lee')])
+        self.assertEqual(self.names('zoo', kinds=['worker', 'company']), [])
+
+    def test_company(self):
+        self.assertEqual(
+            self.names('zoo', company=self.company.pk),
+            [('work', 'Zookeeper')])
+        self.assertEqual(
+            self.names('zeta', company=self.company.pk),
+            [('company', 'Acme Zeta')])
+        self.assertEqual(self.names('zoe', company=self.company.pk), [])
+
+    def test_rename(self):
+        work = self.wp.work
+        work.name = 'Yardman'
+        work.save()
+
+        self.assertEqual(self.names('yard'), [('work', 'Yardman')])
+        self.assertEqual(self.names('zoo'), [('work', 'Zoo guide')])
+
+    def test_delete(self):
+        self.worker.delete()
+        self.other.work.delete()
+
+        self.assertEqual(self.names('zimmer', kinds=['worker']), [])
+        self.assertEqual(self.names('zoo'), [('work', 'Zookeeper')])
+
+    def test_view(self):
+        response = self.client.get(
+            reverse('work:search'), {'q': 'zoe', 'kind': 'worker'})
+        self.assertEqual(response.json(), {'results': [{
+            'kind': 'worker', 'id': self.worker.pk, 'name': 'Zoe Zimmer',
+            'company': None}]})
+
+        response = self.client.get(
+            reverse('work:search'), {'q': 'zoe', 'kind': 'shop'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AutocompleteTests(TestCase):
+    """
+    Checking autocomplete pages and company scoped choices of forms
+    """
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('boss', password='secret')
+        user.user_permissions.add(*Permission.objects.filter(
+            codename__in=['can_hire', 'can_create_work']))
+        self.client.force_login(user)
+
+        self.workplaces = [
+            create_workplace(company=Company.objects.create(name=name))
+            for name in ('Alpha', 'Beta')]
+        self.workers = [
+            Worker.objects.create(first_name='Wes', last_name=f'W{i}')
+            for i in range(30)]
+
+    def choices(self, kind, **params):
+        return self.client.get(
+            reverse('work:autocomplete', args=[kind]), params)
+
+    def test_search_pages(self):
+        first = self.choices('worker', q='wes').json()
+        second = self.choices('worker', q='wes', page=2).json()
+
+        self.assertEqual(len(first['results']), 20)
+        self.assertTrue(first['more'])
+        self.assertEqual(len(second['results']), 10)
+        self.assertFalse(second['more'])
+        self.assertFalse(
+            {choice['id'] for choice in first['results']}
+            & {choice['id'] for choice in second['results']})
+
+    def test_browse_pages(self):
+        response = self.choices('worker', page=2).json()
+
+        # Workers of the two workplaces come first
+        self.assertEqual(
+            [choice['text'] for choice in response['results']],
+            [f'Wes W{i}' for i in range(18, 30)])
+        self.assertFalse(response['more'])
+
+    def test_scoped_to_company(self):
+        alpha, beta = self.workplaces
+
+        response = self.choices(
+            'manager', q='ann', company=alpha.work.company_id).json()
+        self.assertEqual(response, {
+            'results': [{'id': alpha.manager_id, 'text': 'Ann Lee'}],
+            'more': False})
+
+        response = self.choices('work', company=beta.work.company_id).json()
+        self.assertEqual(response['results'], [
+            {'id': beta.work_id, 'text': 'Cook'}])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.choices('work').status_code, 400)
+        self.assertEqual(
+            self.choices('manager', company='x').status_code, 400)
+        self.assertEqual(self.choices('worker', page=0).status_code, 400)
+        self.assertEqual(
+            self.choices('worker', company=1).json(),
+            {'errors': {'company': ['Workers are not scoped to a company.']}})
+        self.assertEqual(self.choices('shop').status_code, 404)
+
+    def test_hire_form_renders_selected_choices_only(self):
+        response = self.client.get(reverse('work:hire'))
+
+        self.assertContains(response, 'work/autocomplete.js')
+        self.assertContains(response, 'data-scope="company"')
+        self.assertNotContains(response, 'Wes W29')
+
+    def test_hire_rejects_manager_of_other_company(self):
+        alpha, beta = self.workplaces
+        worker = self.workers[0]
+        data = {
+            'company': beta.work.company_id, 'manager': alpha.manager_id,
+            'work': alpha.work_id, 'worker': worker.pk, 'week_limit': 40}
+
+        response = self.client.post(reverse('work:hire'), data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.context['form'].errors), {'manager', 'work'})
+        self.assertFalse(WorkPlace.objects.filter(worker=worker).exists())
+
+        data['company'] = alpha.work.company_id
+        response = self.client.post(reverse('work:hire'), data)
+
+        self.assertRedirects(
+            response, reverse('work:worker_detail', args=[worker.pk]),
+            fetch_redirect_response=False)
+        self.assertTrue(WorkPlace.objects.filter(
+            worker=worker, manager=alpha.manager).exists())
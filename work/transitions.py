@@ -0,0 +1,99 @@
+"""
+Set-based WorkPlace status transitions.
+
+A worker has at most one approved workplace: approving one finishes the
+previously approved workplace and cancels the worker's other new ones.
+Workplaces of a worker can live in several shards, so transitions run
+in every shard, each in its own transaction nested in the one of the
+current database. The other workplaces are closed everywhere before any
+is approved, a failure in between leaves workers with none rather than
+two approved workplaces.
+"""
+from django.db import DEFAULT_DB_ALIAS
+
+from . import caching, db, sharding
+from .models import Worker, WorkPlace, NEW, APPROVED, CANCELLED, FINISHED
+
+
+def new_workplaces(pks):
+    """
+    Map ids of new workplaces among pks to (worker id, shard)
+    """
+    found = {}
+    for alias in sharding.shards():
+        found.update(
+            (pk, (worker_id, alias))
+            for pk, worker_id in WorkPlace.objects.using(alias).filter(
+                pk__in=pks, status=NEW).values_list('id', 'worker_id'))
+    return found
+
+
+@db.retry_locked
+def close_others(workers, approved):
+    """
+    Finish approved and cancel new workplaces of workers in the current
+    shard, except the ones being approved
+    """
+    alias = sharding.current() or DEFAULT_DB_ALIAS
+
+    # Serialize concurrent transitions of the same workers
+    list(Worker.objects.using(alias).select_for_update().filter(
+        pk__in=workers).values_list('id', flat=True))
+
+    WorkPlace.objects.filter(
+        worker_id__in=workers, status=APPROVED).exclude(
+            pk__in=approved).update(status=FINISHED)
+    WorkPlace.objects.filter(
+        worker_id__in=workers, status=NEW).exclude(
+            pk__in=approved).update(status=CANCELLED)
+    caching.invalidate_workers(workers)
+
+
+@db.retry_locked
+def mark_approved(pks):
+    WorkPlace.objects.filter(pk__in=pks, status=NEW).update(status=APPROVED)
+    caching.invalidate_companies(WorkPlace.objects.filter(
+        pk__in=pks).values_list('work__company_id', flat=True))
+
+
+@db.retry_locked
+def approve_workplaces(pks):
+    """
+    Approve new workplaces with given ids, at most one per worker (the
+    first given wins), and return the ids of the approved workplaces
+    """
+    found = new_workplaces(pks)
+
+    chosen = {}
+    for pk in pks:
+        worker_id = found.get(pk, (None, None))[0]
+        if worker_id is not None and worker_id not in chosen:
+            chosen[worker_id] = pk
+    if not chosen:
+        return []
+
+    workers = list(chosen)
+    approved = list(chosen.values())
+
+    sharding.fan_out(close_others, workers, approved)
+    for alias in sharding.shards():
+        pks = [pk for pk in approved if found[pk][1] == alias]
+        if pks:
+            with sharding.use_shard(alias):
+                mark_approved(pks)
+
+    caching.touch(WorkPlace)
+    return approved
+
+
+@db.retry_locked
+def cancel_in_shard(pk):
+    WorkPlace.objects.filter(pk=pk).update(status=CANCELLED)
+    caching.invalidate_companies(WorkPlace.objects.filter(
+        pk=pk).values_list('work__company_id', flat=True))
+
+
+@db.retry_locked
+def cancel_workplace(pk):
+    sharding.fan_out(cancel_in_shard, pk)
+    caching.touch(WorkPlace)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'work'
 
@@ -44,9 +44,78 @@ urlpatterns = [
         views.Hire.as_view(),
         name='hire'
     ),
+    path(
+        'import_worktimes/',
+        views.ImportWorkTimes.as_view(),
+        name='import_worktimes'
+    ),
+    path(
+        'export_worktimes.<str:fmt>',
+        views.export_worktimes,
+        name='export_worktimes'
+    ),
+    path(
+        'workplace/approve/',
+        views.approve_wps,
+        name='approve_wps'
+    ),
     path(
         'workplace/<int:pk>/',
         views.update_wp,
         name='update_wp'
     ),
+    path(
+        'workplace/<int:pk>/worktimes/',
+        views.worktime_history,
+        name='worktime_history'
+    ),
+    path(
+        'metrics',
+        views.metrics,
+        name='metrics'
+    ),
+    path(
+        'punch/',
+        views.punch,
+        name='punch'
+    ),
+    path(
+        'punch/<int:pk>/',
+        views.punch_status,
+        name='punch_status'
+    ),
+    path(
+        'api/companies/',
+        api.api_view,
+        {'resource': 'companies'},
+        name='api_companies'
+    ),
+    path(
+        'api/workers/',
+        api.api_view,
+        {'resource': 'workers'},
+        name='api_workers'
+    ),
+    path(
+        'api/workplaces/',
+        api.api_view,
+        {'resource': 'workplaces'},
+        name='api_workplaces'
+    ),
+    path(
+        'api/worktimes/',
+        api.api_view,
+        {'resource': 'worktimes'},
+        name='api_worktimes'
+    ),
+    path(
+        'search/',
+        views.typeahead,
+        name='search'
+    ),
+    path(
+        'autocomplete/<str:kind>/',
+        views.autocomplete,
+        name='autocomplete'
+    ),
 ]
@@ -1,20 +1,34 @@
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render, redirect
 from django.urls import reverse
+from django.utils.http import urlencode
 from .models import (
-    Company, Work, Worker, WorkTime, WorkPlace,
-    NEW, APPROVED, CANCELLED, FINISHED)
+    Company, Worker, WorkTime, WorkPlace, PunchEvent, APPROVED)
+from . import (
+    exports, imports, punches, queries, search, sharding, transitions,
+    worktimes)
+from .caching import CachedFragmentMixin
+from .middleware import registry
 from .forms import (
-        CreateWorkTimeForm, ChangeStatusForm,
-        CreateWorkPlace)
+        CreateWorkTimeForm, CreateWorkForm, CreateWorkPlace,
+        ImportWorkTimesForm)
 from django.views.generic import (
     View, ListView, DetailView, CreateView, FormView)
 from django.views.generic.detail import SingleObjectMixin
 from django.contrib.auth.mixins import (
     PermissionRequiredMixin, LoginRequiredMixin)
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import (
+    login_required, permission_required)
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_GET, require_POST
 from django.db.models import Q
+import codecs
+from functools import partial
+import hmac
 import logging
 import datetime
 
@@ -22,7 +36,38 @@ logger = logging.getLogger('my_log')
 logger.setLevel(logging.INFO)
 
 
-class CompList(ListView):
+HISTORY_SIZE = 20
+
+
+def history_window(request):
+    """
+    Reading the optional worktime history window from query parameters
+    """
+    window = {}
+    for param in ('from', 'to'):
+        try:
+            window[param] = datetime.date.fromisoformat(
+                request.GET.get(param, ''))
+        except ValueError:
+            pass
+    return window
+
+
+def worker_context(worker, request):
+    """
+    Building worker's workplaces with the newest slice of their history
+    """
+    window = history_window(request)
+    workplaces = queries.worker_workplaces(
+        worker, window.get('from'), window.get('to'), HISTORY_SIZE)
+    return {
+        'workplaces': workplaces,
+        'working_now': any(wp.status == APPROVED for wp in workplaces),
+        'window_query': urlencode(window),
+    }
+
+
+class CompList(CachedFragmentMixin, ListView):
     """
     Implementing a view to display companies list
     """
@@ -30,8 +75,11 @@ class CompList(ListView):
     template_name = 'work/comp_list.html'
     context_object_name = 'companies'
 
+    def get_queryset(self):
+        return queries.companies()
+
 
-class CompDetail(DetailView):
+class CompDetail(CachedFragmentMixin, DetailView):
     """
     Implementing a view to display company detail page
     """
@@ -41,13 +89,12 @@ class CompDetail(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context['works'] = self.get_object().works.all()
-        context['no_approved_wp'] = self.get_object().works.exclude(
-                                        workplaces__status=APPROVED)
+        # Built only when the cached roster fragment is missing
+        context['works'] = partial(queries.company_roster, self.object)
         return context
 
 
-class ManagList(DetailView):
+class ManagList(CachedFragmentMixin, DetailView):
     """
     Implementing a view to display manager's list
     """
@@ -57,7 +104,7 @@ class ManagList(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context['managers'] = self.get_object().managers.all()
+        context['managers'] = self.object.managers.all()
         return context
 
 
@@ -68,12 +115,19 @@ class WorkerList(ListView):
     model = Worker
     template_name = 'work/worker_list.html'
     context_object_name = 'workers'
+    page_size = 50
+
+    def get_queryset(self):
+        after = self.request.GET.get('after', '')
+        workers, self.next_cursor = queries.workers_page(
+            int(after) if after.isdigit() else None, self.page_size)
+        return workers
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context['no_approved_wp'] = Worker.objects.exclude(
-                                    workplaces__status=APPROVED)
+        context['next_cursor'] = self.next_cursor
+        context['is_first_page'] = 'after' not in self.request.GET
         return context
 
 
@@ -85,11 +139,8 @@ class WorkerDetail(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['workplaces'] = self.get_object().workplaces.all()
+        context.update(worker_context(self.object, self.request))
         context['form'] = CreateWorkTimeForm()
-        if APPROVED in self.get_object().workplaces.values_list(
-                                        'status', flat=True):
-            context['working_now'] = True
         return context
 
 
@@ -103,60 +154,46 @@ class CreateWorkTime(FormView):
 
     def post(self, request, *args, **kwargs):
         form = self.form_class(request.POST)
+        worker = get_object_or_404(Worker, pk=kwargs['pk'])
 
         if form.is_valid():
-            current_worker = Worker.objects.get(pk=kwargs['pk'])
-
-            date_str = form.data.get('date')
-            date = datetime.datetime.strptime(date_str, "%m/%d/%Y").date()
-
-            last_wt = None
-
-            if WorkTime.objects.filter(
-                workplace__worker=current_worker).exists():
-
-                last_wt = WorkTime.objects.filter(
-                    workplace__worker=current_worker).latest('id')
-
-                logger.info(f'Date of last worktime: {last_wt.date}')
-
-            if last_wt and last_wt.date >= date:
-                form.add_error('date', 'Incorrect date value.')
-            else:
-                wt = form.save(commit=False)
-                wt.worker = current_worker
-                wt.workplace = current_worker.workplaces.get(
-                                        status=APPROVED)
-                wt.save()
+            if worktimes.submit_worktime(worker, form):
                 return redirect('work:worker_detail', kwargs['pk'])
 
         logger.info('Form is invalid')  # pragma: no cover
 
         return render(request, self.template_name, {
-                'worker': Worker.objects.get(pk=kwargs['pk']),
-                'workplaces': Worker.objects.get(
-                            pk=kwargs['pk']).workplaces.all(),
-                'working_now': True,
-                'form': form
+                'worker': worker,
+                'form': form,
+                **worker_context(worker, request)
             })
 
 
+class CompanyShardMixin:
+    """
+    Saving the created object to the shard of the chosen company
+    """
+    def form_valid(self, form):
+        with sharding.use_shard(sharding.shard_for_company(
+                form.cleaned_data['company'].pk)):
+            return super().form_valid(form)
+
+
 @method_decorator(login_required, name='dispatch')
-class CreateWork(PermissionRequiredMixin, CreateView):
+class CreateWork(PermissionRequiredMixin, CompanyShardMixin, CreateView):
     """
     Implementing a view for creating work
     """
     permission_required = 'work.can_create_work'
     raise_exception = True
 
-    model = Work
-    fields = ['company', 'name']
+    form_class = CreateWorkForm
     template_name = 'work/create_work.html'
     success_url = '/companies/'
 
 
 @method_decorator(login_required, name='dispatch')
-class Hire(PermissionRequiredMixin, CreateView):
+class Hire(PermissionRequiredMixin, CompanyShardMixin, CreateView):
     """
     Implementing a view for hiring workers
     """
@@ -171,6 +208,30 @@ class Hire(PermissionRequiredMixin, CreateView):
             'work:worker_detail', kwargs={'pk': self.object.worker.id})
 
 
+@method_decorator(login_required, name='dispatch')
+class ImportWorkTimes(PermissionRequiredMixin, FormView):
+    """
+    Implementing a view for uploading worktime timesheets
+    """
+    permission_required = 'work.add_worktime'
+    raise_exception = True
+
+    form_class = ImportWorkTimesForm
+    template_name = 'work/import_worktimes.html'
+
+    def form_valid(self, form):
+        lines = codecs.iterdecode(self.request.FILES['file'], 'utf-8')
+        report = imports.import_worktimes(
+            imports.read_rows(lines, form.cleaned_data['format']))
+
+        logger.info(
+            f'Imported {report.created} worktimes, '
+            f'{len(report.errors)} rows rejected')
+
+        return self.render_to_response(
+            self.get_context_data(form=form, report=report))
+
+
 def update_wp(request, pk):
     """
     Implementing a view for changing WorkPlace status
@@ -178,31 +239,181 @@ def update_wp(request, pk):
     wp = get_object_or_404(WorkPlace, pk=pk)
 
     if request.method == "POST":
-        form = ChangeStatusForm(request.POST, instance=wp)
+        if 'approve_btn' in request.POST:
+            transitions.approve_workplaces([wp.pk])
+        elif 'cancel_btn' in request.POST:
+            transitions.cancel_workplace(wp.pk)
+
+    return redirect('work:worker_detail', pk=wp.worker_id)
+
+
+@login_required
+@permission_required('work.can_hire', raise_exception=True)
+@require_POST
+def approve_wps(request):
+    """
+    Implementing a view for approving many pending workplaces at once
+    """
+    pks = [int(pk) for pk in request.POST.getlist('workplace') if pk.isdigit()]
+    approved = transitions.approve_workplaces(pks)
+
+    logger.info(f'Approved {len(approved)} workplaces')
+
+    return JsonResponse({'approved': approved})
+
+
+@login_required
+def worktime_history(request, pk):
+    """
+    Implementing a view returning the next slice of workplace's worktimes
+    """
+    wp = get_object_or_404(WorkPlace, pk=pk)
+    window = history_window(request)
+
+    worktimes, next_cursor = queries.worktime_history(
+        wp.id, before=queries.parse_cursor(request.GET.get('before')),
+        date_from=window.get('from'), date_to=window.get('to'),
+        limit=HISTORY_SIZE)
+
+    return render(request, 'work/worktime_list.html', {
+            'workplace': wp,
+            'worktimes': worktimes,
+            'next_cursor': next_cursor,
+            'window_query': urlencode(window),
+        })
+
+
+@login_required
+def export_worktimes(request, fmt):
+    """
+    Implementing a view streaming worktimes as a CSV or JSONL timesheet
+    """
+    if fmt not in exports.FORMATS:
+        raise Http404('Unknown export format')
+
+    window = history_window(request)
+    filters = {}
+    for param in ('company', 'worker'):
+        value = request.GET.get(param, '')
+        if value.isdigit():
+            filters[param] = int(value)
+
+    rows = exports.export_rows(
+        date_from=window.get('from'), date_to=window.get('to'), **filters)
+
+    response = StreamingHttpResponse(
+        exports.export_lines(fmt, rows), content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = (
+        f'attachment; filename="worktimes.{fmt}"')
+    return response
+
+
+def metrics(request):
+    """
+    Implementing a view exposing request metrics for Prometheus to staff
+    and to scrapers sending WORK_METRICS_TOKEN as a bearer token
+    """
+    token = settings.WORK_METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not request.user.is_staff and not (token and hmac.compare_digest(
+            authorization.encode(), f'Bearer {token}'.encode())):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4')
+
+
+@require_POST
+def punch(request):
+    """
+    Implementing a view queueing a worktime to be applied in the background
+    """
+    form = CreateWorkTimeForm(request.POST)
+    worker = request.POST.get('worker', '')
+
+    if not worker.isdigit():
+        return JsonResponse(
+            {'errors': {'worker': ['Incorrect worker value.']}}, status=400)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    event = punches.enqueue(int(worker), form)
+    return JsonResponse({
+            'id': event.pk,
+            'status': event.get_status_display(),
+            'url': reverse('work:punch_status', kwargs={'pk': event.pk}),
+        }, status=202)
 
-        wp = form.save(commit=False)
 
-        if 'approve_btn' in form.data:
+@require_GET
+def punch_status(request, pk):
+    """
+    Implementing a view returning the status of a queued worktime
+    """
+    event = get_object_or_404(PunchEvent, pk=pk)
+    return JsonResponse({
+            'id': event.pk,
+            'status': event.get_status_display(),
+            'error': event.error,
+        })
+
 
-            if WorkPlace.objects.filter(
-                        worker=wp.worker, status=APPROVED).exists():
-                prev_wp = WorkPlace.objects.get(
-                        worker=wp.worker, status=APPROVED)
-                prev_wp.status = FINISHED
-                prev_wp.save()
+@require_GET
+def typeahead(request):
+    """
+    Implementing a view answering name searches of workers, companies,
+    works and managers as JSON
+    """
+    kinds = request.GET.getlist('kind') or search.KINDS
+    company = request.GET.get('company', '')
+    limit = request.GET.get('limit', '10')
 
-            wp.status = APPROVED
+    errors = {}
+    if set(kinds) - set(search.KINDS):
+        errors['kind'] = ['Incorrect kind value.']
+    if company and not company.isdigit():
+        errors['company'] = ['Incorrect company value.']
+    if not limit.isdigit() or not 1 <= int(limit) <= 50:
+        errors['limit'] = ['Incorrect limit value.']
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
 
-            if WorkPlace.objects.filter(
-                        worker=wp.worker, status=NEW).exists():
-                all_new_wp = WorkPlace.objects.filter(
-                            worker=wp.worker, status=NEW)
-                for new_wp in all_new_wp:
-                    new_wp.status = CANCELLED
-                    new_wp.save()
+    return JsonResponse({'results': search.search_shards(
+        request.GET.get('q', ''), kinds,
+        int(company) if company else None, int(limit))})
 
-        elif 'cancel_btn' in form.data:
-            wp.status = CANCELLED
 
-        wp.save()
-        return redirect('work:worker_detail', pk=wp.worker.id)
+AUTOCOMPLETE_SIZE = 20
+AUTOCOMPLETE_PAGES = 50
+
+
+@require_GET
+def autocomplete(request, kind):
+    """
+    Implementing a view returning a page of choices of an autocomplete
+    select as JSON
+    """
+    if kind not in queries.CHOICES:
+        raise Http404('Unknown autocomplete')
+
+    company = request.GET.get('company', '')
+    page = request.GET.get('page', '1')
+
+    errors = {}
+    if company and kind == 'worker':
+        errors['company'] = ['Workers are not scoped to a company.']
+    elif company and not company.isdigit():
+        errors['company'] = ['Incorrect company value.']
+    elif not company and kind in ('work', 'manager'):
+        errors['company'] = ['This field is required.']
+    if not page.isdigit() or not 1 <= int(page) <= AUTOCOMPLETE_PAGES:
+        errors['page'] = ['Incorrect page value.']
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    choices, more = queries.choices_page(
+        kind, request.GET.get('q', ''), int(company) if company else None,
+        int(page), AUTOCOMPLETE_SIZE)
+    return JsonResponse({
+            'results': [{'id': pk, 'text': text} for pk, text in choices],
+            'more': more,
+        })
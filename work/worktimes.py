@@ -0,0 +1,53 @@
+"""
+Rules for submitting a worktime, shared by the sync and async views.
+"""
+import logging
+
+from . import archive, db, intervals, statistics
+from .models import WorkPlace, WorkTime, APPROVED
+
+logger = logging.getLogger('my_log')
+
+
+@db.retry_locked
+def submit_worktime(worker, form):
+    """
+    Save the worktime of a valid form for worker and return it, or add
+    errors to the form and return None
+    """
+    wt = form.save(commit=False)
+
+    last_wt = WorkTime.objects.filter(worker=worker).order_by('-id').first()
+    if last_wt:
+        logger.info(f'Date of last worktime: {last_wt.date}')
+
+    if last_wt and last_wt.date >= wt.date:
+        form.add_error('date', 'Incorrect date value.')
+        return None
+
+    archived_until = archive.archived_until()
+    if archived_until and wt.date < archived_until:
+        form.add_error('date', 'Period is archived.')
+        return None
+
+    workplace = WorkPlace.objects.filter(
+        worker=worker, status=APPROVED).first()
+    if workplace is None:
+        form.add_error(None, 'Worker has no approved workplace.')
+        return None
+
+    wt.worker = worker
+    wt.workplace = workplace
+
+    if intervals.overlaps_existing(
+            worker.id, wt.date, wt.time_start, wt.time_end):
+        form.add_error(None, 'Worktime overlaps another worktime.')
+        return None
+
+    week_hours = statistics.week_total(wt.workplace_id, wt.date)
+    if week_hours + wt.hours > workplace.week_limit:
+        form.add_error(None, 'Week limit exceeded.')
+        return None
+
+    wt.save()
+    return wt
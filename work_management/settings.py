@@ -7,6 +7,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import json
 import os
 
 
@@ -41,6 +42,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'work.middleware.QueryMetricsMiddleware',
+    'work.middleware.ReplicaPinningMiddleware',
+    'work.middleware.ShardMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,6 +84,118 @@ DATABASES = {
     }
 }
 
+# Read replicas, comma separated SQLite paths in WORK_DATABASE_REPLICAS
+# for local copies. Tests read replicas through the primary. Their lag
+# is measured while manage.py replica_heartbeat --loop runs.
+
+WORK_DATABASE_REPLICAS = []
+
+for i, path in enumerate(filter(None, os.environ.get(
+        'WORK_DATABASE_REPLICAS', '').split(','))):
+    alias = f'replica_{i}'
+    DATABASES[alias] = dict(
+        DATABASES['default'], NAME=path, TEST={'MIRROR': 'default'})
+    WORK_DATABASE_REPLICAS.append(alias)
+
+# Company sharding, WORK_SHARD_MAP points to a JSON file
+# {"shards": {"<alias>": {"path": "<file>", "id_start": <first id>}},
+#  "companies": {"<company id>": "<alias>"}}
+# Companies missing from the map stay in the default database, workers
+# are kept there and copied to every shard.
+
+WORK_SHARD_MAP = os.environ.get('WORK_SHARD_MAP')
+WORK_SHARDS = {}
+
+if WORK_SHARD_MAP:
+    with open(WORK_SHARD_MAP) as f:
+        WORK_SHARDS = json.load(f)['shards']
+    for alias, shard in WORK_SHARDS.items():
+        DATABASES[alias] = dict(DATABASES['default'], NAME=shard['path'])
+
+DATABASE_ROUTERS = [
+    'work.routers.ShardRouter',
+    'work.routers.ReplicaRouter',
+]
+
+# Seconds between replica health checks, lag at which a replica is
+# skipped and how long a client reads from the primary after a write
+WORK_REPLICA_CHECK_INTERVAL = 5
+WORK_REPLICA_MAX_LAG = 10
+WORK_REPLICA_PIN_SECONDS = 15
+
+# PRAGMAs run on every new SQLite connection
+WORK_SQLITE_PRAGMAS = {}
+
+# Attempts of a write transaction failing with "database is locked"
+WORK_DB_LOCK_RETRIES = 5
+
+# Set WORK_SQLITE_PROFILE=production for concurrent access: WAL lets
+# readers work alongside a writer, writers wait for the lock instead of
+# failing and connections are kept between requests
+
+WORK_SQLITE_PRODUCTION = {
+    'CONN_MAX_AGE': 600,
+    'OPTIONS': {'timeout': 20},
+    'PRAGMAS': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+    },
+}
+
+# Replicas and shards are SQLite files too and get the same profile
+if os.environ.get('WORK_SQLITE_PROFILE') == 'production':
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database.update({
+                'CONN_MAX_AGE': WORK_SQLITE_PRODUCTION['CONN_MAX_AGE'],
+                'OPTIONS': dict(WORK_SQLITE_PRODUCTION['OPTIONS']),
+            })
+    WORK_SQLITE_PRAGMAS = WORK_SQLITE_PRODUCTION['PRAGMAS']
+
+
+# Cache
+# Set WORK_CACHE_BACKEND=file to share cached pages between processes,
+# page fragments are cached and the API answers conditional requests
+# only with a shared cache
+
+if os.environ.get('WORK_CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get(
+                'WORK_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds company pages stay cached, invalidated earlier on changes
+
+WORK_PAGE_CACHE_TIMEOUT = 3600
+
+
+# Authentication
+# Permission sets are cached only in a cache shared between processes
+# (WORK_CACHE_BACKEND=file), otherwise they are read from the database
+
+AUTHENTICATION_BACKENDS = ['work.permissions.CachedPermissionBackend']
+
+WORK_PERMISSION_CACHE_TIMEOUT = 300
+
+
+# Archive
+# Worktimes of closed months moved out of the database by archive_worktimes
+
+WORK_ARCHIVE_DIR = os.environ.get(
+    'WORK_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -120,6 +236,17 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 
+# Request metrics
+# Share of requests measured by work.middleware.QueryMetricsMiddleware
+
+WORK_METRICS_SAMPLE_RATE = float(
+    os.environ.get('WORK_METRICS_SAMPLE_RATE', 1))
+
+# Bearer token of scrapers allowed to read /metrics besides staff users
+
+WORK_METRICS_TOKEN = os.environ.get('WORK_METRICS_TOKEN')
+
+
 # Logging
 
 LOGGING = {
@@ -19,5 +19,6 @@ from django.urls import include, path
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('work.urls', namespace='work')),
+    path('async/', include('work.async_urls', namespace='work_async')),
     path('accounts/', include('accounts.urls', namespace='accounts')),
 ]
\ No newline at end of file